@@ -1,7 +1,9 @@
 #dogs/admin.py
 from django.contrib import admin
-from .models import Breed, Dog
-from django.utils.html import format_html  # Импортируем format_html
+from django.db import models
+from .models import Breed, Dog, DogDuplicate, fields_without_counters
+from .uploads import ImageUploadField
+from .templatetags.dog_images import picture
 
 @admin.register(Breed)
 class BreedAdmin(admin.ModelAdmin):
@@ -14,10 +16,20 @@ class BreedAdmin(admin.ModelAdmin):
         list_display: Кортеж, определяющий поля, отображаемые в списке пород.
         search_fields: Кортеж, определяющий поля, по которым можно выполнять поиск.
         prepopulated_fields: Словарь, определяющий поля, которые автоматически заполняются на основе других полей.
+        formfield_overrides: Изображение проверяется при загрузке (dogs/uploads.py).
+
+    Агрегаты отзывов при изменении породы не сохраняются (fields_without_counters).
     """
     list_display = ('name', 'description', 'image_preview', 'slug') # Added slug
     search_fields = ('name',)
     prepopulated_fields = {'slug': ('name',)} # Added prepopulated_fields
+    formfield_overrides = {models.ImageField: {'form_class': ImageUploadField}}
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.save(update_fields=fields_without_counters(obj))
+        else:
+            obj.save()
 
     def image_preview(self, obj):
         """
@@ -30,7 +42,7 @@ class BreedAdmin(admin.ModelAdmin):
             HTML-код с изображением или сообщение "(No image)", если изображение отсутствует.
         """
         if obj.image:
-            return format_html('<img src="" width="100" />', obj.image.url) # Исправлена ошибка в теге img
+            return picture(obj.image, 'admin', alt=obj.name, style='width: 100px; height: auto;')
         return '(No image)'  # Отображаем сообщение, если изображения нет
     image_preview.short_description = 'Image Preview'
 
@@ -46,8 +58,64 @@ class DogAdmin(admin.ModelAdmin):
         search_fields: Кортеж, определяющий поля, по которым можно выполнять поиск.
         list_filter: Кортеж, определяющий поля, по которым можно фильтровать список собак.
         prepopulated_fields: Словарь, определяющий поля, которые автоматически заполняются на основе других полей.
+        formfield_overrides: Изображение проверяется при загрузке (dogs/uploads.py).
+        readonly_fields: Счетчик просмотров меняется только dogs/view_counter.py
+            и при изменении собаки не сохраняется (fields_without_counters).
     """
-    list_display = ('name', 'breed', 'age', 'owner', 'slug') # Added slug
+    list_display = ('name', 'breed', 'age', 'owner', 'image_preview', 'slug') # Added slug
     search_fields = ('name',)
     list_filter = ('breed',)
     prepopulated_fields = {'slug': ('name',)} # Added prepopulated_fields
+    formfield_overrides = {models.ImageField: {'form_class': ImageUploadField}}
+    readonly_fields = ('views_count',)
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.save(update_fields=fields_without_counters(obj))
+        else:
+            obj.save()
+
+    def image_preview(self, obj):
+        """
+        Отображает уменьшенную копию фотографии собаки (вариант admin).
+        """
+        if obj.image:
+            return picture(obj.image, 'admin', alt=obj.name, style='width: 100px; height: auto;')
+        return '(No image)'
+    image_preview.short_description = 'Image Preview'
+
+
+@admin.register(DogDuplicate)
+class DogDuplicateAdmin(admin.ModelAdmin):
+    """
+    Класс администратора для пар собак с похожими фотографиями (dogs/duplicates.py).
+
+    Пары находятся автоматически при загрузке фотографии и командой find_duplicates,
+    поэтому добавлять их вручную нельзя. Удаление пары означает, что это не дубликат.
+
+    Атрибуты:
+        list_display: Обе собаки с фотографиями и расстояния между хэшами.
+        list_select_related: Обе собаки загружаются тем же запросом, что и список.
+    """
+    list_display = ('dog_preview', 'dog', 'duplicate_preview', 'duplicate', 'distance', 'dhash_distance', 'created_at')
+    list_select_related = ('dog', 'duplicate')
+    list_display_links = ('dog', 'duplicate')
+    ordering = ('distance', 'dhash_distance', '-created_at')
+    search_fields = ('dog__name', 'duplicate__name')
+    readonly_fields = ('dog', 'duplicate', 'distance', 'dhash_distance', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def preview(self, dog):
+        if dog.image:
+            return picture(dog.image, 'admin', alt=dog.name, style='width: 100px; height: auto;')
+        return '(No image)'
+
+    def dog_preview(self, obj):
+        return self.preview(obj.dog)
+    dog_preview.short_description = 'Фотография'
+
+    def duplicate_preview(self, obj):
+        return self.preview(obj.duplicate)
+    duplicate_preview.short_description = 'Похожая фотография'
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class DogsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dogs'
+
+    def ready(self):
+        """
+        Вызывается при запуске приложения.
+
+        Импортирует модуль signals для регистрации сигналов.
+        """
+        import dogs.signals  # Импортируем модуль signals
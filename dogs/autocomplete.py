@@ -0,0 +1,197 @@
+# dogs/autocomplete.py
+"""
+Автодополнение кличек собак и названий пород без обращений к БД.
+
+Каждый процесс держит в памяти отсортированный массив ключей (PrefixIndex):
+поиск по префиксу - это bisect и просмотр соседних элементов массива.
+Ключами служат нормализованное название целиком и каждое его окончание,
+начинающееся с нового слова ("золотистый ретривер" находится и по "рет").
+Клички собак хранятся без повторов, вес клички - количество собак с ней.
+
+Индекс общий для процессов через снимок и журнал изменений в кэше
+(dogs/shared_index.py, ключи autocomplete:*). Сигналы Dog и Breed
+записывают изменения в журнал (dogs/signals.py), процесс применяет их
+не позже чем через AUTOCOMPLETE_SYNC_SECONDS. Индекс загружается
+при старте воркера (см. my_project/wsgi.py).
+"""
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db.models import Count
+
+from .search import normalize
+from .shared_index import SharedIndex
+
+KIND_BREED = 'breed'
+KIND_DOG = 'dog'
+# Породы показываются раньше кличек
+KIND_ORDER = {KIND_BREED: 0, KIND_DOG: 1}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _suffixes(key):
+    """
+    Возвращает ключ и все его окончания, начинающиеся с нового слова.
+    """
+    words = key.split()
+    return {' '.join(words[i:]) for i in range(len(words))}
+
+
+class PrefixIndex:
+    """
+    Отсортированный массив ключей для поиска по префиксу.
+
+    Атрибуты:
+        entries (list): Отсортированные кортежи (ключ, вид, нормализованное название).
+        items (dict): {(вид, нормализованное название): [название, значение, вес]}.
+    """
+
+    def __init__(self, items=None, entries=None):
+        self.items = items or {}
+        if entries is None:
+            entries = sorted((suffix, kind, norm) for kind, norm in self.items for suffix in _suffixes(norm))
+        self.entries = entries
+
+    def copy(self):
+        """
+        Возвращает независимую копию индекса (без повторной сортировки ключей).
+        """
+        return PrefixIndex({key: list(item) for key, item in self.items.items()}, list(self.entries))
+
+    def add(self, kind, label, value=None, weight=1):
+        norm = ' '.join(normalize(label).split())
+        if not norm:
+            return
+        item = self.items.get((kind, norm))
+        if item is not None:
+            item[2] += weight
+            if value is not None:
+                item[1] = value
+            return
+        self.items[(kind, norm)] = [label, value, weight]
+        for suffix in _suffixes(norm):
+            insort(self.entries, (suffix, kind, norm))
+
+    def remove(self, kind, label):
+        norm = ' '.join(normalize(label).split())
+        item = self.items.get((kind, norm))
+        if item is None:
+            return
+        item[2] -= 1
+        if item[2] > 0:
+            return
+        del self.items[(kind, norm)]
+        for suffix in _suffixes(norm):
+            position = bisect_left(self.entries, (suffix, kind, norm))
+            if position < len(self.entries) and self.entries[position] == (suffix, kind, norm):
+                del self.entries[position]
+
+    def apply(self, events):
+        for event in events:
+            if event[0] == 'add':
+                self.add(*event[1:])
+            else:
+                self.remove(*event[1:])
+
+    def lookup(self, prefix, limit=10, kind=None):
+        """
+        Возвращает до limit элементов, у которых название (или слово в нем) начинается с prefix.
+
+        Просматривается не больше AUTOCOMPLETE_SCAN_LIMIT ключей, поэтому время
+        поиска не зависит от размера индекса даже для однобуквенного префикса.
+
+        Returns:
+            list: [(вид, название, значение)], породы первыми, затем по убыванию веса.
+        """
+        prefix = ' '.join(normalize(prefix).split())
+        if not prefix:
+            return []
+        scan_limit = _setting('AUTOCOMPLETE_SCAN_LIMIT', 200)
+        found = {}
+        position = bisect_left(self.entries, (prefix,))
+        end = min(len(self.entries), position + scan_limit)
+        while position < end:
+            key, entry_kind, norm = self.entries[position]
+            if not key.startswith(prefix):
+                break
+            if kind is None or entry_kind == kind:
+                found[(entry_kind, norm)] = self.items[(entry_kind, norm)]
+            position += 1
+        ranked = sorted(found.items(), key=lambda pair: (KIND_ORDER[pair[0][0]], -pair[1][2], pair[1][0]))
+        return [(entry_kind, label, value) for (entry_kind, _), (label, value, _) in ranked[:limit]]
+
+
+class AutocompleteIndex(SharedIndex):
+    """
+    PrefixIndex, общий для воркеров через снимок и журнал в кэше (dogs/shared_index.py).
+
+    Изменения журнала - списки кортежей ('add', вид, название, значение) и ('remove', вид, название).
+    Изменения применяются к копии индекса, которая заменяет его в publish(), поэтому
+    запросы других потоков читают индекс без блокировки и не видят его в процессе изменения.
+    """
+    key_prefix = 'autocomplete'
+    settings_prefix = 'AUTOCOMPLETE'
+
+    def __init__(self):
+        super().__init__()
+        self.index = PrefixIndex()
+        self.staged = None
+
+    def build(self):
+        """
+        Строит элементы индекса из БД: все породы и уникальные клички собак с их количеством.
+        """
+        from .models import Breed, Dog
+
+        index = PrefixIndex()
+        for name, slug in Breed.objects.values_list('name', 'slug'):
+            index.add(KIND_BREED, name, slug)
+        for row in Dog.objects.values('name').annotate(count=Count('pk')).order_by():
+            index.add(KIND_DOG, row['name'], weight=row['count'])
+        return index.items
+
+    def restore(self, state):
+        self.staged = None
+        self.index = PrefixIndex(state)
+
+    def dump(self):
+        # Снимок сохраняется во время применения журнала и должен включать уже примененные изменения
+        return (self.staged or self.index).items
+
+    def apply(self, events):
+        if self.staged is None:
+            self.staged = self.index.copy()
+        self.staged.apply(events)
+
+    def publish(self):
+        if self.staged is not None:
+            self.index, self.staged = self.staged, None
+
+
+shared_index = AutocompleteIndex()
+
+
+def get_index():
+    """
+    Возвращает индекс воркера, при необходимости синхронизируя его с кэшем.
+    """
+    shared_index.sync()
+    return shared_index.index
+
+
+def warm():
+    shared_index.warm()
+
+
+def suggest(prefix, limit=10, kind=None):
+    return get_index().lookup(prefix, limit, kind)
+
+
+def record_change(events):
+    """
+    Записывает изменения названий в журнал после фиксации транзакции.
+    """
+    shared_index.record(events)
@@ -0,0 +1,161 @@
+# dogs/cards.py
+"""
+Кэш HTML-карточек собак для списка (dogs_list.html).
+
+Карточка одинакова для всех зрителей, кроме кнопок владельца и администратора,
+кнопок редактирования своих отзывов, формы отзыва (CSRF-токен) и числа
+просмотров, которое меняется на каждый просмотр. Поэтому карточка делится на:
+    - общую часть из шаблона dogs/dog_card.html, которая кэшируется целиком;
+    - тонкий слой для зрителя (dogs/templatetags/dog_cards.py), который
+      подставляется в места-вставки (SLOT) общей части при каждом показе.
+
+Ключ карточки содержит версию собаки: updated_at (меняется при сохранении
+собаки, а также из сигналов Review и Pedigree, см. dogs/signals.py),
+updated_at породы, агрегаты отзывов, готовность уменьшенных копий фотографии
+и PAGE_VERSION. Устаревшие карточки не удаляются, а просто перестают читаться
+и вытесняются по DOG_CARD_CACHE_SECONDS.
+
+Все карточки страницы читаются из кэша одним get_many. Отзывы загружаются
+из БД только для карточек, которых нет в кэше, так что на "теплой" странице
+остаются запрос собак и вставка слоя зрителя.
+
+Доля попаданий считается в памяти процесса и раз в DOG_CARD_STATS_INTERVAL
+секунд добавляется к общим счетчикам в кэше (stats(), команда dog_card_stats).
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'dog_card:'
+STATS_KEY_PREFIX = 'dog_card_stats:'
+TEMPLATE_NAME = 'dogs/dog_card.html'
+# Место вставки слоя зрителя. Текст из БД экранируется, поэтому подделать его нельзя
+SLOT = '<!--dog-card-slot-->'
+
+_stats = Counter()
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def card_key(dog):
+    """
+    Возвращает ключ кэша карточки для текущей версии собаки.
+    """
+    image = dog.image.name if dog.image else ''
+    version = (
+        _setting('PAGE_VERSION', ''), dog.updated_at, dog.breed.updated_at, dog.review_count, dog.rating_avg,
+        image, dog.image_derivatives,
+    )
+    return f'{KEY_PREFIX}{dog.pk}:{hashlib.blake2b(repr(version).encode(), digest_size=12).hexdigest()}'
+
+
+def render_card(dog, snippet_length):
+    """
+    Рендерит общую часть карточки.
+
+    Returns:
+        tuple: (части HTML между местами вставки, [(id отзыва, id автора), ...]).
+    """
+    html = render_to_string(TEMPLATE_NAME, {
+        'dog': dog, 'snippet_length': snippet_length, 'slot': mark_safe(SLOT),
+    })
+    reviews = [(review.pk, review.user_id) for review in dog.latest_reviews]
+    return html.split(SLOT), reviews
+
+
+def attach_cards(dogs, reviews_prefetch, snippet_length):
+    """
+    Записывает в dog.card закэшированную или заново отрендеренную карточку каждой собаки.
+
+    Args:
+        dogs (list): Собаки страницы (с select_related('breed')).
+        reviews_prefetch (Prefetch): Загрузка последних отзывов в dog.latest_reviews;
+            выполняется только для собак, карточек которых нет в кэше.
+        snippet_length (int): Длина фрагмента описания.
+    """
+    keys = {card_key(dog): dog for dog in dogs}
+    try:
+        cached = cache.get_many(list(keys))
+    except Exception as e:
+        logger.warning(f"Кэш карточек недоступен: {e}")
+        cached = {}
+    missing = [(key, dog) for key, dog in keys.items() if key not in cached]
+    if missing:
+        prefetch_related_objects([dog for _, dog in missing], reviews_prefetch)
+        rendered = {key: render_card(dog, snippet_length) for key, dog in missing}
+        try:
+            cache.set_many(rendered, _setting('DOG_CARD_CACHE_SECONDS', 24 * 60 * 60))
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить карточки в кэш: {e}")
+        cached.update(rendered)
+    for key, dog in keys.items():
+        dog.card = cached[key]
+    record_lookups(len(keys) - len(missing), len(missing))
+
+
+def record_lookups(hits, misses):
+    """
+    Учитывает попадания и промахи кэша карточек.
+    """
+    with _lock:
+        _stats['hits'] += hits
+        _stats['misses'] += misses
+    if time.monotonic() - _last_flush >= _setting('DOG_CARD_STATS_INTERVAL', 60):
+        flush_stats()
+
+
+def flush_stats():
+    """
+    Добавляет счетчики процесса к общим счетчикам в кэше.
+    """
+    global _last_flush
+    _last_flush = time.monotonic()
+    with _lock:
+        pending = dict(_stats)
+        _stats.clear()
+    try:
+        for name, value in pending.items():
+            if value:
+                cache.add(STATS_KEY_PREFIX + name, 0, timeout=None)
+                cache.incr(STATS_KEY_PREFIX + name, value)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить статистику кэша карточек: {e}")
+        with _lock:
+            _stats.update(pending)
+
+
+def stats():
+    """
+    Возвращает общие счетчики кэша карточек вместе с еще не сохраненными счетчиками процесса.
+
+    Returns:
+        dict: {'hits': int, 'misses': int, 'ratio': доля попаданий или None}.
+    """
+    with _lock:
+        result = {'hits': _stats['hits'], 'misses': _stats['misses']}
+    shared = cache.get_many([STATS_KEY_PREFIX + name for name in result])
+    for name in result:
+        result[name] += shared.get(STATS_KEY_PREFIX + name, 0)
+    lookups = result['hits'] + result['misses']
+    result['ratio'] = result['hits'] / lookups if lookups else None
+    return result
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+    cache.delete_many([STATS_KEY_PREFIX + name for name in ('hits', 'misses')])
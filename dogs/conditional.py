@@ -0,0 +1,80 @@
+# dogs/conditional.py
+"""
+Условные GET-запросы (ETag / Last-Modified) для страниц собаки и породы.
+
+Версия страницы складывается из отметок updated_at объектов, от которых
+зависит ее содержимое (Dog, Breed, Pedigree - изменение родословной,
+как и отзывов, обновляет updated_at собаки, см. dogs/signals.py),
+пользователя (кнопки владельца и меню зависят от него) и настройки
+PAGE_VERSION, которая меняется при выкладке новых шаблонов. Версия вычисляется до рендеринга
+шаблона: если клиент прислал совпадающий If-None-Match (или не более
+свежий If-Modified-Since), представление отвечает 304 без рендеринга.
+
+Счетчики (просмотры, рейтинги) обновляются атомарными UPDATE без updated_at
+и версию страницы не меняют: при ответе 304 браузер показывает число
+просмотров из своей копии страницы, а сам просмотр все равно учитывается.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def page_etag(*parts):
+    """
+    Возвращает слабый ETag для набора значений, от которых зависит страница.
+    """
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+class ConditionalPageMixin:
+    """
+    Примесь для DetailView: отвечает 304 на условные GET-запросы до рендеринга шаблона.
+
+    Представление переопределяет get_page_version(), а в get() вызывает
+    conditional_response() после получения объекта и finalize_response()
+    для готового ответа.
+    """
+
+    def get_page_version(self):
+        """
+        Возвращает версию страницы self.object.
+
+        Returns:
+            tuple: (кортеж значений для ETag, время последнего изменения или None).
+        """
+        raise NotImplementedError
+
+    def conditional_response(self, request):
+        """
+        Возвращает ответ 304, если копия страницы у клиента актуальна, иначе None.
+        """
+        self.etag = self.last_modified = None
+        # Версия нужна и кэшу страниц (dogs/page_cache.py), поэтому считается всегда
+        self.page_version, last_modified = self.get_page_version()
+        # Непоказанные сообщения (messages) выводятся только при рендеринге страницы
+        if len(get_messages(request)):
+            return None
+        self.etag = page_etag(settings.PAGE_VERSION, request.user.pk, *self.page_version)
+        self.last_modified = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+        if response is not None:
+            self.finalize_response(response)
+        return response
+
+    def finalize_response(self, response):
+        """
+        Добавляет к ответу заголовки версии страницы.
+
+        Страница зависит от пользователя, поэтому хранится только в кэше браузера
+        и проверяется при каждом обращении (Cache-Control: private, no-cache).
+        """
+        if self.etag:
+            response['ETag'] = self.etag
+        if self.last_modified:
+            response['Last-Modified'] = http_date(self.last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,380 @@
+# dogs/duplicates.py
+"""
+Поиск собак с одинаковыми фотографиями по перцептивным хэшам.
+
+Для фотографии собаки при загрузке считаются два 64-битных хэша
+(dogs/signals.py), которые хранятся в Dog.image_dhash и Dog.image_phash:
+    - dHash: знаки разности соседних точек уменьшенного до 9x8 изображения;
+    - pHash: знаки низкочастотных коэффициентов DCT изображения 32x32
+      относительно их медианы.
+Пересжатая, уменьшенная или слегка обрезанная копия фотографии дает хэши,
+отличающиеся в нескольких битах (расстояние Хэмминга).
+
+Индекс хэшей общий для процессов через снимок и журнал в кэше
+(dogs/shared_index.py). Поиск по pHash - индекс с несколькими ключами:
+хэш делится на BANDS частей по 16 бит, и для каждой части хранится
+словарь {значение части: идентификаторы собак}. Если хэши отличаются
+не больше чем в d битах, хотя бы одна часть отличается не больше чем
+в d // BANDS битах, поэтому достаточно проверить соседние значения частей,
+а не весь индекс. Для больших расстояний хэши сравниваются все подряд
+(map и int.bit_count, около 0,2 с на миллион собак).
+
+Найденные пары сохраняются в DogDuplicate (раздел "Возможные дубликаты"
+в админке); для всех собак их пересчитывает команда find_duplicates.
+"""
+import logging
+import math
+from array import array
+from itertools import combinations, compress, repeat
+from operator import xor
+
+from django.conf import settings
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .shared_index import SharedIndex
+
+logger = logging.getLogger(__name__)
+
+BANDS = 4
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+# До какого радиуса в части перебираются соседние значения, дальше - полный перебор
+MAX_PROBE_RADIUS = 2
+
+# Косинусы DCT-II для 8 низких частот по 32 точкам
+_DCT = [[math.cos(math.pi * (2 * x + 1) * u / 64) for x in range(32)] for u in range(8)]
+
+
+def dhash(image):
+    """
+    Возвращает dHash полутонового изображения (int, 64 бита).
+    """
+    pixels = image.resize((9, 8), Image.Resampling.LANCZOS).tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = bits << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+
+def phash(image):
+    """
+    Возвращает pHash полутонового изображения (int, 64 бита).
+    """
+    pixels = image.resize((32, 32), Image.Resampling.LANCZOS).tobytes()
+    # DCT по строкам (только 8 низких частот), затем по столбцам
+    rows = [
+        [sum(c * p for c, p in zip(cosines, pixels[y * 32:(y + 1) * 32])) for cosines in _DCT]
+        for y in range(32)
+    ]
+    coefficients = [
+        sum(_DCT[v][y] * rows[y][u] for y in range(32))
+        for v in range(8) for u in range(8)
+    ]
+    # Постоянная составляющая (средняя яркость) в медиану не входит
+    median = sorted(coefficients[1:])[31]
+    bits = 0
+    for coefficient in coefficients:
+        bits = bits << 1 | (coefficient > median)
+    return bits
+
+
+def image_hashes(file):
+    """
+    Считает хэши изображения из открытого файла.
+
+    JPEG декодируется сразу уменьшенным (draft), ориентация берется из EXIF.
+
+    Returns:
+        tuple: (dhash, phash).
+    """
+    with Image.open(file) as image:
+        image.draft('L', (64, 64))
+        gray = ImageOps.exif_transpose(image).convert('L')
+    return dhash(gray), phash(gray)
+
+
+def to_db(value):
+    """
+    Переводит хэш в знаковое 64-битное число для BigIntegerField.
+    """
+    if value is None:
+        return None
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def from_db(value):
+    if value is None:
+        return None
+    return value & ((1 << 64) - 1)
+
+
+def distance(first, second):
+    return (first ^ second).bit_count()
+
+
+def update_hashes(instance, previous_image):
+    """
+    Пересчитывает хэши фотографии собаки перед сохранением, если фотография изменилась.
+
+    Ошибка запоминается в instance.image_hash_failed, чтобы не повторять ее при каждом
+    сохранении; такие фотографии заново хэширует команда find_duplicates.
+    Устанавливает instance._hashes_changed, если хэши нужно записать в индекс.
+    """
+    instance._hashes_changed = False
+    image = instance.image
+    if (image and image._committed and image.name == previous_image
+            and (instance.image_phash is not None or instance.image_hash_failed)):
+        return
+    failed = False
+    if not image:
+        hashes = (None, None)
+    else:
+        try:
+            if image._committed:
+                with image.storage.open(image.name, 'rb') as file:
+                    hashes = image_hashes(file)
+            else:
+                image.file.seek(0)
+                hashes = image_hashes(image.file)
+                image.file.seek(0)
+        except Exception as e:
+            logger.warning(f"Не удалось посчитать хэши фотографии {image.name}: {e}")
+            hashes, failed = (None, None), True
+    hashes = tuple(map(to_db, hashes))
+    if hashes != (instance.image_dhash, instance.image_phash) or failed != instance.image_hash_failed:
+        instance.image_dhash, instance.image_phash = hashes
+        instance.image_hash_failed = failed
+        instance._hashes_changed = True
+
+
+class DuplicateIndex(SharedIndex):
+    """
+    Индекс перцептивных хэшей фотографий собак (dogs/shared_index.py).
+
+    Состояние:
+        dhashes, phashes: array('Q') хэшей по идентификатору собаки;
+        present: bytearray, 1 - у собаки есть хэши.
+    Словари частей pHash (bands) строятся из состояния в restore().
+
+    Изменения журнала:
+        ('dog', dog_id, dhash, phash) - хэши собаки, None вместо хэшей удаляет ее из индекса.
+    """
+    key_prefix = 'duplicates'
+    settings_prefix = 'DUPLICATES'
+
+    def __init__(self):
+        super().__init__()
+        self.restore(self.empty_state())
+
+    @staticmethod
+    def empty_state():
+        return {'dhashes': array('Q'), 'phashes': array('Q'), 'present': bytearray()}
+
+    def build(self):
+        from .models import Dog
+
+        self.restore(self.empty_state())
+        rows = (
+            Dog.objects.filter(image_phash__isnull=False)
+            .values_list('pk', 'image_dhash', 'image_phash').order_by().iterator(chunk_size=10000)
+        )
+        for dog_id, dhash_value, phash_value in rows:
+            self.set_hashes(dog_id, from_db(dhash_value), from_db(phash_value))
+        return self.dump()
+
+    def restore(self, state):
+        self.dhashes = state['dhashes']
+        self.phashes = state['phashes']
+        self.present = state['present']
+        self.bands = [{} for _ in range(BANDS)]
+        for dog_id in compress(range(len(self.present)), self.present):
+            self._add_to_bands(dog_id, self.phashes[dog_id])
+
+    def dump(self):
+        return {'dhashes': self.dhashes, 'phashes': self.phashes, 'present': self.present}
+
+    def _add_to_bands(self, dog_id, phash_value):
+        for band, buckets in enumerate(self.bands):
+            key = phash_value >> (band * BAND_BITS) & BAND_MASK
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = array('l', (dog_id,))
+            else:
+                bucket.append(dog_id)
+
+    def _remove_from_bands(self, dog_id, phash_value):
+        for band, buckets in enumerate(self.bands):
+            key = phash_value >> (band * BAND_BITS) & BAND_MASK
+            bucket = buckets.get(key)
+            if bucket is not None and dog_id in bucket:
+                bucket.remove(dog_id)
+                if not bucket:
+                    del buckets[key]
+
+    def set_hashes(self, dog_id, dhash_value, phash_value):
+        """
+        Обновляет хэши собаки; phash_value=None удаляет собаку из индекса.
+        """
+        if dog_id >= len(self.present):
+            grow = dog_id + 1 - len(self.present)
+            self.present.extend(bytes(grow))
+            self.dhashes.extend(repeat(0, grow))
+            self.phashes.extend(repeat(0, grow))
+        if self.present[dog_id]:
+            self._remove_from_bands(dog_id, self.phashes[dog_id])
+        if phash_value is None:
+            self.present[dog_id] = 0
+            self.dhashes[dog_id] = self.phashes[dog_id] = 0
+            return
+        self.present[dog_id] = 1
+        self.dhashes[dog_id] = dhash_value or 0
+        self.phashes[dog_id] = phash_value
+        self._add_to_bands(dog_id, phash_value)
+
+    def apply(self, events):
+        for _, dog_id, dhash_value, phash_value in events:
+            self.set_hashes(dog_id, dhash_value, phash_value)
+
+    def __len__(self):
+        return self.present.count(1)
+
+    def _probe(self, phash_value, radius):
+        """
+        Возвращает собак, у которых хотя бы одна часть pHash отличается не больше чем в radius битах.
+        """
+        candidates = set()
+        for band, buckets in enumerate(self.bands):
+            key = phash_value >> (band * BAND_BITS) & BAND_MASK
+            for flipped in range(radius + 1):
+                for bits in combinations(range(BAND_BITS), flipped):
+                    probe = key
+                    for bit in bits:
+                        probe ^= 1 << bit
+                    bucket = buckets.get(probe)
+                    if bucket:
+                        candidates.update(bucket)
+        return candidates
+
+    def _scan(self, phash_value, max_distance):
+        """
+        Сравнивает pHash со всеми хэшами индекса.
+        """
+        distances = bytes(map(int.bit_count, map(xor, self.phashes, repeat(phash_value))))
+        within = distances.translate(bytes(int(d <= max_distance) for d in range(256)))
+        return {dog_id for dog_id in compress(range(len(within)), within) if self.present[dog_id]}
+
+    def near(self, phash_value, dhash_value=None, max_distance=None, dhash_distance=None, exclude=None):
+        """
+        Ищет собак с похожей фотографией.
+
+        Args:
+            phash_value (int): pHash искомой фотографии.
+            dhash_value (int): dHash; если задан, кандидаты проверяются и по нему.
+            max_distance (int): Максимальное расстояние pHash (по умолчанию DUPLICATES_MAX_DISTANCE).
+            dhash_distance (int): Максимальное расстояние dHash (по умолчанию DUPLICATES_DHASH_DISTANCE).
+            exclude: Идентификатор собаки, которую не нужно возвращать.
+
+        Returns:
+            list: [(dog_id, расстояние pHash, расстояние dHash)] по возрастанию расстояния.
+        """
+        if max_distance is None:
+            max_distance = settings.DUPLICATES_MAX_DISTANCE
+        if dhash_distance is None:
+            dhash_distance = settings.DUPLICATES_DHASH_DISTANCE
+        radius = max_distance // BANDS
+        if radius <= MAX_PROBE_RADIUS:
+            candidates = self._probe(phash_value, radius)
+        else:
+            candidates = self._scan(phash_value, max_distance)
+        candidates.discard(exclude)
+
+        results = []
+        for dog_id in candidates:
+            phash_distance = distance(self.phashes[dog_id], phash_value)
+            if phash_distance > max_distance:
+                continue
+            other_distance = distance(self.dhashes[dog_id], dhash_value) if dhash_value is not None else 0
+            if other_distance <= dhash_distance:
+                results.append((dog_id, phash_distance, other_distance))
+        results.sort(key=lambda result: (result[1] + result[2], result[0]))
+        return results
+
+    def pairs(self):
+        """
+        Перебирает все пары похожих собак (каждую пару один раз).
+
+        Yields:
+            tuple: (dog_id, duplicate_id, расстояние pHash, расстояние dHash), duplicate_id < dog_id.
+        """
+        for dog_id in compress(range(len(self.present)), self.present):
+            for other_id, phash_distance, dhash_distance in self.near(self.phashes[dog_id], self.dhashes[dog_id], exclude=dog_id):
+                if other_id < dog_id:
+                    yield dog_id, other_id, phash_distance, dhash_distance
+
+
+shared_index = DuplicateIndex()
+
+
+def record_dog(dog):
+    """
+    После фиксации транзакции записывает новые хэши собаки в журнал индекса
+    и обновляет ее пары в DogDuplicate.
+
+    Оба шага выполняются одним обработчиком, чтобы пары искались по индексу,
+    в котором уже есть запись этой собаки.
+    """
+    dhash_value, phash_value = from_db(dog.image_dhash), from_db(dog.image_phash)
+    dog_id = dog.pk
+
+    def apply():
+        shared_index.write_journal([('dog', dog_id, dhash_value, phash_value)])
+        save_pairs(dog_id, dhash_value, phash_value)
+
+    transaction.on_commit(apply)
+
+
+def record_removal(dog_id):
+    shared_index.record([('dog', dog_id, None, None)])
+
+
+def save_pairs(dog_id, dhash_value, phash_value):
+    """
+    Заменяет пары собаки в DogDuplicate найденными по индексу.
+    """
+    from django.db.models import Q
+
+    from .models import DogDuplicate
+
+    try:
+        found = []
+        if phash_value is not None:
+            shared_index.sync()
+            found = shared_index.near(phash_value, dhash_value, exclude=dog_id)
+        DogDuplicate.objects.filter(Q(dog_id=dog_id) | Q(duplicate_id=dog_id)).delete()
+        DogDuplicate.objects.bulk_create([
+            DogDuplicate(
+                dog_id=max(dog_id, other_id), duplicate_id=min(dog_id, other_id),
+                distance=phash_distance, dhash_distance=dhash_distance,
+            )
+            for other_id, phash_distance, dhash_distance in found
+        ])
+    except Exception as e:
+        logger.warning(f"Не удалось обновить возможные дубликаты собаки {dog_id}: {e}")
+
+
+def rebuild():
+    """
+    Строит индекс из БД и сохраняет новый снимок; процессы загрузят его при следующей синхронизации.
+
+    Returns:
+        DuplicateIndex: Построенный индекс.
+    """
+    from django.core.cache import cache
+
+    index = DuplicateIndex()
+    cache.add(index.key('seq'), 0, timeout=None)
+    seq = cache.incr(index.key('seq'))
+    index._store_snapshot(index.build(), seq)
+    return index
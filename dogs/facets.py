@@ -0,0 +1,536 @@
+# dogs/facets.py
+"""
+Фасетные фильтры каталога собак с заранее подсчитанными количествами.
+
+Для каждого фасета (порода, возраст, год рождения, родословная, наличие
+владельца, город владельца, рейтинг) индекс хранит:
+    - столбец кодов значений по идентификатору собаки (array);
+    - битовую карту (int) собак для каждого значения.
+
+Количество собак для значения фасета при выбранных фильтрах - это число
+единичных битов в пересечении его карты с картами выбранных значений
+остальных фасетов (значения одного фасета объединяются через ИЛИ).
+Подсчет выполняется в памяти процесса, без GROUP BY в БД.
+
+Сами собаки на странице фильтруются в БД теми же условиями (filter_queryset).
+При текстовом поиске количества считаются только среди найденных собак:
+их идентификаторы (не больше SEARCH_MAX_RESULTS) превращаются в битовую карту.
+
+Индекс общий для процессов через снимок и журнал в кэше (dogs/shared_index.py).
+Изменения собак, отзывов, родословных и городов владельцев попадают в журнал
+через сигналы (dogs/signals.py): в журнал пишутся уже вычисленные значения
+фасетов собаки, поэтому процессы применяют их без обращения к БД.
+"""
+import datetime
+import threading
+import weakref
+from array import array
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .shared_index import SharedIndex
+
+BATCH_SIZE = 10000
+
+# Ожидающие фиксации обработчики record_dogs потока: {псевдоним соединения: запись}
+_pending = threading.local()
+
+
+class Facet:
+    """
+    Фасет с несколькими значениями, которые можно выбрать одновременно.
+
+    Атрибуты:
+        name (str): Имя фасета и параметра запроса.
+        title (str): Заголовок в шаблоне.
+        choices (list): [(значение, подпись)] для фиксированного набора значений.
+        top (int): Сколько значений показывать (по убыванию количества).
+    """
+    top = None
+
+    def __init__(self, name, title, choices=None, top=None, cast=str):
+        self.name = name
+        self.title = title
+        self.choices = choices
+        self.top = top
+        self.cast = cast
+
+    def value(self, row):
+        raise NotImplementedError
+
+    def q(self, values):
+        raise NotImplementedError
+
+    def parse(self, params):
+        """
+        Возвращает множество выбранных значений из параметров запроса.
+        """
+        values = set()
+        for raw in params.getlist(self.name):
+            try:
+                value = self.cast(raw)
+            except (TypeError, ValueError):
+                continue
+            if self.choices is None or value in dict(self.choices):
+                values.add(value)
+        return values
+
+
+class FieldFacet(Facet):
+    """
+    Фасет по значению поля (порода, город владельца).
+    """
+
+    def __init__(self, name, title, field, **kwargs):
+        super().__init__(name, title, **kwargs)
+        self.field = field
+
+    def value(self, row):
+        return row[self.field] or None
+
+    def q(self, values):
+        return Q(**{f'{self.field}__in': values})
+
+
+class ChoiceFacet(Facet):
+    """
+    Фасет с фиксированным набором значений, каждому из которых соответствует условие.
+
+    Args:
+        conditions (dict): {значение: (функция row -> bool, Q)}.
+    """
+
+    def __init__(self, name, title, choices, conditions, **kwargs):
+        super().__init__(name, title, choices=choices, **kwargs)
+        self.conditions = conditions
+
+    def value(self, row):
+        for value, (test, _) in self.conditions.items():
+            if test(row):
+                return value
+        return None
+
+    def q(self, values):
+        condition = Q()
+        for value in values:
+            condition |= self.conditions[value][1]
+        return condition
+
+
+class YearRangeFacet(Facet):
+    """
+    Фасет по году рождения: выбирается диапазон year_from - year_to.
+    """
+
+    def value(self, row):
+        return row['birth_date'].year if row['birth_date'] else None
+
+    def parse(self, params):
+        """
+        Возвращает (year_from, year_to); отсутствующая граница - None.
+        """
+        bounds = []
+        for param in ('year_from', 'year_to'):
+            try:
+                bounds.append(int(params.get(param)))
+            except (TypeError, ValueError):
+                bounds.append(None)
+        return tuple(bounds)
+
+    def selected(self, bounds, years):
+        year_from, year_to = bounds
+        if year_from is None and year_to is None:
+            return set()
+        return {
+            year for year in years
+            if year is not None and (year_from is None or year >= year_from) and (year_to is None or year <= year_to)
+        }
+
+    def q(self, bounds):
+        year_from, year_to = bounds
+        condition = Q()
+        # Диапазон дат, а не __year: так условие может использовать индекс
+        if year_from is not None:
+            condition &= Q(birth_date__gte=datetime.date(year_from, 1, 1))
+        if year_to is not None:
+            condition &= Q(birth_date__lte=datetime.date(year_to, 12, 31))
+        return condition
+
+
+def _has_pedigree():
+    from .models import Pedigree
+    return Exists(Pedigree.objects.filter(dog=OuterRef('pk')))
+
+
+def _rating_band(low, high):
+    return (
+        lambda row: row['review_count'] > 0 and low <= row['rating_avg'] < high,
+        Q(review_count__gt=0, rating_avg__gte=low, rating_avg__lt=high),
+    )
+
+
+FACETS = [
+    FieldFacet('breed', 'Порода', 'breed_id', top=15, cast=int),
+    ChoiceFacet('age', 'Возраст', [
+        ('0-1', 'до 2 лет'), ('2-4', '2-4 года'), ('5-8', '5-8 лет'), ('9+', '9 лет и старше'),
+    ], {
+        '0-1': (lambda row: row['age'] <= 1, Q(age__lte=1)),
+        '2-4': (lambda row: 2 <= row['age'] <= 4, Q(age__gte=2, age__lte=4)),
+        '5-8': (lambda row: 5 <= row['age'] <= 8, Q(age__gte=5, age__lte=8)),
+        '9+': (lambda row: row['age'] >= 9, Q(age__gte=9)),
+    }),
+    YearRangeFacet('birth_year', 'Год рождения', cast=int),
+    ChoiceFacet('pedigree', 'Родословная', [('yes', 'Есть'), ('no', 'Нет')], {
+        'yes': (lambda row: row['has_pedigree'], Q(has_pedigree=True)),
+        'no': (lambda row: not row['has_pedigree'], Q(has_pedigree=False)),
+    }),
+    ChoiceFacet('availability', 'Владелец', [('available', 'Без владельца'), ('owned', 'С владельцем')], {
+        'available': (lambda row: row['owner_id'] is None, Q(owner__isnull=True)),
+        'owned': (lambda row: row['owner_id'] is not None, Q(owner__isnull=False)),
+    }),
+    FieldFacet('city', 'Город владельца', 'owner__city', top=15),
+    ChoiceFacet('rating', 'Рейтинг', [
+        ('4', 'от 4'), ('3', '3-4'), ('2', '2-3'), ('1', '1-2'), ('none', 'Без отзывов'),
+    ], {
+        'none': (lambda row: row['review_count'] == 0, Q(review_count=0)),
+        '1': _rating_band(1, 2),
+        '2': _rating_band(2, 3),
+        '3': _rating_band(3, 4),
+        '4': _rating_band(4, 6),
+    }),
+]
+FACETS_BY_NAME = {facet.name: facet for facet in FACETS}
+
+
+def _bitmap(ids):
+    """
+    Строит битовую карту из идентификаторов.
+    """
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray((max(ids) >> 3) + 1)
+    for dog_id in ids:
+        buffer[dog_id >> 3] |= 1 << (dog_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def dog_documents(ids=None):
+    """
+    Возвращает [(dog_id, {фасет: значение})] для собак (всех, если ids не передан).
+
+    Собаки читаются пачками по первичному ключу одним запросом на пачку.
+    """
+    from .models import Dog
+
+    fields = ('pk', 'breed_id', 'age', 'birth_date', 'owner_id', 'owner__city', 'review_count', 'rating_avg', 'has_pedigree')
+    queryset = Dog.objects.annotate(has_pedigree=_has_pedigree()).order_by('pk')
+    if ids is not None:
+        rows = queryset.filter(pk__in=list(ids)).values(*fields)
+        return [(row['pk'], {facet.name: facet.value(row) for facet in FACETS}) for row in rows]
+
+    documents = []
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_id).values(*fields)[:BATCH_SIZE])
+        if not rows:
+            break
+        documents.extend((row['pk'], {facet.name: facet.value(row) for facet in FACETS}) for row in rows)
+        last_id = rows[-1]['pk']
+    return documents
+
+
+class FacetIndex(SharedIndex):
+    """
+    Индекс фасетов, общий для процессов (dogs/shared_index.py).
+
+    Состояние:
+        values: {фасет: [значение по коду]}, код 0 - значение отсутствует;
+        columns: {фасет: array('H') кодов по идентификатору собаки};
+        bitmaps: {фасет: [битовая карта по коду]};
+        all: битовая карта всех собак;
+        labels: {фасет: {значение: подпись}} (названия пород).
+
+    Изменения журнала:
+        ('dog', dog_id, {фасет: значение} или None для удаленной собаки);
+        ('label', фасет, значение, подпись).
+    """
+    key_prefix = 'facets'
+    settings_prefix = 'FACETS'
+
+    def __init__(self):
+        super().__init__()
+        self.restore(self.empty_state())
+
+    @staticmethod
+    def empty_state():
+        return {
+            'values': {facet.name: [None] for facet in FACETS},
+            'columns': {facet.name: array('H') for facet in FACETS},
+            'bitmaps': {facet.name: [0] for facet in FACETS},
+            'all': 0,
+            'labels': {'breed': {}},
+        }
+
+    def build(self):
+        from .models import Breed
+
+        self.restore(self.empty_state())
+        members = {facet.name: {} for facet in FACETS}
+        all_ids = []
+        for dog_id, document in dog_documents():
+            all_ids.append(dog_id)
+            for name, value in document.items():
+                code = self._code(name, value)
+                self._set_column(name, dog_id, code)
+                if code:
+                    members[name].setdefault(code, []).append(dog_id)
+        for name, by_code in members.items():
+            bitmaps = self.bitmaps[name]
+            for code, ids in by_code.items():
+                bitmaps[code] = _bitmap(ids)
+        self.all = _bitmap(all_ids)
+        self.labels['breed'] = dict(Breed.objects.values_list('pk', 'name'))
+        return self.dump()
+
+    def restore(self, state):
+        self.values = state['values']
+        self.codes = {name: {value: code for code, value in enumerate(values)} for name, values in state['values'].items()}
+        self.columns = state['columns']
+        self.bitmaps = state['bitmaps']
+        self.all = state['all']
+        self.labels = state['labels']
+
+    def dump(self):
+        return {
+            'values': self.values, 'columns': self.columns, 'bitmaps': self.bitmaps,
+            'all': self.all, 'labels': self.labels,
+        }
+
+    def _code(self, name, value):
+        if value is None:
+            return 0
+        code = self.codes[name].get(value)
+        if code is None:
+            code = len(self.values[name])
+            self.values[name].append(value)
+            self.codes[name][value] = code
+            self.bitmaps[name].append(0)
+        return code
+
+    def _set_column(self, name, dog_id, code):
+        column = self.columns[name]
+        if dog_id >= len(column):
+            column.extend([0] * (dog_id + 1 - len(column)))
+        column[dog_id] = code
+
+    def set_document(self, dog_id, document):
+        """
+        Обновляет значения фасетов собаки; document=None удаляет собаку из индекса.
+        """
+        bit = 1 << dog_id
+        if document is None:
+            self.all &= ~bit
+        else:
+            self.all |= bit
+        for facet in FACETS:
+            name = facet.name
+            column = self.columns[name]
+            old_code = column[dog_id] if dog_id < len(column) else 0
+            new_code = self._code(name, document[name]) if document else 0
+            if old_code == new_code:
+                continue
+            if old_code:
+                self.bitmaps[name][old_code] &= ~bit
+            if new_code:
+                self.bitmaps[name][new_code] |= bit
+            self._set_column(name, dog_id, new_code)
+
+    def apply(self, events):
+        for event in events:
+            if event[0] == 'dog':
+                self.set_document(event[1], event[2])
+            elif event[0] == 'label':
+                self.labels.setdefault(event[1], {})[event[2]] = event[3]
+
+    def counts(self, selection, restrict=None):
+        """
+        Подсчитывает количество собак для каждого значения каждого фасета.
+
+        Для значений фасета учитываются фильтры всех остальных фасетов,
+        поэтому выбор значения не обнуляет соседние значения того же фасета.
+
+        Args:
+            selection (dict): {фасет: множество выбранных значений}.
+            restrict (int): Битовая карта собак, среди которых ведется подсчет
+                (например, найденных поиском); None - все собаки.
+
+        Returns:
+            dict: {фасет: {значение: количество}} (только ненулевые), и общее количество под ключом None.
+        """
+        selected_masks = {}
+        for name, values in selection.items():
+            if not values:
+                continue
+            mask = 0
+            for value in values:
+                code = self.codes[name].get(value)
+                if code:
+                    mask |= self.bitmaps[name][code]
+            selected_masks[name] = mask
+
+        base = self.all if restrict is None else self.all & restrict
+        result = {}
+        for facet in FACETS:
+            mask = base
+            for name, selected in selected_masks.items():
+                if name != facet.name:
+                    mask &= selected
+            counts = {}
+            for code, bitmap in enumerate(self.bitmaps[facet.name]):
+                if code:
+                    count = (bitmap & mask).bit_count()
+                    if count:
+                        counts[self.values[facet.name][code]] = count
+            result[facet.name] = counts
+
+        total = base
+        for selected in selected_masks.values():
+            total &= selected
+        result[None] = total.bit_count()
+        return result
+
+
+shared_index = FacetIndex()
+
+
+def parse_selection(params):
+    """
+    Возвращает выбранные значения фасетов из параметров запроса.
+
+    Returns:
+        dict: {фасет: множество значений}; для года рождения - (year_from, year_to).
+    """
+    return {facet.name: facet.parse(params) for facet in FACETS}
+
+
+def filter_queryset(queryset, selection):
+    """
+    Фильтрует QuerySet собак выбранными значениями фасетов.
+    """
+    if selection.get('pedigree'):
+        queryset = queryset.annotate(has_pedigree=_has_pedigree())
+    for facet in FACETS:
+        values = selection.get(facet.name)
+        if isinstance(facet, YearRangeFacet):
+            if values and any(bound is not None for bound in values):
+                queryset = queryset.filter(facet.q(values))
+        elif values:
+            queryset = queryset.filter(facet.q(values))
+    return queryset
+
+
+def facet_context(selection, ids=None):
+    """
+    Возвращает данные фасетов для шаблона без обращений к БД.
+
+    Args:
+        selection (dict): Выбранные значения фасетов (parse_selection).
+        ids (iterable): Идентификаторы собак, среди которых считаются количества
+            (результаты текстового поиска); None - весь каталог.
+
+    Returns:
+        tuple: (список фасетов, общее количество собак с выбранными фасетами).
+            Фасет - словарь {name, title, options: [{value, label, count, selected}]},
+            для года рождения еще year_from и year_to.
+    """
+    shared_index.sync()
+    index = shared_index
+    year_facet = FACETS_BY_NAME['birth_year']
+    bounds = selection['birth_year']
+    counts_selection = dict(selection, birth_year=year_facet.selected(bounds, index.values['birth_year']))
+    counts = index.counts(counts_selection, None if ids is None else _bitmap(ids))
+
+    facets = []
+    for facet in FACETS:
+        facet_counts = counts[facet.name]
+        selected = counts_selection[facet.name]
+        if facet.choices is not None:
+            options = [
+                {'value': value, 'label': label, 'count': facet_counts.get(value, 0), 'selected': value in selected}
+                for value, label in facet.choices
+            ]
+        else:
+            values = sorted(facet_counts, key=lambda value: -facet_counts[value])
+            if facet is year_facet:
+                values = sorted(facet_counts)
+            elif facet.top:
+                values = values[:facet.top] + [value for value in selected if value not in values[:facet.top]]
+            labels = index.labels.get(facet.name, {})
+            options = [
+                {'value': value, 'label': labels.get(value, value), 'count': facet_counts.get(value, 0), 'selected': value in selected}
+                for value in values
+            ]
+        data = {'name': facet.name, 'title': facet.title, 'options': options}
+        if facet is year_facet:
+            data['year_from'], data['year_to'] = bounds
+        facets.append(data)
+    return facets, counts[None]
+
+
+def record_dogs(ids):
+    """
+    Записывает в журнал новые значения фасетов собак после фиксации транзакции.
+
+    Значения читаются из БД после фиксации; собаки, которых уже нет, удаляются из индекса.
+    Повторные вызовы в одной транзакции и точке сохранения (например, каскадное
+    удаление отзывов) объединяются: идентификаторы добавляются в множество
+    ожидающего обработчика on_commit. Ожидающий обработчик хранится в _pending
+    по псевдониму соединения вместе с точками сохранения, в которых он создан,
+    и сам убирает себя оттуда при выполнении. Если транзакция или точка сохранения
+    откатывается, Django отбрасывает обработчик, слабая ссылка на него пропадает,
+    и следующий вызов создает новый.
+    """
+    ids = set(ids)
+    if not ids:
+        return
+    connection = transaction.get_connection()
+    if not hasattr(_pending, 'by_alias'):
+        _pending.by_alias = {}
+    pending = _pending.by_alias
+    savepoints = tuple(connection.savepoint_ids)
+    entry = pending.get(connection.alias)
+    if (entry is not None and connection.in_atomic_block
+            and entry['savepoints'] == savepoints and entry['callback']() is not None):
+        entry['ids'].update(ids)
+        return
+
+    entry = {'ids': ids, 'savepoints': savepoints, 'callback': None}
+
+    def events():
+        if pending.get(connection.alias) is entry:
+            del pending[connection.alias]
+        documents = dict(dog_documents(ids))
+        return [('dog', dog_id, documents.get(dog_id)) for dog_id in sorted(ids)]
+
+    pending[connection.alias] = entry
+    # Обработчик хранит только Django: после отката ссылка на него становится пустой
+    entry['callback'] = weakref.ref(shared_index.record(events))
+
+
+def record_label(facet, value, label):
+    shared_index.record([('label', facet, value, label)])
+
+
+def rebuild():
+    """
+    Строит индекс из БД и сохраняет новый снимок; процессы загрузят его при следующей синхронизации.
+    """
+    from django.core.cache import cache
+
+    index = FacetIndex()
+    cache.add(index.key('seq'), 0, timeout=None)
+    seq = cache.incr(index.key('seq'))
+    index._store_snapshot(index.build(), seq)
+    return index.all.bit_count()
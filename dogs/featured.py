@@ -0,0 +1,179 @@
+# dogs/featured.py
+"""
+Выборка "случайных" собак для карточек пород без ORDER BY NEWID().
+
+Для каждой породы в кэше хранится небольшой резервуар идентификаторов собак.
+Показ случайных собак сводится к выбору из резервуара в памяти процесса,
+а затем к одному запросу по первичным ключам.
+
+Резервуар:
+    - строится одним запросом для всех недостающих пород сразу;
+    - обновляется по истечении FEATURED_DOGS_ROTATE_SECONDS (время жизни ключа)
+      и в среднем раз в FEATURED_DOGS_ROTATE_READS чтений (каждое чтение
+      сбрасывает резервуар с вероятностью 1 / FEATURED_DOGS_ROTATE_READS);
+    - пополняется при добавлении собаки по алгоритму reservoir sampling
+      и очищается от удаленных собак (см. dogs/signals.py).
+
+Параллельные изменения одного резервуара могут перезаписать друг друга.
+Для выборки примеров это допустимо: резервуар все равно периодически
+перестраивается.
+"""
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Window
+from django.db.models.functions import Random, RowNumber
+
+KEY_PREFIX = 'featured_dogs:'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _key(breed_id):
+    return f'{KEY_PREFIX}{breed_id}'
+
+
+def _reservoir_size():
+    return _setting('FEATURED_DOGS_RESERVOIR_SIZE', 12)
+
+
+def _timeout():
+    return _setting('FEATURED_DOGS_ROTATE_SECONDS', 60 * 60)
+
+
+def build_reservoirs(breed_ids):
+    """
+    Строит резервуары для переданных пород одним запросом.
+
+    Returns:
+        dict: {breed_id: {'ids': [...], 'seen': количество собак породы}}.
+    """
+    from .models import Dog
+
+    reservoirs = {breed_id: {'ids': [], 'seen': 0} for breed_id in breed_ids}
+    if not breed_ids:
+        return reservoirs
+
+    rows = (
+        Dog.objects.filter(breed_id__in=breed_ids)
+        .annotate(
+            row_number=Window(RowNumber(), partition_by=F('breed_id'), order_by=Random().asc()),
+            breed_size=Window(Count('id'), partition_by=F('breed_id')),
+        )
+        .filter(row_number__lte=_reservoir_size())
+        .values_list('breed_id', 'id', 'breed_size')
+    )
+    for breed_id, dog_id, breed_size in rows:
+        reservoirs[breed_id]['ids'].append(dog_id)
+        reservoirs[breed_id]['seen'] = breed_size
+
+    cache.set_many({_key(breed_id): reservoir for breed_id, reservoir in reservoirs.items()}, _timeout())
+    return reservoirs
+
+
+def get_reservoirs(breed_ids):
+    """
+    Возвращает резервуары пород, достраивая недостающие одним запросом.
+    """
+    keys = {_key(breed_id): breed_id for breed_id in breed_ids}
+    cached = cache.get_many(list(keys))
+    reservoirs = {keys[key]: reservoir for key, reservoir in cached.items()}
+
+    missing = [breed_id for breed_id in breed_ids if breed_id not in reservoirs]
+    reservoirs.update(build_reservoirs(missing))
+
+    # Ротация: в среднем раз в FEATURED_DOGS_ROTATE_READS чтений резервуар строится заново
+    rotate_reads = _setting('FEATURED_DOGS_ROTATE_READS', 200)
+    expired = [_key(breed_id) for breed_id in reservoirs if random.random() * rotate_reads < 1]
+    if expired:
+        cache.delete_many(expired)
+
+    return reservoirs
+
+
+def sample_dog_ids(breed_ids, count):
+    """
+    Выбирает до count случайных идентификаторов собак для каждой породы.
+
+    Returns:
+        dict: {breed_id: [dog_id, ...]}.
+    """
+    reservoirs = get_reservoirs(list(breed_ids))
+    return {
+        breed_id: random.sample(reservoir['ids'], min(count, len(reservoir['ids'])))
+        for breed_id, reservoir in reservoirs.items()
+    }
+
+
+def featured_dogs(breed_ids, count, queryset=None):
+    """
+    Возвращает до count случайных собак для каждой породы.
+
+    Собаки всех пород загружаются одним запросом по первичным ключам.
+
+    Args:
+        breed_ids (list): Идентификаторы пород.
+        count (int): Количество собак на породу.
+        queryset (QuerySet): Базовый QuerySet собак (например, с only()).
+
+    Returns:
+        dict: {breed_id: [Dog, ...]}.
+    """
+    from .models import Dog
+
+    sampled = sample_dog_ids(breed_ids, count)
+    dog_ids = [dog_id for ids in sampled.values() for dog_id in ids]
+    if queryset is None:
+        queryset = Dog.objects.all()
+    dogs = queryset.in_bulk(dog_ids) if dog_ids else {}
+
+    result = defaultdict(list)
+    for breed_id, ids in sampled.items():
+        # Удаленные собаки, еще не убранные из резервуара, просто пропускаются
+        result[breed_id] = [dogs[dog_id] for dog_id in ids if dog_id in dogs]
+    return result
+
+
+def dog_added(breed_id, dog_id):
+    """
+    Учитывает новую собаку в резервуаре породы (reservoir sampling).
+
+    Если резервуара нет в кэше, он будет построен при следующем чтении.
+    """
+    key = _key(breed_id)
+    reservoir = cache.get(key)
+    if reservoir is None or dog_id in reservoir['ids']:
+        return
+
+    reservoir['seen'] += 1
+    size = _reservoir_size()
+    if len(reservoir['ids']) < size:
+        reservoir['ids'].append(dog_id)
+    else:
+        slot = random.randrange(reservoir['seen'])
+        if slot < size:
+            reservoir['ids'][slot] = dog_id
+    cache.set(key, reservoir, _timeout())
+
+
+def dog_removed(breed_id, dog_id):
+    """
+    Убирает собаку из резервуара породы.
+    """
+    key = _key(breed_id)
+    reservoir = cache.get(key)
+    if reservoir is None:
+        return
+
+    reservoir['seen'] = max(reservoir['seen'] - 1, 0)
+    if dog_id in reservoir['ids']:
+        reservoir['ids'].remove(dog_id)
+        if not reservoir['ids'] and reservoir['seen']:
+            # Резервуар опустел, а собаки у породы остались: перестроим при чтении
+            cache.delete(key)
+            return
+    cache.set(key, reservoir, _timeout())
@@ -6,6 +6,7 @@ from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from django.forms import inlineformset_factory
 from .models import Dog, Pedigree, Review
+from .uploads import ImageUploadField
 
 class DogForm(forms.ModelForm):
     """
@@ -96,6 +97,8 @@ class DogForm(forms.ModelForm):
         model = Dog
         fields = ['name', 'breed', 'age', 'description', 'image',
                   'birth_date'] 
+        # Файл уже проверен при загрузке (dogs/uploads.py), повторно в Pillow не открывается
+        field_classes = {'image': ImageUploadField}
         widgets = {
             'birth_date': forms.DateInput(attrs={'type': 'date'}),  
         }
@@ -0,0 +1,397 @@
+# dogs/images.py
+"""
+Уменьшенные копии (производные) изображений собак и пород.
+
+Для каждого загруженного изображения создаются варианты фиксированного размера
+(VARIANTS) в форматах JPEG и WebP:
+    media/derivatives/<путь оригинала без расширения>/<вариант>.<jpg|webp>
+
+Очередь на создание производных - поле image_derivatives собаки и породы:
+при смене изображения сигналы (dogs/signals.py) сбрасывают его в False,
+а команда generate_image_derivatives --loop создает производные
+(process_pending) и ставит True (None - изображение не удалось обработать).
+Производные замененного изображения удаляются, если на файл больше никто
+не ссылается. Шаблоны выводят производные тегом {% picture %}
+(dogs/templatetags/dog_images.py) с srcset по значению поля, без обращений
+к хранилищу, а пока производных нет - показывают оригинал.
+
+Кроме того, любое изображение из MEDIA_ROOT можно получить уменьшенным
+по адресу /media/r/<ширина>x<высота>/<путь> (ResizedImageView): копия
+создается при первом запросе и хранится на диске в media/resized/.
+Размеры ограничены списком IMAGE_RESIZE_SIZES.
+"""
+import io
+import logging
+import os
+import posixpath
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils._os import safe_join
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = 'derivatives'
+
+# Вариант: (ширина, высота, обрезать до пропорций). Без обрезки изображение
+# вписывается в прямоугольник с сохранением пропорций.
+VARIANTS = {
+    'admin': (160, 120, True),
+    'card': (480, 360, True),
+    'detail': (1200, 1200, False),
+}
+FORMATS = {
+    'jpg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+
+def derivative_name(name, variant, extension):
+    """
+    Возвращает путь производной в хранилище для оригинала name.
+    """
+    base = posixpath.splitext(name)[0]
+    return posixpath.join(DERIVATIVES_DIR, base, f'{variant}.{extension}')
+
+
+def has_derivatives(name):
+    """
+    Проверяет, созданы ли производные для оригинала.
+
+    Результат не запоминается в процессе: производные может удалить другой процесс,
+    а то же имя (хранилище по хэшу) вернется при повторной загрузке фотографии.
+    Страницы проверку не выполняют, они читают поле image_derivatives.
+    """
+    return default_storage.exists(derivative_name(name, 'card', 'webp'))
+
+
+def _resize(image, width, height, crop):
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail((width, height), Image.LANCZOS)
+    return image
+
+
+def _encode(image, image_format):
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        image.save(buffer, 'JPEG', quality=getattr(settings, 'IMAGE_JPEG_QUALITY', 80), optimize=True, progressive=True)
+    else:
+        image.save(buffer, 'WEBP', quality=getattr(settings, 'IMAGE_WEBP_QUALITY', 75), method=4)
+    return buffer.getvalue()
+
+
+def generate_derivatives(name, storage=None, force=False):
+    """
+    Создает все варианты изображения name в JPEG и WebP.
+
+    Оригинал поворачивается по EXIF и переводится в RGB; метаданные
+    в производные не копируются. Существующие производные перезаписываются.
+
+    Args:
+        name (str): Путь оригинала в хранилище.
+        storage: Хранилище оригинала (по умолчанию default_storage).
+        force (bool): Создавать, даже если производные уже есть.
+
+    Returns:
+        int: Суммарный размер созданных файлов в байтах (0, если ничего не создано).
+    """
+    storage = storage or default_storage
+    if not force and has_derivatives(name):
+        return 0
+    with storage.open(name, 'rb') as original:
+        image = Image.open(original)
+        image.draft('RGB', (VARIANTS['detail'][0], VARIANTS['detail'][1]))  # JPEG декодируется сразу в уменьшенном виде
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+    written = 0
+    # card/webp записывается последним: по нему has_derivatives определяет готовность
+    for variant in sorted(VARIANTS, key=lambda key: key == 'card'):
+        width, height, crop = VARIANTS[variant]
+        resized = _resize(image, width, height, crop)
+        for extension in sorted(FORMATS, key=lambda key: key == 'webp'):
+            data = _encode(resized, FORMATS[extension][0])
+            path = derivative_name(name, variant, extension)
+            # Производные пишутся в обычное хранилище под своим именем (не по хэшу, как оригиналы)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            default_storage.save(path, ContentFile(data))
+            written += len(data)
+    return written
+
+
+def delete_derivatives(name):
+    """
+    Удаляет производные оригинала name.
+    """
+    for variant in VARIANTS:
+        for extension in FORMATS:
+            path = derivative_name(name, variant, extension)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+
+
+def process_pending(batch_size=50):
+    """
+    Создает производные изображений собак и пород из очереди (image_derivatives=False).
+
+    После обработки поле получает True (или None при ошибке), а updated_at
+    и закэшированные страницы обновляются, чтобы страницы показали производные.
+    Если изображение сменилось во время обработки, объект остается в очереди.
+
+    Returns:
+        tuple: (обработано, ошибок).
+    """
+    from django.utils import timezone
+
+    from .models import Breed, Dog
+
+    processed = failed = 0
+    for model in (Dog, Breed):
+        storage = model._meta.get_field('image').storage
+        related = 'breed_id' if model is Dog else 'pk'
+        rows = list(
+            model.objects.filter(image_derivatives=False).exclude(image='').exclude(image__isnull=True)
+            .order_by('pk').values_list('pk', 'image', related)[:batch_size]
+        )
+        for pk, name, breed_id in rows:
+            try:
+                generate_derivatives(name, storage)
+                state = True
+                processed += 1
+            except Exception as e:
+                logger.warning(f"Не удалось создать производные изображения {name}: {e}")
+                state = None
+                failed += 1
+            if model.objects.filter(pk=pk, image=name).update(image_derivatives=state, updated_at=timezone.now()):
+                _purge_pages(model, pk, breed_id)
+    return processed, failed
+
+
+def _purge_pages(model, pk, breed_id):
+    from . import page_cache
+    from .models import Dog
+
+    if model is Dog:
+        page_cache.purge(f'dog:{pk}', f'breed:{breed_id}')
+    else:
+        page_cache.purge(f'breed:{pk}', 'breeds')
+
+
+def replace_image(name, new_name, **fields):
+    """
+    Переводит собак и породы с изображения name на new_name с тем же содержимым.
+
+    Обновляет updated_at и сбрасывает закэшированные страницы этих объектов, чтобы
+    страницы и их ETag (dogs/conditional.py) не ссылались на файл name, который
+    после этого удаляется. Страницы сбрасываются после фиксации транзакции.
+
+    Returns:
+        int: Количество переведенных объектов.
+    """
+    from django.utils import timezone
+
+    from .models import Breed, Dog
+
+    replaced = 0
+    for model in (Dog, Breed):
+        related = 'breed_id' if model is Dog else 'pk'
+        rows = list(model.objects.filter(image=name).values_list('pk', related))
+        if not rows:
+            continue
+        replaced += model.objects.filter(pk__in=[pk for pk, _ in rows]).update(
+            image=new_name, updated_at=timezone.now(), **fields,
+        )
+        for pk, breed_id in rows:
+            _purge_pages(model, pk, breed_id)
+    return replaced
+
+
+def delete_unused_after_commit(name):
+    """
+    Удаляет производные замененного или удаленного изображения после фиксации транзакции,
+    если файл больше не используется (одинаковые файлы общие, dogs/storage.py).
+    """
+    from django.db import transaction
+
+    def delete():
+        from .models import Breed, Dog
+
+        try:
+            if not Dog.objects.filter(image=name).exists() and not Breed.objects.filter(image=name).exists():
+                delete_derivatives(name)
+        except Exception as e:
+            logger.warning(f"Не удалось удалить производные изображения {name}: {e}")
+
+    transaction.on_commit(delete)
+
+
+def sources(name, variant, ready=None):
+    """
+    Возвращает данные для тега <picture>.
+
+    Args:
+        ready (bool): Созданы ли производные (поле image_derivatives); None -
+            неизвестно, тогда наличие проверяется в хранилище.
+
+    Returns:
+        dict | None: {'src': URL JPEG варианта, 'srcset': {расширение: srcset}, 'width', 'height'}
+            или None, если производных еще нет.
+    """
+    storage = default_storage
+    if not (has_derivatives(name) if ready is None else ready):
+        return None
+    # В srcset кроме самого варианта - крупный вариант detail для экранов с высокой плотностью пикселей
+    candidates = [variant] if variant == 'detail' else [variant, 'detail']
+    srcset = {
+        extension: ', '.join(
+            f'{storage.url(derivative_name(name, candidate, extension))} {VARIANTS[candidate][0]}w'
+            for candidate in candidates
+        )
+        for extension in FORMATS
+    }
+    width, height, _ = VARIANTS[variant]
+    return {
+        'src': storage.url(derivative_name(name, variant, 'jpg')),
+        'srcset': srcset,
+        'width': width,
+        'height': height,
+    }
+
+
+RESIZED_DIR = 'resized'
+RESIZE_EXTENSIONS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}
+
+# Блокировки построения копий внутри процесса: {путь копии: Lock}
+_render_locks = {}
+_render_locks_guard = threading.Lock()
+
+
+def resize_allowed(width, height):
+    return f'{width}x{height}' in getattr(settings, 'IMAGE_RESIZE_SIZES', ())
+
+
+def _source_path(path):
+    """
+    Возвращает абсолютный путь оригинала в MEDIA_ROOT.
+
+    Raises:
+        FileNotFoundError: Путь выходит за MEDIA_ROOT, указывает на кэш копий,
+            имеет неподдерживаемое расширение или файла нет.
+    """
+    normalized = posixpath.normpath(path).lstrip('/')
+    if normalized.split('/')[0] in (RESIZED_DIR, DERIVATIVES_DIR):
+        raise FileNotFoundError(path)
+    if posixpath.splitext(normalized)[1].lower() not in RESIZE_EXTENSIONS:
+        raise FileNotFoundError(path)
+    try:
+        source = safe_join(settings.MEDIA_ROOT, normalized)
+    except SuspiciousFileOperation:
+        raise FileNotFoundError(path)
+    if not os.path.isfile(source):
+        raise FileNotFoundError(path)
+    return source
+
+
+def _is_fresh(target, source):
+    try:
+        return os.stat(target).st_mtime >= os.stat(source).st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def _render(source, target, width, height):
+    """
+    Вписывает изображение в width x height и атомарно записывает его в target.
+    """
+    image_format = RESIZE_EXTENSIONS[os.path.splitext(target)[1].lower()]
+    with Image.open(source) as original:
+        original.draft('RGB', (width, height))
+        image = ImageOps.exif_transpose(original)
+        if image_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        image = _resize(image, width, height, crop=False)
+    if image_format == 'PNG':
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG', optimize=True)
+        data = buffer.getvalue()
+    else:
+        data = _encode(image, image_format)
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temporary = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(data)
+    os.replace(temporary, target)  # Читатели видят либо старую копию, либо готовую новую
+
+
+def _acquire_file_lock(lock_path, target, source):
+    """
+    Захватывает межпроцессную блокировку (файл, созданный с O_EXCL).
+
+    Returns:
+        bool: True, если блокировка захвачена; False, если копию за это время
+            построил другой процесс.
+    """
+    stale_seconds = getattr(settings, 'IMAGE_RESIZE_LOCK_SECONDS', 30)
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            pass
+        if _is_fresh(target, source):
+            return False
+        try:
+            if time.time() - os.stat(lock_path).st_mtime > stale_seconds:
+                os.remove(lock_path)  # Процесс, построивший блокировку, завершился аварийно
+                continue
+        except FileNotFoundError:
+            continue
+        time.sleep(0.05)
+
+
+def get_resized(path, width, height):
+    """
+    Возвращает абсолютный путь уменьшенной копии изображения, создавая ее при необходимости.
+
+    Копия пересоздается, если оригинал изменился позже нее. Одновременные
+    запросы одной и той же отсутствующей копии строят ее один раз: внутри
+    процесса их сериализует Lock, между процессами - файл блокировки.
+
+    Raises:
+        FileNotFoundError: Оригинала нет или путь недопустим.
+        ValueError: Размер не входит в IMAGE_RESIZE_SIZES.
+    """
+    if not resize_allowed(width, height):
+        raise ValueError(f'{width}x{height}')
+    source = _source_path(path)
+    relative = os.path.relpath(source, settings.MEDIA_ROOT)
+    target = os.path.join(settings.MEDIA_ROOT, RESIZED_DIR, f'{width}x{height}', relative)
+    if _is_fresh(target, source):
+        return target
+
+    with _render_locks_guard:
+        lock = _render_locks.setdefault(target, threading.Lock())
+    with lock:
+        if _is_fresh(target, source):
+            return target
+        lock_path = f'{target}.lock'
+        if _acquire_file_lock(lock_path, target, source):
+            try:
+                if not _is_fresh(target, source):
+                    _render(source, target, width, height)
+            finally:
+                os.remove(lock_path)
+    with _render_locks_guard:
+        _render_locks.pop(target, None)
+    return target
@@ -0,0 +1,29 @@
+# dogs/management/commands/dog_card_stats.py
+from django.core.management.base import BaseCommand
+
+from dogs import cards
+
+
+class Command(BaseCommand):
+    """
+    Команда для вывода доли попаданий кэша карточек собак (dogs/cards.py).
+
+    Счетчики воркеров попадают в кэш не реже чем раз в DOG_CARD_STATS_INTERVAL секунд.
+
+    Пример:
+        python manage.py dog_card_stats
+        python manage.py dog_card_stats --reset
+    """
+    help = 'Показывает попадания и промахи кэша карточек собак'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счетчики после вывода')
+
+    def handle(self, *args, **options):
+        stats = cards.stats()
+        ratio = f'{stats["ratio"]:.1%}' if stats['ratio'] is not None else 'нет данных'
+        self.stdout.write(self.style.SUCCESS(
+            f'Попаданий: {stats["hits"]}, промахов: {stats["misses"]}, доля попаданий: {ratio}'
+        ))
+        if options['reset']:
+            cards.reset_stats()
@@ -0,0 +1,103 @@
+# dogs/management/commands/find_duplicates.py
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from dogs import duplicates
+from dogs.models import Dog, DogDuplicate
+from dogs.storage import image_storage
+
+BATCH_SIZE = 1000
+
+
+def _hash(name):
+    """
+    Считает хэши одного изображения в процессе пула.
+
+    Returns:
+        tuple: (имя, (dhash, phash) или None, текст ошибки или None).
+    """
+    try:
+        with image_storage().open(name, 'rb') as file:
+            return name, duplicates.image_hashes(file), None
+    except Exception as e:
+        return name, None, str(e)
+
+
+class Command(BaseCommand):
+    """
+    Команда для поиска собак с одинаковыми фотографиями.
+
+    1. Считает перцептивные хэши фотографий, для которых их еще нет
+       (с --rehash - для всех), в пуле процессов; одинаковые файлы
+       (хранилище по хэшу содержимого) обрабатываются один раз.
+    2. Строит индекс хэшей и сохраняет его снимок в кэш (dogs/duplicates.py).
+    3. Заново заполняет DogDuplicate всеми парами похожих собак.
+
+    Пример:
+        python manage.py find_duplicates
+        python manage.py find_duplicates --rehash --workers 8
+    """
+    help = 'Считает перцептивные хэши фотографий собак и находит возможные дубликаты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Количество процессов')
+        parser.add_argument('--rehash', action='store_true', help='Пересчитать хэши всех фотографий')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        hashed, errors = self.hash_images(options)
+        self.stdout.write(f'Посчитаны хэши {hashed} изображений, ошибок: {errors}, за {time.perf_counter() - started:.1f} с')
+
+        phase = time.perf_counter()
+        index = duplicates.rebuild()
+        self.stdout.write(f'Индекс: {len(index)} собак за {time.perf_counter() - phase:.1f} с')
+
+        phase = time.perf_counter()
+        found = 0
+        with transaction.atomic():
+            DogDuplicate.objects.all().delete()
+            batch = []
+            for dog_id, duplicate_id, phash_distance, dhash_distance in index.pairs():
+                batch.append(DogDuplicate(
+                    dog_id=dog_id, duplicate_id=duplicate_id, distance=phash_distance, dhash_distance=dhash_distance,
+                ))
+                if len(batch) >= BATCH_SIZE:
+                    found += len(DogDuplicate.objects.bulk_create(batch))
+                    batch = []
+            found += len(DogDuplicate.objects.bulk_create(batch))
+        self.stdout.write(self.style.SUCCESS(
+            f'Возможных дубликатов: {found}, поиск пар за {time.perf_counter() - phase:.1f} с'
+        ))
+
+    def hash_images(self, options):
+        """
+        Считает хэши фотографий и записывает их всем собакам с этими фотографиями.
+
+        Returns:
+            tuple: (количество изображений, количество ошибок).
+        """
+        dogs = Dog.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['rehash']:
+            dogs = dogs.filter(image_phash__isnull=True)
+        names = sorted(set(dogs.values_list('image', flat=True).iterator()))
+        # Дочерние процессы не должны наследовать открытые соединения с БД
+        connections.close_all()
+
+        hashed = errors = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for name, hashes, error in pool.map(_hash, names, chunksize=16):
+                if error:
+                    errors += 1
+                    self.stderr.write(f'{name}: {error}')
+                    Dog.objects.filter(image=name).update(image_hash_failed=True)
+                    continue
+                hashed += 1
+                dhash_value, phash_value = map(duplicates.to_db, hashes)
+                Dog.objects.filter(image=name).update(
+                    image_dhash=dhash_value, image_phash=phash_value, image_hash_failed=False,
+                )
+        return hashed, errors
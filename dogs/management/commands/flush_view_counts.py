@@ -0,0 +1,35 @@
+# dogs/management/commands/flush_view_counts.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from dogs import view_counter
+
+
+class Command(BaseCommand):
+    """
+    Команда для сброса накопленных просмотров собак в базу данных.
+
+    Просмотры записываются в БД только этой командой, поэтому в production
+    она должна работать постоянно (--loop). По умолчанию интервал берется из
+    VIEW_COUNTER_FLUSH_INTERVAL.
+
+    Пример:
+        python manage.py flush_view_counts
+        python manage.py flush_view_counts --loop --interval 30
+    """
+    help = 'Записывает накопленные в кэше просмотры собак в базу данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Сбрасывать просмотры периодически, не завершая работу')
+        parser.add_argument('--interval', type=int, default=None, help='Интервал между сбросами в секундах (для --loop), по умолчанию VIEW_COUNTER_FLUSH_INTERVAL')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or settings.VIEW_COUNTER_FLUSH_INTERVAL
+        while True:
+            flushed = view_counter.flush()
+            self.stdout.write(self.style.SUCCESS(f'Записано просмотров: {flushed}'))
+            if not options['loop']:
+                break
+            time.sleep(interval)
@@ -0,0 +1,119 @@
+# dogs/management/commands/fold_media.py
+import os
+import posixpath
+import shutil
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dogs import images
+from dogs.models import Breed, Dog
+from dogs.storage import content_name, file_digest, image_storage, is_content_addressed, recount_references
+
+
+def _link_or_copy(source, target):
+    """
+    Создает жесткую ссылку на файл, а если это невозможно (другая файловая система) - копию.
+    """
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass  # Файл с тем же содержимым уже создан
+    except OSError:
+        shutil.copy2(source, target)
+
+
+class Command(BaseCommand):
+    """
+    Команда для перевода уже загруженных изображений собак и пород в хранилище по хэшу.
+
+    Для каждого файла, на который ссылаются Dog.image или Breed.image:
+        - считает SHA-256 содержимого;
+        - создает жесткую ссылку (или копию) файла в media/cas/ab/cd/<хэш>.<расширение>,
+          если файла с таким содержимым там еще нет, и так же - уменьшенные копии
+          (dogs/images.py) под новым именем;
+        - меняет ссылки в БД одной транзакцией;
+        - после фиксации удаляет старый файл и его уменьшенные копии.
+    Пока транзакция не зафиксирована, строки ссылаются на старый файл, и он на месте;
+    если команда прервется, остается лишний файл, а не ссылка на отсутствующий.
+    В конце пересчитывает количество ссылок (MediaBlob).
+
+    Пример:
+        python manage.py fold_media --dry-run
+        python manage.py fold_media
+    """
+    help = 'Переносит изображения собак и пород в хранилище по хэшу содержимого, удаляя дубликаты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет сделано')
+
+    def image_names(self):
+        names = set()
+        for model in (Dog, Breed):
+            for name in model.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True).iterator():
+                if not is_content_addressed(name):
+                    names.add(name)
+        return sorted(names)
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        storage = image_storage()
+        started = time.perf_counter()
+        moved = duplicates = missing = freed = 0
+        planned = set()  # Имена, которые уже появились бы в хранилище при --dry-run
+
+        for name in self.image_names():
+            source = storage.path(name)
+            if not os.path.isfile(source):
+                missing += 1
+                self.stderr.write(f'Файл не найден: {name}')
+                continue
+            with open(source, 'rb') as file:
+                target_name = content_name(file_digest(file), posixpath.splitext(name)[1])
+            target = storage.path(target_name)
+            duplicate = os.path.exists(target) or target_name in planned
+            if duplicate:
+                duplicates += 1
+                freed += os.path.getsize(source)
+            else:
+                moved += 1
+            planned.add(target_name)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{"дубликат" if duplicate else "перенос"}: {name} -> {target_name}')
+            if dry_run:
+                continue
+
+            if not duplicate:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                _link_or_copy(source, target)
+            old_derivatives = self.link_derivatives(storage, name, target_name)
+            with transaction.atomic():
+                # Страницы сбрасываются при фиксации, до удаления файла, на который они ссылаются
+                images.replace_image(name, target_name)
+            os.remove(source)
+            if old_derivatives:
+                shutil.rmtree(old_derivatives, ignore_errors=True)
+
+        if not dry_run:
+            referenced = recount_references()
+            self.stdout.write(f'Файлов в хранилище со ссылками: {referenced}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{"[dry-run] " if dry_run else ""}Перенесено: {moved}, удалено дубликатов: {duplicates} '
+            f'({freed / 1024 / 1024:.1f} МБ), не найдено: {missing}, за {time.perf_counter() - started:.1f} с'
+        ))
+
+    def link_derivatives(self, storage, old_name, new_name):
+        """
+        Создает уменьшенные копии под новым именем (жесткими ссылками), если их там еще нет.
+
+        Returns:
+            str | None: Каталог копий старого имени, который удаляется после фиксации.
+        """
+        old_dir = storage.path(posixpath.dirname(images.derivative_name(old_name, 'card', 'jpg')))
+        new_dir = storage.path(posixpath.dirname(images.derivative_name(new_name, 'card', 'jpg')))
+        if not os.path.isdir(old_dir):
+            return None
+        if not os.path.isdir(new_dir):
+            shutil.copytree(old_dir, new_dir, copy_function=_link_or_copy)
+        return old_dir
@@ -0,0 +1,109 @@
+# dogs/management/commands/generate_image_derivatives.py
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from dogs import images
+from dogs.models import Breed, Dog
+from dogs.storage import image_storage
+
+
+def _process(name, force):
+    """
+    Создает производные одного изображения в процессе пула.
+
+    Returns:
+        tuple: (имя, байт записано, текст ошибки или None).
+    """
+    try:
+        return name, images.generate_derivatives(name, image_storage(), force=force), None
+    except Exception as e:
+        return name, 0, str(e)
+
+
+class Command(BaseCommand):
+    """
+    Команда для создания уменьшенных копий изображений собак и пород.
+
+    С --loop работает постоянно и обрабатывает очередь: изображения, загруженные
+    после запуска, с image_derivatives=False (dogs.images.process_pending).
+
+    Без --loop обрабатывает все уже загруженные изображения параллельно в пуле
+    процессов (Pillow держит GIL не все время, но кодирование JPEG/WebP упирается
+    в процессор) и отмечает их в image_derivatives. Изображения, для которых
+    производные уже есть, пропускаются (кроме --force).
+
+    Пример:
+        python manage.py generate_image_derivatives --loop --interval 5
+        python manage.py generate_image_derivatives --workers 8
+        python manage.py generate_image_derivatives --force
+    """
+    help = 'Создает JPEG и WebP варианты (card, detail, admin) для изображений собак и пород'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Количество процессов')
+        parser.add_argument('--force', action='store_true', help='Пересоздать существующие производные')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно, обрабатывая очередь новых изображений')
+        parser.add_argument('--batch-size', type=int, default=50, help='Количество изображений в одной пачке очереди')
+        parser.add_argument('--interval', type=int, default=5, help='Пауза между проверками пустой очереди в секундах')
+
+    def image_names(self):
+        """
+        Возвращает имена изображений собак и пород без повторов, не загружая объекты целиком.
+        """
+        names = set()
+        for model in (Dog, Breed):
+            for name in model.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True).iterator():
+                names.add(name)
+        return sorted(names)
+
+    def mark(self, names, state):
+        """
+        Записывает состояние производных в image_derivatives собак и пород с этими изображениями.
+        """
+        names = list(names)
+        for start in range(0, len(names), 1000):
+            for model in (Dog, Breed):
+                model.objects.filter(image__in=names[start:start + 1000]).update(image_derivatives=state)
+
+    def process_queue(self, options):
+        while True:
+            processed, failed = images.process_pending(options['batch_size'])
+            if processed or failed:
+                self.stdout.write(self.style.SUCCESS(f'Обработано изображений: {processed}, ошибок: {failed}'))
+            if not options['loop']:
+                break
+            if not processed and not failed:
+                time.sleep(options['interval'])
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            return self.process_queue(options)
+        names = self.image_names()
+        # Дочерние процессы не должны наследовать открытые соединения с БД
+        connections.close_all()
+
+        started = time.perf_counter()
+        processed = written = errors = 0
+        ready, broken = [], []
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for name, size, error in pool.map(_process, names, [options['force']] * len(names), chunksize=8):
+                if error:
+                    errors += 1
+                    broken.append(name)
+                    self.stderr.write(f'{name}: {error}')
+                else:
+                    ready.append(name)
+                    if size:
+                        processed += 1
+                        written += size
+        self.mark(ready, True)
+        self.mark(broken, None)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Изображений: {len(names)}, обработано: {processed}, пропущено: {len(names) - processed - errors}, '
+            f'ошибок: {errors}, записано {written / 1024:.0f} КБ за {elapsed:.1f} с'
+        ))
@@ -0,0 +1,21 @@
+# dogs/management/commands/rebuild_facets.py
+from django.core.management.base import BaseCommand
+
+from dogs import facets
+
+
+class Command(BaseCommand):
+    """
+    Команда для построения индекса фасетов из БД и сохранения его снимка в кэш.
+
+    Нужна после массовых изменений в обход сигналов (bulk_create, update, загрузка данных):
+    воркеры загрузят новый снимок при следующей синхронизации.
+
+    Пример:
+        python manage.py rebuild_facets
+    """
+    help = 'Перестраивает индекс фасетов каталога собак'
+
+    def handle(self, *args, **options):
+        count = facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Собак в индексе фасетов: {count}'))
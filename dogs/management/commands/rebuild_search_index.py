@@ -0,0 +1,29 @@
+# dogs/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+
+from dogs import search
+
+
+class Command(BaseCommand):
+    """
+    Команда для перестроения поискового индекса текущего бэкенда (SEARCH_BACKEND).
+
+    Пример:
+        python manage.py rebuild_search_index
+        python manage.py rebuild_search_index --entity dog --batch-size 2000
+    """
+    help = 'Перестраивает поисковый индекс собак, пород и пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entity', choices=list(search.ENTITIES), action='append', help='Тип объектов (по умолчанию все)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Количество объектов в одной пачке')
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        for entity in options['entity'] or list(search.ENTITIES):
+            self.stdout.write(f'Индексация {entity} ({backend.name})...')
+            count = backend.rebuild(entity, options['batch_size'], progress=self.report_progress)
+            self.stdout.write(self.style.SUCCESS(f'Проиндексировано {entity}: {count}'))
+
+    def report_progress(self, entity, indexed):
+        self.stdout.write(f'  {entity}: {indexed}')
@@ -0,0 +1,361 @@
+# dogs/management/commands/reclaim_media.py
+import hashlib
+import math
+import os
+import posixpath
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dogs import images
+from dogs.models import Breed, Dog, MediaBlob
+from dogs.storage import CAS_DIR, file_digest, is_content_addressed, recount_references
+
+IMAGE_MODELS = (Dog, Breed)
+
+
+class BloomFilter:
+    """
+    Фильтр Блума для множества строк: около 1,2 байта на элемент при 1% ложных срабатываний.
+
+    Ложное срабатывание означает, что файл без ссылок будет считаться используемым
+    и не будет удален, то есть ошибка всегда в безопасную сторону.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+def _walk(root):
+    """
+    Обходит каталог потоком, не собирая список файлов в памяти.
+
+    Yields:
+        os.DirEntry: Файлы каталога и всех подкаталогов (файлы одного каталога идут подряд).
+    """
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+class Command(BaseCommand):
+    """
+    Команда для удаления изображений, на которые не ссылаются Dog.image и Breed.image,
+    и их побайтовых дубликатов.
+
+    Ссылки читаются из БД потоком (values_list(...).iterator()) в множество
+    или, с --bloom, в фильтр Блума; файлы обходятся потоком через os.scandir.
+    Проверяются только каталоги изображений (upload_to полей и media/cas/)
+    и уменьшенные копии (media/derivatives/, media/resized/), остальное
+    содержимое MEDIA_ROOT не трогается. Файлы, измененные позже чем
+    --grace-seconds назад, пропускаются: ссылка на них могла еще не попасть в БД.
+
+    Перед удалением каждого файла ссылки на него повторно проверяются в БД
+    (ссылка могла появиться после чтения), а запись MediaBlob блокируется.
+
+    Дубликаты ищутся среди используемых файлов сначала по размеру, затем по SHA-256.
+    Ссылки на дубликат переводятся на один экземпляр (предпочтительно из media/cas/),
+    после чего дубликат удаляется. Если у оставленного экземпляра нет уменьшенных
+    копий, строки ставятся в очередь generate_image_derivatives.
+
+    Пример:
+        python manage.py reclaim_media --dry-run -v 2
+        python manage.py reclaim_media --bloom --expected 5000000
+    """
+    help = 'Удаляет изображения собак и пород без ссылок и их дубликаты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет удалено')
+        parser.add_argument('--grace-seconds', type=int, default=60 * 60, help='Не трогать файлы моложе этого возраста')
+        parser.add_argument('--bloom', action='store_true', help='Хранить ссылки в фильтре Блума вместо множества')
+        parser.add_argument('--expected', type=int, default=None, help='Ожидаемое число ссылок для фильтра Блума')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Строк за одно чтение из БД')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.verbose = options['verbosity'] > 1
+        self.cutoff = time.time() - options['grace_seconds']
+        self.stats = dict.fromkeys(
+            ('scanned', 'scanned_bytes', 'orphans', 'orphan_bytes', 'duplicates', 'duplicate_bytes',
+             'hashed_bytes', 'derivatives', 'derivative_bytes'), 0,
+        )
+
+        started = time.perf_counter()
+        referenced, bases = self.load_references(options)
+        self.report_phase('Ссылки из БД', started)
+
+        phase = time.perf_counter()
+        by_size = self.scan_originals(referenced)
+        self.report_phase('Оригиналы', phase, self.stats['scanned'], self.stats['scanned_bytes'])
+
+        phase = time.perf_counter()
+        self.reclaim_duplicates(by_size)
+        self.report_phase('Поиск дубликатов', phase, size=self.stats['hashed_bytes'])
+
+        phase = time.perf_counter()
+        self.scan_derivatives(bases)
+        self.scan_resized()
+        self.report_phase('Уменьшенные копии', phase, self.stats['derivatives'], self.stats['derivative_bytes'])
+
+        if not self.dry_run:
+            self.delete_unused_blobs()
+
+        stats = self.stats
+        self.stdout.write(self.style.SUCCESS(
+            f'{"[dry-run] " if self.dry_run else ""}'
+            f'Без ссылок: {stats["orphans"]} ({stats["orphan_bytes"] / 1024 / 1024:.1f} МБ), '
+            f'дубликатов: {stats["duplicates"]} ({stats["duplicate_bytes"] / 1024 / 1024:.1f} МБ), '
+            f'уменьшенных копий: {stats["derivatives"]} ({stats["derivative_bytes"] / 1024 / 1024:.1f} МБ), '
+            f'всего за {time.perf_counter() - started:.1f} с'
+        ))
+
+    def report_phase(self, title, started, files=None, size=None):
+        """
+        Выводит время этапа и скорость обработки (файлов и мегабайт в секунду).
+        """
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        parts = [f'{title}: {elapsed:.2f} с']
+        if files is not None:
+            parts.append(f'{files} файлов ({files / elapsed:.0f}/с)')
+        if size is not None:
+            parts.append(f'{size / 1024 / 1024:.1f} МБ ({size / 1024 / 1024 / elapsed:.1f} МБ/с)')
+        self.stdout.write(', '.join(parts))
+
+    def load_references(self, options):
+        """
+        Читает имена файлов из полей изображений потоком.
+
+        Returns:
+            tuple: (имена файлов, имена без расширения - для уменьшенных копий).
+        """
+        if options['bloom']:
+            expected = options['expected'] or sum(model.objects.count() for model in IMAGE_MODELS)
+            referenced, bases = BloomFilter(expected), BloomFilter(expected)
+        else:
+            referenced, bases = set(), set()
+        for model in IMAGE_MODELS:
+            names = (
+                model.objects.exclude(image='').exclude(image__isnull=True)
+                .values_list('image', flat=True).iterator(chunk_size=options['chunk_size'])
+            )
+            for name in names:
+                referenced.add(name)
+                bases.add(posixpath.splitext(name)[0])
+        return referenced, bases
+
+    def image_roots(self):
+        roots = {CAS_DIR}
+        for model in IMAGE_MODELS:
+            upload_to = model._meta.get_field('image').upload_to
+            if isinstance(upload_to, str):
+                roots.add(upload_to.strip('/'))
+        return sorted(roots)
+
+    def relative_name(self, path):
+        return os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+
+    def remove(self, path, reason):
+        if self.verbose:
+            self.stdout.write(f'{reason}: {self.relative_name(path)}')
+        if not self.dry_run:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def scan_originals(self, referenced):
+        """
+        Удаляет файлы без ссылок и группирует используемые файлы по размеру.
+
+        Returns:
+            dict: {размер: имя или список имен} используемых файлов.
+        """
+        by_size = {}
+        for root in self.image_roots():
+            for entry in _walk(os.path.join(settings.MEDIA_ROOT, root)):
+                stat = entry.stat()
+                self.stats['scanned'] += 1
+                self.stats['scanned_bytes'] += stat.st_size
+                if stat.st_mtime >= self.cutoff:
+                    continue
+                name = self.relative_name(entry.path)
+                if name not in referenced:
+                    # Сюда же попадают временные файлы прерванных загрузок (*.upload)
+                    if self.remove_orphan(entry.path, name):
+                        self.stats['orphans'] += 1
+                        self.stats['orphan_bytes'] += stat.st_size
+                    continue
+                # Для большинства размеров файл один, поэтому список создается только при совпадении
+                previous = by_size.get(stat.st_size)
+                if previous is None:
+                    by_size[stat.st_size] = name
+                elif isinstance(previous, list):
+                    previous.append(name)
+                else:
+                    by_size[stat.st_size] = [previous, name]
+        return by_size
+
+    def reclaim_duplicates(self, by_size):
+        """
+        Среди файлов одинакового размера находит одинаковые по SHA-256 и оставляет один экземпляр.
+        """
+        rewritten = False
+        for size, names in by_size.items():
+            if not isinstance(names, list):
+                continue
+            by_digest = {}
+            for name in names:
+                with open(os.path.join(settings.MEDIA_ROOT, name), 'rb') as file:
+                    by_digest.setdefault(file_digest(file), []).append(name)
+                self.stats['hashed_bytes'] += size
+            for same in by_digest.values():
+                if len(same) < 2:
+                    continue
+                keep, *duplicates = sorted(same, key=lambda name: (not is_content_addressed(name), name))
+                for duplicate in duplicates:
+                    path = os.path.join(settings.MEDIA_ROOT, duplicate)
+                    if self.dry_run:
+                        self.remove(path, f'дубликат {keep}')
+                    else:
+                        rewritten = True
+                        if not self.replace_duplicate(path, duplicate, keep):
+                            continue
+                    self.stats['duplicates'] += 1
+                    self.stats['duplicate_bytes'] += size
+        if rewritten:
+            recount_references()
+
+    def unreferenced(self, name, path):
+        """
+        Повторно проверяет файл непосредственно перед удалением.
+
+        Вызывается в транзакции: запись MediaBlob блокируется до ее конца, поэтому
+        параллельное сохранение ссылки на этот файл (add_reference) дождется удаления,
+        а ссылка, сохраненная после чтения ссылок командой, будет найдена здесь.
+        """
+        counts = MediaBlob.objects.select_for_update().filter(name=name).values_list('ref_count', flat=True)
+        if any(counts) or any(model.objects.filter(image=name).exists() for model in IMAGE_MODELS):
+            return False
+        try:
+            # Повторная загрузка того же содержимого обновляет время изменения файла
+            return os.stat(path).st_mtime < self.cutoff
+        except FileNotFoundError:
+            return False
+
+    def remove_orphan(self, path, name):
+        """
+        Удаляет файл без ссылок, если повторная проверка это подтверждает.
+
+        Returns:
+            bool: Удален ли файл (в режиме --dry-run - был бы удален).
+        """
+        if self.dry_run:
+            self.remove(path, 'без ссылок')
+            return True
+        with transaction.atomic():
+            if not self.unreferenced(name, path):
+                return False
+            self.remove(path, 'без ссылок')
+        return True
+
+    def replace_duplicate(self, path, duplicate, keep):
+        """
+        Переводит ссылки с дубликата на оставляемый файл и удаляет дубликат.
+
+        Уменьшенные копии дубликата удаляются; если у оставляемого файла их нет,
+        переведенные строки получают image_derivatives=False и копии создаются заново.
+
+        Returns:
+            bool: Удален ли дубликат.
+        """
+        ready = images.has_derivatives(keep)
+        with transaction.atomic():
+            # Ссылки на дубликат переводятся здесь же, счетчики пересчитывает recount_references
+            MediaBlob.objects.filter(name=duplicate).update(ref_count=0)
+            # updated_at и кэш страниц обновляются, чтобы страницы не ссылались на удаляемый файл
+            images.replace_image(duplicate, keep, image_derivatives=ready)
+            if not self.unreferenced(duplicate, path):
+                return False
+        # Файл удаляется после фиксации: при откате строки по-прежнему ссылаются на дубликат
+        images.delete_derivatives(duplicate)
+        self.remove(path, f'дубликат {keep}')
+        return True
+
+    def scan_derivatives(self, bases):
+        """
+        Удаляет уменьшенные копии (media/derivatives/<имя без расширения>/...) оригиналов без ссылок.
+        """
+        root = os.path.join(settings.MEDIA_ROOT, images.DERIVATIVES_DIR)
+        for entry in _walk(root):
+            stat = entry.stat()
+            base = posixpath.dirname(self.relative_name(entry.path))[len(images.DERIVATIVES_DIR) + 1:]
+            if stat.st_mtime < self.cutoff and base not in bases:
+                self.stats['derivatives'] += 1
+                self.stats['derivative_bytes'] += stat.st_size
+                self.remove(entry.path, 'уменьшенная копия без оригинала')
+        self.remove_empty_dirs(root)
+
+    def scan_resized(self):
+        """
+        Удаляет копии из media/resized/<размер>/<путь>, у которых больше нет оригинала,
+        и брошенные файлы блокировок.
+        """
+        root = os.path.join(settings.MEDIA_ROOT, images.RESIZED_DIR)
+        for entry in _walk(root):
+            stat = entry.stat()
+            if stat.st_mtime >= self.cutoff:
+                continue
+            parts = self.relative_name(entry.path).split('/', 2)
+            source = os.path.join(settings.MEDIA_ROOT, parts[2]) if len(parts) == 3 else ''
+            if entry.name.endswith(('.lock', '.tmp')) or not os.path.isfile(source):
+                self.stats['derivatives'] += 1
+                self.stats['derivative_bytes'] += stat.st_size
+                self.remove(entry.path, 'уменьшенная копия без оригинала')
+        self.remove_empty_dirs(root)
+
+    def remove_empty_dirs(self, root):
+        if self.dry_run or not os.path.isdir(root):
+            return
+        for path, _, _ in os.walk(root, topdown=False):
+            # Список подкаталогов os.walk получен до удаления вложенных пустых каталогов
+            if path != root and not os.listdir(path):
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    pass
+
+    def delete_unused_blobs(self):
+        """
+        Удаляет записи MediaBlob без ссылок, файлов которых больше нет.
+        """
+        missing = [
+            pk for pk, name in MediaBlob.objects.filter(ref_count=0).values_list('pk', 'name').iterator()
+            if not os.path.exists(os.path.join(settings.MEDIA_ROOT, name))
+        ]
+        for start in range(0, len(missing), 1000):
+            MediaBlob.objects.filter(pk__in=missing[start:start + 1000]).delete()
@@ -0,0 +1,26 @@
+# dogs/management/commands/recompute_ratings.py
+from django.core.management.base import BaseCommand
+
+from dogs import facets
+from dogs.ratings import recompute_ratings
+
+
+class Command(BaseCommand):
+    """
+    Команда для пересчета агрегатов рейтинга собак и пород по таблице отзывов.
+
+    После пересчета перестраивает индекс фасетов, так как рейтинги собак могли измениться.
+
+    Пример:
+        python manage.py recompute_ratings --batch-size 5000
+    """
+    help = 'Пересчитывает количество отзывов, сумму оценок и средний рейтинг собак и пород'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Количество собак в одном UPDATE')
+
+    def handle(self, *args, **options):
+        dogs, breeds = recompute_ratings(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано собак: {dogs}, пород: {breeds}'))
+        facets.rebuild()
+        self.stdout.write(self.style.SUCCESS('Индекс фасетов перестроен'))
@@ -0,0 +1,150 @@
+# dogs/management/commands/search_benchmark.py
+import random
+import statistics
+import time
+import uuid
+
+from django.db import connection, transaction
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from dogs.models import Breed, Dog, SearchTrigram
+from dogs.search import TrigramBackend, update_statistics
+
+SYLLABLES = ['ба', 'ро', 'ми', 'ла', 'ки', 'ту', 'ре', 'са', 'до', 'го', 'ни', 'ва', 'ле', 'мо', 'ри', 'за']
+WORDS = ['веселый', 'игривый', 'спокойный', 'умный', 'ласковый', 'активный', 'пушистый', 'рыжий',
+         'черный', 'белый', 'любит', 'гулять', 'играть', 'плавать', 'детей', 'мяч', 'лес', 'парк']
+
+BACKENDS = {
+    'icontains': 'dogs.search.IcontainsBackend',
+    'trigram': 'dogs.search.TrigramBackend',
+    'fulltext': 'dogs.search.SQLServerFullTextBackend',
+}
+
+
+class Command(BaseCommand):
+    """
+    Команда для замера скорости поиска собак на синтетических данных.
+
+    Создает отдельную породу с заданным количеством собак (bulk_create, без сигналов),
+    индексирует их триграммами, выполняет случайные запросы каждым бэкендом
+    и выводит время первой страницы результатов. После замера данные удаляются.
+
+    Пример:
+        python manage.py search_benchmark --dogs 1000000 --queries 200
+        python manage.py search_benchmark --dogs 100000 --backend trigram --keep
+    """
+    help = 'Замеряет время поиска собак разными бэкендами на синтетических данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dogs', type=int, default=1000000, help='Количество синтетических собак')
+        parser.add_argument('--queries', type=int, default=100, help='Количество запросов на бэкенд')
+        parser.add_argument('--backend', choices=list(BACKENDS), action='append', help='Бэкенд (по умолчанию все доступные)')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Размер пачки при создании собак')
+        parser.add_argument('--page-size', type=int, default=6, help='Размер страницы результатов')
+        parser.add_argument('--seed', type=int, default=42, help='Начальное значение генератора случайных чисел')
+        parser.add_argument('--keep', action='store_true', help='Не удалять синтетические данные после замера')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        backends = options['backend'] or [
+            name for name in BACKENDS if name != 'fulltext' or connection.vendor == 'microsoft'
+        ]
+
+        breed = Breed.objects.create(name=f'Benchmark {uuid.uuid4().hex[:8]}')
+        try:
+            names = self.generate(breed, options['dogs'], options['batch_size'], rng)
+            queries = self.make_queries(names, options['queries'], rng)
+            for name in backends:
+                backend = import_string(BACKENDS[name])()
+                if name == 'fulltext':
+                    backend.rebuild('dog')
+                    backend.rebuild('breed')
+                    backend.rebuild('user')
+                self.measure(name, backend, queries, options['page_size'])
+        finally:
+            if options['keep']:
+                self.stdout.write(f'Синтетические данные сохранены в породе "{breed.name}" (id={breed.pk})')
+            else:
+                self.cleanup(breed)
+
+    def generate(self, breed, count, batch_size, rng):
+        """
+        Создает собак пачками и индексирует их триграммами.
+
+        Returns:
+            list: Выборка кличек для построения запросов.
+        """
+        trigram_backend = TrigramBackend()
+        sample = []
+        created = 0
+        started = time.perf_counter()
+        while created < count:
+            size = min(batch_size, count - created)
+            dogs = []
+            for i in range(created, created + size):
+                name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+                description = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 40)))
+                dogs.append(Dog(
+                    name=name, breed=breed, age=rng.randint(0, 15), description=description,
+                    slug=f'benchmark-{breed.pk}-{i}',
+                ))
+                if len(sample) < 1000:
+                    sample.append(name)
+            with transaction.atomic():
+                Dog.objects.bulk_create(dogs)
+                created_ids = Dog.objects.filter(breed=breed, slug__in=[dog.slug for dog in dogs])
+                trigram_backend._index_rows('dog', trigram_backend._values('dog', created_ids))
+            created += size
+            self.stdout.write(f'  создано собак: {created}')
+        update_statistics()
+        self.stdout.write(f'Создание и индексация: {time.perf_counter() - started:.1f} с')
+        return sample
+
+    def make_queries(self, names, count, rng):
+        """
+        Строит запросы: полные клички, части кличек, слова описания и клички с опечаткой.
+        """
+        queries = []
+        for _ in range(count):
+            name = rng.choice(names).lower()
+            kind = rng.randrange(4)
+            if kind == 0:
+                queries.append(name)
+            elif kind == 1:
+                queries.append(name[:max(3, len(name) // 2)])
+            elif kind == 2:
+                queries.append(rng.choice(WORDS))
+            else:
+                position = rng.randrange(len(name))
+                queries.append(name[:position] + rng.choice('абвгд') + name[position + 1:])
+        return queries
+
+    def measure(self, name, backend, queries, page_size):
+        timings = []
+        found = 0
+        for query in queries:
+            started = time.perf_counter()
+            page = list(
+                backend.filter('dog', Dog.objects.only('pk', 'name'), query)
+                .order_by('-search_rank', '-pk')
+                .values_list('pk', flat=True)[:page_size]
+            )
+            timings.append((time.perf_counter() - started) * 1000)
+            found += bool(page)
+        timings.sort()
+        self.stdout.write(self.style.SUCCESS(
+            f'{name}: p50 {statistics.median(timings):.1f} мс, '
+            f'p95 {timings[int(len(timings) * 0.95) - 1]:.1f} мс, max {timings[-1]:.1f} мс, '
+            f'запросов с результатами {found}/{len(queries)}'
+        ))
+
+    def cleanup(self, breed):
+        """
+        Удаляет синтетических собак одним DELETE, без загрузки объектов и сигналов.
+        """
+        dogs = Dog.objects.filter(breed=breed)
+        SearchTrigram.objects.filter(entity='dog', object_id__in=dogs.values('pk')).delete()
+        dogs._raw_delete(dogs.db)
+        breed.delete()
+        self.stdout.write('Синтетические данные удалены')
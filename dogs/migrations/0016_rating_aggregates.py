@@ -0,0 +1,79 @@
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+
+def average(count_field, sum_field):
+    return Case(
+        When(**{f'{count_field}__gt': 0}, then=Cast(F(sum_field), FloatField()) / Cast(F(count_field), FloatField())),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    """
+    Заполняет агрегаты рейтинга по существующим отзывам.
+    """
+    Breed = apps.get_model('dogs', 'Breed')
+    Dog = apps.get_model('dogs', 'Dog')
+    Review = apps.get_model('dogs', 'Review')
+
+    reviews = Review.objects.filter(dog=OuterRef('pk')).order_by().values('dog')
+    Dog.objects.update(
+        review_count=Coalesce(Subquery(reviews.annotate(value=Count('pk')).values('value')), 0),
+        rating_sum=Coalesce(Subquery(reviews.annotate(value=Sum('rating')).values('value')), 0),
+    )
+    Dog.objects.update(rating_avg=average('review_count', 'rating_sum'))
+
+    dogs = Dog.objects.filter(breed=OuterRef('pk')).order_by().values('breed')
+    Breed.objects.update(
+        review_count=Coalesce(Subquery(dogs.annotate(value=Sum('review_count')).values('value')), 0),
+        rating_sum=Coalesce(Subquery(dogs.annotate(value=Sum('rating_sum')).values('value')), 0),
+    )
+    Breed.objects.update(rating_avg=average('review_count', 'rating_sum'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dogs', '0015_alter_breed_slug_alter_dog_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='breed',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество отзывов'),
+        ),
+        migrations.AddField(
+            model_name='breed',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddField(
+            model_name='breed',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False, verbose_name='Средний рейтинг'),
+        ),
+        migrations.AddField(
+            model_name='dog',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество отзывов'),
+        ),
+        migrations.AddField(
+            model_name='dog',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddField(
+            model_name='dog',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False, verbose_name='Средний рейтинг'),
+        ),
+        migrations.AddIndex(
+            model_name='dog',
+            index=models.Index(fields=['rating_avg', 'id'], name='dog_rating_idx'),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
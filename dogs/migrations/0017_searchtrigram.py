@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dogs', '0016_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(max_length=8, verbose_name='Тип объекта')),
+                ('object_id', models.BigIntegerField(verbose_name='Идентификатор объекта')),
+                ('trigram', models.CharField(max_length=3, verbose_name='Триграмма')),
+                ('weight', models.PositiveSmallIntegerField(default=1, verbose_name='Вес')),
+            ],
+            options={
+                'verbose_name': 'Триграмма поиска',
+                'verbose_name_plural': 'Триграммы поиска',
+                'indexes': [
+                    models.Index(fields=['entity', 'trigram', 'object_id', 'weight'], name='search_trigram_idx'),
+                    models.Index(fields=['entity', 'object_id'], name='search_object_idx'),
+                ],
+            },
+        ),
+    ]
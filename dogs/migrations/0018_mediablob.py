@@ -0,0 +1,39 @@
+# Generated by Django 4.2.12 on 2026-10-18 00:44
+
+from django.db import migrations, models
+import dogs.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dogs', '0017_searchtrigram'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='breed',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=dogs.storage.image_storage, upload_to='breed_images/', verbose_name='Изображение породы'),
+        ),
+        migrations.AlterField(
+            model_name='dog',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=dogs.storage.image_storage, upload_to='dog_images/', verbose_name='Фотография'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Имя файла')),
+                ('size', models.BigIntegerField(default=0, verbose_name='Размер, байт')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Файл изображения',
+                'verbose_name_plural': 'Файлы изображений',
+                'indexes': [models.Index(fields=['ref_count', 'updated_at'], name='media_blob_unused_idx')],
+            },
+        ),
+    ]
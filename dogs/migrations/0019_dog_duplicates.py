@@ -0,0 +1,44 @@
+# Generated by Django 4.2.12 on 2026-10-18 00:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dogs', '0018_mediablob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dog',
+            name='image_dhash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='dHash фотографии'),
+        ),
+        migrations.AddField(
+            model_name='dog',
+            name='image_phash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='pHash фотографии'),
+        ),
+        migrations.CreateModel(
+            name='DogDuplicate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.PositiveSmallIntegerField(verbose_name='Расстояние pHash')),
+                ('dhash_distance', models.PositiveSmallIntegerField(verbose_name='Расстояние dHash')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата обнаружения')),
+                ('dog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='possible_duplicates', to='dogs.dog', verbose_name='Собака')),
+                ('duplicate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='dogs.dog', verbose_name='Похожая собака')),
+            ],
+            options={
+                'verbose_name': 'Возможный дубликат',
+                'verbose_name_plural': 'Возможные дубликаты',
+                'indexes': [models.Index(fields=['duplicate'], name='dog_duplicate_other_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dogduplicate',
+            constraint=models.UniqueConstraint(fields=('dog', 'duplicate'), name='dog_duplicate_unique'),
+        ),
+    ]
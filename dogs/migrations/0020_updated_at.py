@@ -0,0 +1,36 @@
+# Generated by Django 4.2.12 on 2026-10-18 01:01
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dogs', '0019_dog_duplicates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='breed',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='dog',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='pedigree',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='dog',
+            index=models.Index(fields=['breed', 'updated_at'], name='dog_breed_updated_idx'),
+        ),
+    ]
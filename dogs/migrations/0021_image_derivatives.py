@@ -0,0 +1,23 @@
+# Generated by Django 4.2.12 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dogs', '0020_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='breed',
+            name='image_derivatives',
+            field=models.BooleanField(db_index=True, default=False, editable=False, null=True, verbose_name='Производные изображения'),
+        ),
+        migrations.AddField(
+            model_name='dog',
+            name='image_derivatives',
+            field=models.BooleanField(db_index=True, default=False, editable=False, null=True, verbose_name='Производные фотографии'),
+        ),
+    ]
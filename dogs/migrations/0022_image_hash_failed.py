@@ -0,0 +1,18 @@
+# Generated by Django 4.2.12 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dogs', '0021_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dog',
+            name='image_hash_failed',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Ошибка хэширования фотографии'),
+        ),
+    ]
@@ -9,6 +9,8 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid  # Import UUID
 from django.utils.text import slugify
 
+from .storage import image_storage
+
 class Review(models.Model):
     """
     Модель для хранения отзывов о собаках.
@@ -29,14 +31,40 @@ class Review(models.Model):
 
 User = get_user_model()
 
+
+def fields_without_counters(instance):
+    """
+    Возвращает поля для save(update_fields=...) без счетчиков модели.
+
+    Счетчики (COUNTER_FIELDS) меняются атомарными UPDATE c F-выражениями.
+    Форма или админка, сохраняющая объект целиком, записала бы в них устаревшие
+    значения, загруженные вместе с объектом, поэтому такие пути сохраняют
+    объект с этим списком полей. Обычный save() записывает все поля.
+    """
+    return [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in instance.COUNTER_FIELDS
+    ]
+
 class Breed(models.Model):
     """
     Модель для хранения информации о породах собак.
     """
     name = models.CharField(max_length=100, verbose_name='Название породы', unique=True)
     description = models.TextField(blank=True, null=True, verbose_name='Описание породы')
-    image = models.ImageField(upload_to='breed_images/', blank=True, null=True, verbose_name='Изображение породы')
+    image = models.ImageField(upload_to='breed_images/', storage=image_storage, blank=True, null=True, verbose_name='Изображение породы')
     slug = models.SlugField(max_length=255, unique=True, blank=True, verbose_name='Slug')
+    # Агрегаты отзывов всех собак породы (поддерживаются dogs/ratings.py)
+    review_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество отзывов')
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок')
+    rating_avg = models.FloatField(default=0, editable=False, verbose_name='Средний рейтинг')
+    # Уменьшенные копии изображения (dogs/images.py): False - в очереди, True - созданы, None - ошибка
+    image_derivatives = models.BooleanField(default=False, null=True, editable=False, db_index=True, verbose_name='Производные изображения')
+    # Версия страницы породы для условных запросов (dogs/conditional.py)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+    # Поля, которые обновляются атомарными UPDATE и не сохраняются формами (fields_without_counters)
+    COUNTER_FIELDS = ('review_count', 'rating_sum', 'rating_avg')
 
     def __str__(self):
         return self.name
@@ -61,11 +89,27 @@ class Dog(models.Model):
     breed = models.ForeignKey(Breed, on_delete=models.CASCADE, related_name='dogs', verbose_name='Порода')
     age = models.PositiveIntegerField(verbose_name='Возраст')
     description = models.TextField(blank=True, verbose_name='Описание')
-    image = models.ImageField(upload_to='dog_images/', blank=True, null=True, verbose_name='Фотография')
+    image = models.ImageField(upload_to='dog_images/', storage=image_storage, blank=True, null=True, verbose_name='Фотография')
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='dogs', verbose_name='Владелец')
     birth_date = models.DateField(verbose_name='Дата рождения', null=True, blank=True)
     slug = models.SlugField(max_length=255, unique=True, blank=True, verbose_name='Slug')
     views_count = models.PositiveIntegerField(default=0, verbose_name='Количество просмотров')
+    # Агрегаты отзывов (поддерживаются dogs/ratings.py)
+    review_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество отзывов')
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок')
+    rating_avg = models.FloatField(default=0, editable=False, verbose_name='Средний рейтинг')
+    # Перцептивные хэши фотографии (dogs/duplicates.py), 64 бита со знаком
+    image_dhash = models.BigIntegerField(null=True, blank=True, editable=False, verbose_name='dHash фотографии')
+    image_phash = models.BigIntegerField(null=True, blank=True, editable=False, verbose_name='pHash фотографии')
+    # Хэши фотографии не удалось посчитать: при сохранении без смены фотографии не пересчитываются
+    image_hash_failed = models.BooleanField(default=False, editable=False, verbose_name='Ошибка хэширования фотографии')
+    # Уменьшенные копии фотографии (dogs/images.py): False - в очереди, True - созданы, None - ошибка
+    image_derivatives = models.BooleanField(default=False, null=True, editable=False, db_index=True, verbose_name='Производные фотографии')
+    # Версия страницы собаки для условных запросов (dogs/conditional.py), обновляется и при изменении родословной
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+    # Поля, которые обновляются атомарными UPDATE и не сохраняются формами (fields_without_counters)
+    COUNTER_FIELDS = ('views_count', 'review_count', 'rating_sum', 'rating_avg')
 
     def __str__(self):
         return self.name
@@ -93,6 +137,8 @@ class Dog(models.Model):
         verbose_name_plural = 'Собаки'
         indexes = [
             models.Index(fields=['breed'], name='dog_breed_idx'),  # Добавляем индекс
+            models.Index(fields=['rating_avg', 'id'], name='dog_rating_idx'),  # Сортировка по рейтингу
+            models.Index(fields=['breed', 'updated_at'], name='dog_breed_updated_idx'),  # Версия страницы породы
         ]
 
 class Pedigree(models.Model):
@@ -106,10 +152,88 @@ class Pedigree(models.Model):
     grand_mother_father = models.CharField(max_length=100, blank=True, null=True, verbose_name='Бабушка по отцу')
     grand_father_mother = models.CharField(max_length=100, blank=True, null=True, verbose_name='Дед по матери')
     grand_mother_mother = models.CharField(max_length=100, blank=True, null=True, verbose_name='Бабушка по матери')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
 
     class Meta:
         verbose_name = 'Родословная'
         verbose_name_plural = 'Родословные'
 
     def __str__(self):
-        return f"Родословная для {self.dog.name}"
\ No newline at end of file
+        return f"Родословная для {self.dog.name}"
+
+class SearchTrigram(models.Model):
+    """
+    Запись инвертированного индекса поиска (dogs/search.py).
+
+    Для каждого индексируемого объекта хранится по одной строке на триграмму
+    его текстовых полей. weight - вес самого важного поля, в котором
+    встречается триграмма; сумма весов совпавших триграмм дает ранг.
+    """
+    entity = models.CharField(max_length=8, verbose_name='Тип объекта')  # dog, breed, user
+    object_id = models.BigIntegerField(verbose_name='Идентификатор объекта')
+    trigram = models.CharField(max_length=3, verbose_name='Триграмма')
+    weight = models.PositiveSmallIntegerField(default=1, verbose_name='Вес')
+
+    class Meta:
+        verbose_name = 'Триграмма поиска'
+        verbose_name_plural = 'Триграммы поиска'
+        indexes = [
+            # Поиск: по триграмме сразу получаем объекты и веса без обращения к таблице
+            models.Index(fields=['entity', 'trigram', 'object_id', 'weight'], name='search_trigram_idx'),
+            # Переиндексация и удаление объекта
+            models.Index(fields=['entity', 'object_id'], name='search_object_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.entity}:{self.object_id} "{self.trigram}"'
+
+
+class MediaBlob(models.Model):
+    """
+    Файл хранилища изображений по хэшу содержимого (dogs/storage.py).
+
+    ref_count - сколько полей Dog.image и Breed.image ссылаются на файл.
+    Файлы без ссылок удаляет команда reclaim_media.
+    """
+    name = models.CharField(max_length=255, unique=True, verbose_name='Имя файла')
+    size = models.BigIntegerField(default=0, verbose_name='Размер, байт')
+    ref_count = models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+    class Meta:
+        verbose_name = 'Файл изображения'
+        verbose_name_plural = 'Файлы изображений'
+        indexes = [
+            # Поиск файлов без ссылок для удаления
+            models.Index(fields=['ref_count', 'updated_at'], name='media_blob_unused_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.ref_count})'
+
+
+class DogDuplicate(models.Model):
+    """
+    Пара собак с похожими фотографиями (dogs/duplicates.py).
+
+    dog - собака, добавленная позже, duplicate - раньше; каждая пара хранится один раз.
+    Расстояния - количество различающихся бит перцептивных хэшей (0 - одинаковые фотографии).
+    """
+    dog = models.ForeignKey(Dog, on_delete=models.CASCADE, related_name='possible_duplicates', verbose_name='Собака')
+    duplicate = models.ForeignKey(Dog, on_delete=models.CASCADE, related_name='+', verbose_name='Похожая собака')
+    distance = models.PositiveSmallIntegerField(verbose_name='Расстояние pHash')
+    dhash_distance = models.PositiveSmallIntegerField(verbose_name='Расстояние dHash')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата обнаружения')
+
+    class Meta:
+        verbose_name = 'Возможный дубликат'
+        verbose_name_plural = 'Возможные дубликаты'
+        constraints = [
+            models.UniqueConstraint(fields=['dog', 'duplicate'], name='dog_duplicate_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['duplicate'], name='dog_duplicate_other_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.dog.name} ~ {self.duplicate.name}'
@@ -0,0 +1,169 @@
+# dogs/page_cache.py
+"""
+Кэш целых страниц каталога с отдельными вариантами для ролей и сбросом по меткам.
+
+Страница кэшируется по роли пользователя (anonymous, user, staff), полному
+пути запроса с параметрами, PAGE_VERSION и варианту, который задает
+представление (например, версии собаки и породы или признак владельца).
+Страницы с непоказанными сообщениями (messages) не кэшируются и не берутся из кэша.
+
+Метки (surrogate keys):
+    Каждая страница помечается метками объектов, которые на ней показаны
+    ('dog:<id>', 'breed:<id>', 'breeds' - состав и порядок списка пород).
+    У каждой метки в кэше есть случайный токен; запись страницы хранит
+    токены своих меток на момент сохранения. purge() удаляет токены меток
+    после фиксации транзакции, и все страницы с этими метками перестают
+    совпадать с текущими токенами - остальные страницы не затрагиваются.
+    Время жизни PAGE_CACHE_SECONDS нужно только для вытеснения неиспользуемых страниц.
+
+Токены снимаются после рендеринга, поэтому сброс, пришедший между
+чтением данных и снятием токенов, не заметит страницу, уже отрендеренную
+со старыми данными. Для страниц собаки и породы это исключено: их вариант
+содержит updated_at показанных объектов. Для списка пород такая страница
+проживет не дольше PAGE_CACHE_SECONDS.
+
+Сигналы моделей, которые вызывают purge(), находятся в dogs/signals.py.
+"""
+import hashlib
+import logging
+import uuid
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'page:'
+TAG_PREFIX = 'page_tag:'
+# Заголовок ответа: hit - страница из кэша, miss - отрендерена и сохранена
+STATUS_HEADER = 'X-Page-Cache'
+
+
+def role(user):
+    """
+    Возвращает роль пользователя, для которой хранится отдельный вариант страницы.
+    """
+    if not user.is_authenticated:
+        return 'anonymous'
+    return 'staff' if user.is_staff else 'user'
+
+
+def page_key(request, variant=()):
+    raw = repr((settings.PAGE_VERSION, role(request.user), request.get_full_path(), variant))
+    return KEY_PREFIX + hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def _tag_keys(tags):
+    return {TAG_PREFIX + tag: tag for tag in tags}
+
+
+def tag_tokens(tags):
+    """
+    Возвращает текущие токены меток, создавая недостающие.
+
+    Returns:
+        dict: {метка: токен}.
+    """
+    keys = _tag_keys(tags)
+    tokens = cache.get_many(list(keys))
+    missing = [key for key in keys if key not in tokens]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+        # Параллельный запрос мог создать токен раньше - берем тот, что в кэше
+        tokens.update(cache.get_many(missing))
+    return {keys[key]: token for key, token in tokens.items()}
+
+
+def purge(*tags):
+    """
+    Сбрасывает страницы с метками tags после фиксации текущей транзакции.
+    """
+    keys = list(_tag_keys(tags))
+
+    def delete():
+        try:
+            cache.delete_many(keys)
+        except Exception as e:
+            logger.warning(f"Не удалось сбросить страницы {tags}: {e}")
+
+    transaction.on_commit(delete)
+
+
+def _cacheable_request(request):
+    return request.method in ('GET', 'HEAD') and not len(get_messages(request))
+
+
+def get_page(request, variant=()):
+    """
+    Возвращает запись страницы из кэша или None, если ее нет или она сброшена.
+    """
+    if not _cacheable_request(request):
+        return None
+    try:
+        entry = cache.get(page_key(request, variant))
+        if entry is None:
+            return None
+        tokens = cache.get_many(list(_tag_keys(entry['tags'])))
+    except Exception as e:
+        logger.warning(f"Кэш страниц недоступен: {e}")
+        return None
+    if any(tokens.get(TAG_PREFIX + tag) != token for tag, token in entry['tags'].items()):
+        return None
+    return entry
+
+
+def store_page(request, response, tags, variant=(), timeout=None):
+    """
+    Сохраняет отрендеренный ответ 200 с метками tags.
+    """
+    if response.status_code != 200 or response.cookies or not _cacheable_request(request):
+        return
+    try:
+        entry = {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'tags': tag_tokens(tags),
+        }
+        cache.set(page_key(request, variant), entry, timeout or settings.PAGE_CACHE_SECONDS)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить страницу в кэш: {e}")
+
+
+class PageCacheMixin:
+    """
+    Примесь для представлений: отдает страницу из кэша или рендерит и сохраняет ее.
+
+    Представление вызывает cached_page(request, render) в get(), где render -
+    функция, возвращающая ответ. Метки страницы задает get_page_cache_tags()
+    (вызывается после рендеринга), вариант - get_page_cache_variant().
+    fill_page_content() подставляет в HTML значения, которые меняются
+    на каждый запрос и поэтому не кэшируются (по умолчанию ничего).
+    """
+
+    def get_page_cache_tags(self):
+        return ()
+
+    def get_page_cache_variant(self):
+        return ()
+
+    def fill_page_content(self, content):
+        return content
+
+    def cached_page(self, request, render):
+        variant = self.get_page_cache_variant()
+        entry = get_page(request, variant)
+        if entry is not None:
+            response = HttpResponse(self.fill_page_content(entry['content']), content_type=entry['content_type'])
+            response[STATUS_HEADER] = 'hit'
+            return response
+        response = render()
+        if hasattr(response, 'render'):
+            response.render()
+        store_page(request, response, self.get_page_cache_tags(), variant)
+        response.content = self.fill_page_content(response.content)
+        response[STATUS_HEADER] = 'miss'
+        return response
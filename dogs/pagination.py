@@ -0,0 +1,286 @@
+# dogs/pagination.py
+"""
+Курсорная (keyset) пагинация списков и приблизительный подсчет строк.
+
+Обычная пагинация выполняет COUNT(*) по всему отфильтрованному набору
+и OFFSET n, поэтому каждая следующая страница дороже предыдущей.
+Курсорная пагинация запоминает значения ключа сортировки (sort_key, id)
+последней показанной строки и выбирает следующую страницу условием
+WHERE (sort_key, id) > (значения из курсора) ... LIMIT page_size + 1.
+Глубокие страницы стоят столько же, сколько первая.
+
+Курсоры передаются в параметре ?cursor= в виде подписанных токенов
+(django.core.signing), поэтому клиент не может их подделать.
+
+Режим включается параметром ?paginate=cursor или настройкой
+LIST_PAGINATION = 'cursor'. Без них представления работают как раньше.
+"""
+import logging
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+CURSOR_SALT = 'dogs.pagination.cursor'
+
+
+def _field_value(obj, field):
+    """
+    Возвращает значение поля сортировки объекта (поддерживает 'pk' и 'fk__field').
+    """
+    for part in field.split('__'):
+        obj = getattr(obj, part)
+    return obj
+
+
+def _reverse_ordering(ordering):
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+
+def keyset_filter(ordering, values, forward=True):
+    """
+    Строит условие "строка после (или до) строки со значениями values".
+
+    Для сортировки (a, -b, pk) и значений (x, y, z) вперед получается
+    a > x OR (a = x AND b < y) OR (a = x AND b = y AND pk > z).
+
+    Args:
+        ordering (list): Поля сортировки; последнее должно быть уникальным.
+        values (list): Значения этих полей у граничной строки.
+        forward (bool): True - строки после граничной, False - до нее.
+
+    Returns:
+        Q: Условие фильтрации.
+    """
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') == forward else 'gt'
+        equal = {ordering[j].lstrip('-'): values[j] for j in range(i)}
+        condition |= Q(**equal, **{f'{name}__{lookup}': values[i]})
+    return condition
+
+
+class CountEstimate:
+    """
+    Приблизительное количество строк для отображения в шаблоне.
+
+    Атрибуты:
+        count (int): Количество (точное, оценка СУБД или нижняя граница).
+        exact (bool): True, если количество точное.
+        capped (bool): True, если строк больше count.
+    """
+
+    def __init__(self, count, exact=True, capped=False):
+        self.count = count
+        self.exact = exact
+        self.capped = capped
+
+    def __str__(self):
+        if self.capped:
+            return f'{self.count}+'
+        if not self.exact:
+            return f'≈ {self.count}'
+        return str(self.count)
+
+
+def _table_row_estimate(model, using):
+    """
+    Возвращает оценку числа строк таблицы из статистики СУБД или None.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'microsoft':
+        sql = (
+            'SELECT SUM(row_count) FROM sys.dm_db_partition_stats '
+            'WHERE object_id = OBJECT_ID(%s) AND index_id IN (0, 1)'
+        )
+    elif connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass'
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except Exception as e:
+        logger.warning(f"Не удалось получить статистику таблицы {table}: {e}")
+        return None
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def estimated_count(queryset, limit=None):
+    """
+    Подсчитывает строки QuerySet без полного COUNT(*) по большой выборке.
+
+    Для QuerySet без фильтров используется статистика таблицы
+    (sys.dm_db_partition_stats в SQL Server, pg_class в PostgreSQL).
+    Для отфильтрованного QuerySet подсчитывается не более limit строк:
+    SELECT COUNT(*) FROM (SELECT ... LIMIT limit + 1).
+
+    Args:
+        queryset (QuerySet): Набор строк.
+        limit (int): Граница подсчета. По умолчанию ESTIMATED_COUNT_LIMIT.
+
+    Returns:
+        CountEstimate: Количество строк.
+    """
+    if limit is None:
+        limit = getattr(settings, 'ESTIMATED_COUNT_LIMIT', 1000)
+
+    if not queryset.query.where and not queryset.query.distinct:
+        estimate = _table_row_estimate(queryset.model, queryset.db)
+        if estimate is not None and estimate > limit:
+            return CountEstimate(estimate, exact=False)
+
+    count = queryset.order_by()[:limit + 1].count()
+    if count > limit:
+        return CountEstimate(limit, exact=False, capped=True)
+    return CountEstimate(count)
+
+
+class CursorPage:
+    """
+    Страница курсорной пагинации.
+
+    Повторяет интерфейс django.core.paginator.Page, который используют шаблоны
+    (итерация, has_next, has_previous, has_other_pages), но без номера страницы
+    и общего количества. Вместо номеров страниц - токены next_cursor и previous_cursor.
+    """
+    cursor_mode = True
+    number = None
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage: {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginationMixin:
+    """
+    Миксин для ListView, добавляющий курсорный режим пагинации.
+
+    Порядок строк берется из order_by() QuerySet (или Meta.ordering модели);
+    если в нем нет первичного ключа, он добавляется последним для однозначности.
+    Поля сортировки должны быть полями модели с JSON-сериализуемыми значениями.
+
+    В контекст добавляются:
+        cursor_mode (bool): Включен ли курсорный режим.
+        cursor_query (str): Параметры запроса без page и cursor для ссылок.
+        total_count (CountEstimate): Приблизительное количество строк
+            (только в курсорном режиме и если show_estimated_count = True).
+    """
+    cursor_param = 'cursor'
+    show_estimated_count = True
+
+    def use_cursor_pagination(self):
+        """
+        Возвращает True, если список нужно пагинировать курсорами.
+        """
+        params = self.request.GET
+        return (
+            self.cursor_param in params
+            or params.get('paginate') == 'cursor'
+            or getattr(settings, 'LIST_PAGINATION', 'offset') == 'cursor'
+        )
+
+    def get_cursor_ordering(self, queryset):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not any(field.lstrip('-') in ('pk', 'id') for field in ordering):
+            ordering.append('-pk' if ordering and ordering[-1].startswith('-') else 'pk')
+        return ordering
+
+    def _decode_cursor(self, ordering):
+        """
+        Возвращает (значения, направление) из токена или (None, True) для первой страницы.
+        """
+        token = self.request.GET.get(self.cursor_param)
+        if not token:
+            return None, True
+        try:
+            payload = signing.loads(token, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            return None, True
+        # Курсор от другой сортировки не подходит: начинаем с первой страницы
+        if payload.get('o') != ordering or len(payload.get('v', ())) != len(ordering):
+            return None, True
+        return payload['v'], payload.get('d', 'n') == 'n'
+
+    def _encode_cursor(self, obj, ordering, forward):
+        values = [_field_value(obj, field.lstrip('-')) for field in ordering]
+        return signing.dumps({'o': ordering, 'v': values, 'd': 'n' if forward else 'p'}, salt=CURSOR_SALT, compress=True)
+
+    def paginate_by_cursor(self, queryset, page_size):
+        """
+        Возвращает CursorPage с page_size строками после (или до) курсора.
+
+        Выполняет один запрос с LIMIT page_size + 1: лишняя строка
+        показывает, есть ли страница дальше.
+        """
+        ordering = self.get_cursor_ordering(queryset)
+        values, forward = self._decode_cursor(ordering)
+
+        if values is not None:
+            queryset = queryset.filter(keyset_filter(ordering, values, forward))
+        queryset = queryset.order_by(*(ordering if forward else _reverse_ordering(ordering)))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if not forward:
+            rows.reverse()
+
+        has_next = has_more if forward else values is not None
+        has_previous = values is not None if forward else has_more
+        return CursorPage(
+            rows,
+            next_cursor=self._encode_cursor(rows[-1], ordering, True) if rows and has_next else None,
+            previous_cursor=self._encode_cursor(rows[0], ordering, False) if rows and has_previous else None,
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        self._cursor_queryset = queryset
+        page = self.paginate_by_cursor(queryset, page_size)
+        return None, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        cursor_mode = self.use_cursor_pagination()
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        params.pop(self.cursor_param, None)
+        if cursor_mode:
+            params['paginate'] = 'cursor'
+            if self.show_estimated_count:
+                context['total_count'] = estimated_count(self._cursor_queryset)
+        context['cursor_mode'] = cursor_mode
+        context['cursor_query'] = params.urlencode()
+        return context
@@ -0,0 +1,141 @@
+# dogs/ratings.py
+"""
+Денормализованные агрегаты отзывов: review_count, rating_sum и rating_avg
+у Dog и Breed.
+
+Агрегаты меняются атомарными UPDATE с F-выражениями в тех же транзакциях,
+что и сами отзывы, поэтому параллельные отзывы не теряют приращения.
+recompute_ratings() пересчитывает агрегаты с нуля (команда recompute_ratings).
+Изменения рейтинга собаки записываются в журнал фасетов (dogs/facets.py).
+"""
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+from . import facets
+from .models import Breed, Dog, Review
+
+
+def _delta_expressions(count_delta, sum_delta):
+    """
+    Возвращает выражения UPDATE для изменения агрегатов на заданные приращения.
+
+    В SET все F-выражения ссылаются на значения до обновления, поэтому
+    средний рейтинг считается из новых суммы и количества в том же запросе.
+    """
+    new_count = F('review_count') + count_delta
+    new_sum = F('rating_sum') + sum_delta
+    return {
+        'review_count': new_count,
+        'rating_sum': new_sum,
+        'rating_avg': Case(
+            When(review_count__lte=-count_delta, then=Value(0.0)),
+            default=Cast(new_sum, FloatField()) / Cast(new_count, FloatField()),
+            output_field=FloatField(),
+        ),
+    }
+
+
+def apply_delta(dog_id, count_delta, sum_delta, breed_id=None):
+    """
+    Изменяет агрегаты собаки и ее породы.
+
+    Args:
+        dog_id (int): Идентификатор собаки.
+        count_delta (int): Изменение количества отзывов.
+        sum_delta (int): Изменение суммы оценок.
+        breed_id (int): Идентификатор породы; если не передан, порода
+            определяется подзапросом по собаке.
+    """
+    if not count_delta and not sum_delta:
+        return
+    Dog.objects.filter(pk=dog_id).update(**_delta_expressions(count_delta, sum_delta))
+    breeds = Breed.objects.filter(pk=breed_id) if breed_id else Breed.objects.filter(dogs=dog_id)
+    breeds.update(**_delta_expressions(count_delta, sum_delta))
+    facets.record_dogs([dog_id])
+
+
+def review_created(review):
+    """
+    Учитывает новый отзыв. Вызывается в транзакции вместе с созданием отзыва.
+    """
+    apply_delta(review.dog_id, 1, review.rating)
+
+
+def review_rating_changed(review, old_rating):
+    """
+    Учитывает изменение оценки отзыва.
+    """
+    apply_delta(review.dog_id, 0, review.rating - old_rating)
+
+
+def review_deleted(review):
+    """
+    Учитывает удаление отзыва.
+    """
+    apply_delta(review.dog_id, -1, -review.rating)
+
+
+def move_dog(dog_id, old_breed_id, new_breed_id):
+    """
+    Переносит агрегаты собаки со старой породы на новую при смене породы.
+    """
+    review_count, rating_sum = Dog.objects.filter(pk=dog_id).values_list('review_count', 'rating_sum').get()
+    if not review_count:
+        return
+    Breed.objects.filter(pk=old_breed_id).update(**_delta_expressions(-review_count, -rating_sum))
+    Breed.objects.filter(pk=new_breed_id).update(**_delta_expressions(review_count, rating_sum))
+
+
+def dog_deleted(dog):
+    """
+    Вычитает агрегаты удаленной собаки из агрегатов ее породы.
+    """
+    if dog.review_count:
+        Breed.objects.filter(pk=dog.breed_id).update(**_delta_expressions(-dog.review_count, -dog.rating_sum))
+
+
+def _average(count_field, sum_field):
+    return Case(
+        When(**{f'{count_field}__gt': 0}, then=Cast(F(sum_field), FloatField()) / Cast(F(count_field), FloatField())),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def recompute_ratings(batch_size=10000):
+    """
+    Пересчитывает агрегаты всех собак и пород по таблице отзывов.
+
+    Собаки обновляются пачками по диапазонам первичного ключа, чтобы не держать
+    блокировку на всей таблице.
+
+    Returns:
+        tuple: (количество собак, количество пород).
+    """
+    reviews = Review.objects.filter(dog=OuterRef('pk')).order_by().values('dog')
+    review_count = Coalesce(Subquery(reviews.annotate(value=Count('pk')).values('value')), 0)
+    rating_sum = Coalesce(Subquery(reviews.annotate(value=Sum('rating')).values('value')), 0)
+
+    dogs_updated = 0
+    last_id = 0
+    while True:
+        ids = list(Dog.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            batch = Dog.objects.filter(pk__gte=ids[0], pk__lte=ids[-1])
+            batch.update(review_count=review_count, rating_sum=rating_sum)
+            batch.update(rating_avg=_average('review_count', 'rating_sum'))
+        dogs_updated += len(ids)
+        last_id = ids[-1]
+
+    dogs = Dog.objects.filter(breed=OuterRef('pk')).order_by().values('breed')
+    with transaction.atomic():
+        breeds_updated = Breed.objects.update(
+            review_count=Coalesce(Subquery(dogs.annotate(value=Sum('review_count')).values('value')), 0),
+            rating_sum=Coalesce(Subquery(dogs.annotate(value=Sum('rating_sum')).values('value')), 0),
+        )
+        Breed.objects.update(rating_avg=_average('review_count', 'rating_sum'))
+
+    return dogs_updated, breeds_updated
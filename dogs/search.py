@@ -0,0 +1,457 @@
+# dogs/search.py
+"""
+Поиск собак, пород и пользователей с подключаемым бэкендом.
+
+Бэкенд задается настройкой SEARCH_BACKEND (путь к классу):
+    dogs.search.TrigramBackend - встроенный инвертированный индекс триграмм
+        (модель SearchTrigram), обновляется сигналами при сохранении и удалении;
+    dogs.search.SQLServerFullTextBackend - полнотекстовый индекс SQL Server
+        (CONTAINSTABLE), SQL Server обновляет его сам (CHANGE_TRACKING AUTO);
+    dogs.search.IcontainsBackend - прежний поиск через LIKE '%...%'.
+
+Все бэкенды фильтруют QuerySet и добавляют аннотацию search_rank: сумму
+весов полей, в которых нашлось совпадение. Для собак ранжирование учитывает
+кличку, имя владельца, породу и описание.
+
+Индекс строится командой rebuild_search_index.
+"""
+import logging
+import math
+import re
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Индексируемые поля и их веса. Поля через "__" берутся из связанных моделей.
+ENTITIES = {
+    'dog': {
+        'model': 'dogs.Dog',
+        'fields': {'name': 8, 'owner__username': 4, 'breed__name': 4, 'description': 1},
+        'icontains': ('name', 'owner__username'),
+    },
+    'breed': {
+        'model': 'dogs.Breed',
+        'fields': {'name': 8, 'description': 1},
+        'icontains': ('name',),
+    },
+    'user': {
+        'model': 'users.User',
+        'fields': {'username': 8, 'email': 4, 'first_name': 2, 'last_name': 2},
+        'icontains': ('username', 'email'),
+    },
+}
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def get_model(entity):
+    return apps.get_model(ENTITIES[entity]['model'])
+
+
+def normalize(text):
+    return (text or '').lower().replace('ё', 'е')
+
+
+def trigrams(text):
+    """
+    Возвращает множество триграмм текста.
+
+    Каждое слово дополняется двумя пробелами слева и одним справа, поэтому
+    у коротких слов тоже есть триграммы, а начало слова весит больше.
+    """
+    grams = set()
+    for word in _WORD_RE.findall(normalize(text)):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def document_trigrams(entity, values):
+    """
+    Возвращает {триграмма: вес} для документа.
+
+    Args:
+        entity (str): Тип объекта из ENTITIES.
+        values (dict): Значения индексируемых полей объекта.
+    """
+    description_length = _setting('SEARCH_DESCRIPTION_LENGTH', 500)
+    weights = {}
+    for field, weight in ENTITIES[entity]['fields'].items():
+        text = values.get(field) or ''
+        if field == 'description':
+            # Длинные описания индексируются только началом, чтобы индекс не разрастался
+            text = text[:description_length]
+        for gram in trigrams(text):
+            if weights.get(gram, 0) < weight:
+                weights[gram] = weight
+    return weights
+
+
+class SearchBackend:
+    """
+    Базовый класс бэкенда поиска.
+
+    Методы:
+        filter(entity, queryset, query): Оставляет в QuerySet найденные объекты
+            и добавляет аннотацию search_rank.
+        update(entity, ids): Обновляет индекс для объектов.
+        remove(entity, ids): Удаляет объекты из индекса.
+        rebuild(entity, batch_size, progress): Перестраивает индекс целиком.
+        truncated(entity, query): Проверяет, обрезаны ли результаты запроса
+            лимитом SEARCH_MAX_RESULTS.
+    """
+    name = 'base'
+
+    def filter(self, entity, queryset, query):
+        raise NotImplementedError
+
+    def update(self, entity, ids):
+        pass
+
+    def remove(self, entity, ids):
+        pass
+
+    def rebuild(self, entity, batch_size=5000, progress=None):
+        return 0
+
+    def truncated(self, entity, query):
+        return False
+
+
+class IcontainsBackend(SearchBackend):
+    """
+    Прежний поиск подстрокой (LIKE '%...%') без ранжирования и без индекса.
+    """
+    name = 'icontains'
+
+    def filter(self, entity, queryset, query):
+        condition = Q()
+        for field in ENTITIES[entity]['icontains']:
+            condition |= Q(**{f'{field}__icontains': query})
+        return queryset.filter(condition).annotate(search_rank=Value(0, output_field=IntegerField()))
+
+
+class TrigramBackend(SearchBackend):
+    """
+    Поиск по инвертированному индексу триграмм (модель SearchTrigram).
+
+    Запрос раскладывается на триграммы; объект найден, если в нем есть не меньше
+    SEARCH_TRIGRAM_THRESHOLD триграмм запроса (это допускает опечатки и поиск
+    по части слова). Ранг - сумма весов совпавших триграмм.
+    Все вычисления выполняются в БД одним запросом по индексам search_trigram_idx
+    (отбор кандидатов) и search_object_idx (ранг найденных объектов).
+    """
+    name = 'trigram'
+
+    def _grams(self, query):
+        return sorted(trigrams(query))[:_setting('SEARCH_MAX_QUERY_TRIGRAMS', 32)]
+
+    def _candidates(self, entity, grams):
+        from .models import SearchTrigram
+
+        min_hits = max(1, math.ceil(len(grams) * _setting('SEARCH_TRIGRAM_THRESHOLD', 0.6)))
+        return (
+            SearchTrigram.objects.filter(entity=entity, trigram__in=grams)
+            .values('object_id')
+            .annotate(score=Sum('weight'), hits=Count('pk'))
+            .filter(hits__gte=min_hits)
+            .order_by('-score', '-object_id')
+        )
+
+    def matches(self, entity, grams):
+        """
+        Возвращает QuerySet {object_id, score} наиболее релевантных объектов.
+
+        Берется не больше SEARCH_MAX_RESULTS объектов: ранг вычисляется только для них,
+        поэтому частые слова не заставляют ранжировать всю таблицу.
+        """
+        return self._candidates(entity, grams)[:_setting('SEARCH_MAX_RESULTS', 1000)]
+
+    def truncated(self, entity, query):
+        """
+        Проверяет, нашлось ли больше SEARCH_MAX_RESULTS объектов (лишние не показываются).
+        """
+        grams = self._grams(query)
+        if not grams:
+            return False
+        limit = _setting('SEARCH_MAX_RESULTS', 1000)
+        if not self._candidates(entity, grams)[limit:limit + 1].exists():
+            return False
+        logger.info(f"Поиск {entity} '{query}': найдено больше {limit} объектов, показаны первые {limit}")
+        return True
+
+    def filter(self, entity, queryset, query):
+        from .models import SearchTrigram
+
+        grams = self._grams(query)
+        if not grams:
+            return queryset.annotate(search_rank=Value(0, output_field=IntegerField()))
+        rank = (
+            SearchTrigram.objects.filter(entity=entity, trigram__in=grams, object_id=OuterRef('pk'))
+            .values('object_id')
+            .annotate(score=Sum('weight'))
+            .values('score')
+        )
+        return queryset.filter(pk__in=self.matches(entity, grams).values('object_id')).annotate(
+            search_rank=Subquery(rank, output_field=IntegerField())
+        )
+
+    def _index_rows(self, entity, rows, fields_entity=None):
+        from .models import SearchTrigram
+
+        objects = []
+        for values in rows:
+            for gram, weight in document_trigrams(fields_entity or entity, values).items():
+                objects.append(SearchTrigram(entity=entity, object_id=values['pk'], trigram=gram, weight=weight))
+        SearchTrigram.objects.bulk_create(objects, batch_size=_setting('SEARCH_INSERT_BATCH_SIZE', 5000))
+        return len(objects)
+
+    def _values(self, entity, queryset):
+        return queryset.values('pk', *ENTITIES[entity]['fields'])
+
+    def update(self, entity, ids):
+        """
+        Переиндексирует объекты: удаляет их триграммы и записывает заново.
+        """
+        from .models import SearchTrigram
+
+        ids = list(ids)
+        if not ids:
+            return
+        rows = self._values(entity, get_model(entity).objects.filter(pk__in=ids))
+        with transaction.atomic():
+            SearchTrigram.objects.filter(entity=entity, object_id__in=ids).delete()
+            self._index_rows(entity, rows)
+
+    def remove(self, entity, ids):
+        from .models import SearchTrigram
+
+        SearchTrigram.objects.filter(entity=entity, object_id__in=list(ids)).delete()
+
+    def rebuild(self, entity, batch_size=5000, progress=None):
+        """
+        Перестраивает индекс типа объектов пачками по первичному ключу.
+
+        Новый индекс строится под служебным типом '~<entity>' и заменяет старый
+        одной транзакцией, поэтому во время перестроения поиск работает по
+        старому индексу. Изменения объектов, проиндексированных в новый индекс
+        до замены, попадут в него при следующем сохранении объекта.
+
+        Returns:
+            int: Количество проиндексированных объектов.
+        """
+        from .models import SearchTrigram
+
+        staging = f'~{entity}'
+        SearchTrigram.objects.filter(entity=staging).delete()  # Остатки прерванного перестроения
+        model = get_model(entity)
+        indexed = 0
+        last_id = 0
+        while True:
+            rows = list(self._values(entity, model.objects.filter(pk__gt=last_id).order_by('pk'))[:batch_size])
+            if not rows:
+                break
+            with transaction.atomic():
+                self._index_rows(staging, rows, entity)
+            indexed += len(rows)
+            last_id = rows[-1]['pk']
+            if progress:
+                progress(entity, indexed)
+        with transaction.atomic():
+            SearchTrigram.objects.filter(entity=entity).delete()
+            SearchTrigram.objects.filter(entity=staging).update(entity=entity)
+        update_statistics()
+        return indexed
+
+
+class SQLServerFullTextBackend(SearchBackend):
+    """
+    Поиск по полнотекстовым индексам SQL Server (CONTAINSTABLE).
+
+    Индексы создаются командой rebuild_search_index и обновляются самим
+    SQL Server (CHANGE_TRACKING AUTO), поэтому update() и remove() ничего не делают.
+    Слова запроса ищутся как префиксы: "лабр*" AND "голд*".
+    """
+    name = 'fulltext'
+    catalog = 'dogs_search'
+
+    def _indexed_columns(self, entity):
+        """
+        Возвращает [(столбец, вес)] собственных полей модели для полнотекстового индекса.
+        """
+        fields = ENTITIES[entity]['fields']
+        model = get_model(entity)
+        return [(model._meta.get_field(field).column, weight) for field, weight in fields.items() if '__' not in field]
+
+    def _contains_query(self, query):
+        words = _WORD_RE.findall(normalize(query))
+        if not words:
+            return None
+        return ' AND '.join(f'"{word}*"' for word in words[:_setting('SEARCH_MAX_QUERY_WORDS', 8)])
+
+    def _ranked_sql(self, entity, contains):
+        """
+        Возвращает (sql, params) подзапроса (id, score) с весами полей.
+        """
+        model = get_model(entity)
+        table = connection.ops.quote_name(model._meta.db_table)
+        parts, params = [], []
+        for column, weight in self._indexed_columns(entity):
+            parts.append(f'SELECT [KEY] AS id, [RANK] * %s AS score FROM CONTAINSTABLE({table}, {connection.ops.quote_name(column)}, %s)')
+            params += [weight, contains]
+        if entity == 'dog':
+            # Совпадения в породе и имени владельца засчитываются собакам этой породы и владельца
+            fields = ENTITIES['dog']['fields']
+            for relation, related_entity, column in (('breed', 'breed', 'name'), ('owner', 'user', 'username')):
+                related_table = connection.ops.quote_name(get_model(related_entity)._meta.db_table)
+                fk = connection.ops.quote_name(model._meta.get_field(relation).column)
+                parts.append(
+                    f'SELECT d.id, r.[RANK] * %s AS score FROM CONTAINSTABLE({related_table}, {column}, %s) r '
+                    f'JOIN {table} d ON d.{fk} = r.[KEY]'
+                )
+                params += [fields[f'{relation}__{column}'], contains]
+        return ' UNION ALL '.join(parts), params
+
+    def filter(self, entity, queryset, query):
+        contains = self._contains_query(query)
+        if contains is None:
+            return queryset.annotate(search_rank=Value(0, output_field=IntegerField()))
+        sql, params = self._ranked_sql(entity, contains)
+        table = connection.ops.quote_name(get_model(entity)._meta.db_table)
+        return queryset.filter(pk__in=RawSQL(f'SELECT id FROM ({sql}) s', params)).annotate(
+            search_rank=RawSQL(f'(SELECT SUM(score) FROM ({sql}) s WHERE s.id = {table}.[id])', params)
+        )
+
+    def rebuild(self, entity, batch_size=5000, progress=None):
+        """
+        Создает полнотекстовый каталог и индекс таблицы, если их нет, и запускает полное заполнение.
+        """
+        model = get_model(entity)
+        table = model._meta.db_table
+        language = _setting('SEARCH_FULLTEXT_LANGUAGE', 1049)  # Русский
+        columns = ', '.join(f'{connection.ops.quote_name(column)} LANGUAGE {language}' for column, _ in self._indexed_columns(entity))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"IF NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = '{self.catalog}') "
+                f"CREATE FULLTEXT CATALOG {self.catalog}"
+            )
+            cursor.execute('SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID(%s) AND is_primary_key = 1', [table])
+            key_index = cursor.fetchone()[0]
+            cursor.execute('SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID(%s)', [table])
+            if cursor.fetchone():
+                cursor.execute(f'ALTER FULLTEXT INDEX ON {connection.ops.quote_name(table)} START FULL POPULATION')
+            else:
+                cursor.execute(
+                    f'CREATE FULLTEXT INDEX ON {connection.ops.quote_name(table)} ({columns}) '
+                    f'KEY INDEX {connection.ops.quote_name(key_index)} ON {self.catalog} WITH CHANGE_TRACKING AUTO'
+                )
+        count = model.objects.count()
+        if progress:
+            progress(entity, count)
+        return count
+
+
+def update_statistics():
+    """
+    Обновляет статистику таблицы индекса, чтобы планировщик выбирал search_trigram_idx.
+
+    После массовой загрузки без статистики СУБД может предпочесть полный просмотр индекса.
+    """
+    from .models import SearchTrigram
+
+    table = connection.ops.quote_name(SearchTrigram._meta.db_table)
+    statements = {
+        'microsoft': f'UPDATE STATISTICS {table}',
+        'postgresql': f'ANALYZE {table}',
+        'sqlite': f'ANALYZE {table}',
+    }
+    if connection.vendor not in statements:
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(statements[connection.vendor])
+    except Exception as e:
+        logger.warning(f"Не удалось обновить статистику {table}: {e}")
+
+
+_backend = None
+
+
+def get_backend():
+    """
+    Возвращает экземпляр бэкенда из настройки SEARCH_BACKEND.
+    """
+    global _backend
+    path = _setting('SEARCH_BACKEND', 'dogs.search.TrigramBackend')
+    if _backend is None or _backend.__class__.__module__ + '.' + _backend.__class__.__name__ != path:
+        _backend = import_string(path)()
+    return _backend
+
+
+def search(entity, queryset, query):
+    """
+    Фильтрует QuerySet по поисковому запросу и добавляет аннотацию search_rank.
+
+    Args:
+        entity (str): 'dog', 'breed' или 'user'.
+        queryset (QuerySet): QuerySet модели этого типа.
+        query (str): Поисковый запрос.
+    """
+    return get_backend().filter(entity, queryset, query)
+
+
+def truncated(entity, query):
+    """
+    Проверяет, обрезаны ли результаты поиска лимитом SEARCH_MAX_RESULTS.
+    """
+    try:
+        return get_backend().truncated(entity, query)
+    except Exception as e:
+        logger.error(f"Не удалось проверить число результатов поиска {entity} '{query}': {e}")
+        return False
+
+
+def index_objects(entity, ids):
+    """
+    Обновляет индекс для объектов; ошибки индексации не мешают сохранению объекта.
+    """
+    try:
+        get_backend().update(entity, ids)
+    except Exception as e:
+        logger.error(f"Не удалось обновить поисковый индекс {entity} {list(ids)}: {e}")
+
+
+def unindex_objects(entity, ids):
+    try:
+        get_backend().remove(entity, ids)
+    except Exception as e:
+        logger.error(f"Не удалось удалить объекты {entity} {list(ids)} из поискового индекса: {e}")
+
+
+def reindex_related_dogs(relation, related_id, batch_size=1000):
+    """
+    Переиндексирует собак породы или владельца после изменения названия породы или имени владельца.
+
+    Сигналы вызывают ее через transaction.on_commit, чтобы переиндексация многих
+    собак не удлиняла транзакцию сохранения породы или пользователя.
+    """
+    from .models import Dog
+
+    ids = Dog.objects.filter(**{relation: related_id}).values_list('pk', flat=True).order_by('pk')
+    last_id = 0
+    while True:
+        batch = list(ids.filter(pk__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        index_objects('dog', batch)
+        last_id = batch[-1]
@@ -0,0 +1,205 @@
+# dogs/shared_index.py
+"""
+Индексы в памяти процесса, общие для всех воркеров через кэш.
+
+Каждый воркер держит свою копию индекса и отвечает на запросы без обращений
+к БД. Общее состояние хранится в кэше:
+    <prefix>:snapshot - снимок индекса и номер последнего учтенного изменения;
+    <prefix>:seq - номер последнего изменения;
+    <prefix>:journal:<n> - изменение n.
+
+Изменения записываются в журнал после фиксации транзакции (record()).
+Воркер не чаще раза в sync_seconds сверяет номер изменения с кэшем
+и применяет новые изменения к своей копии. Если снимка в кэше нет,
+индекс строится из БД и сохраняется в кэш для остальных воркеров;
+каждые snapshot_every изменений снимок обновляется.
+
+Используется автодополнением (dogs/autocomplete.py) и фасетами (dogs/facets.py).
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+class SharedIndex:
+    """
+    Базовый класс индекса, синхронизируемого через снимок и журнал в кэше.
+
+    Наследники реализуют:
+        build(): Строит состояние индекса из БД.
+        restore(state): Создает структуру в памяти из состояния снимка.
+        dump(): Возвращает состояние для снимка.
+        apply(events): Применяет изменения к структуре в памяти.
+        publish(): Делает примененные изменения видимыми запросам (необязательно;
+            вызывается после применения журнала под блокировкой синхронизации).
+    """
+    key_prefix = None
+    settings_prefix = None  # Префикс настроек, например AUTOCOMPLETE -> AUTOCOMPLETE_SYNC_SECONDS
+
+    def __init__(self):
+        self.loaded = False
+        self.seq = 0
+        self.checked_at = 0.0
+        self.stalled_since = None
+        self.lock = threading.Lock()
+
+    # --- Методы наследников ---
+
+    def build(self):
+        raise NotImplementedError
+
+    def restore(self, state):
+        raise NotImplementedError
+
+    def dump(self):
+        raise NotImplementedError
+
+    def apply(self, events):
+        raise NotImplementedError
+
+    def publish(self):
+        pass
+
+    # --- Синхронизация ---
+
+    def setting(self, name, default):
+        return getattr(settings, f'{self.settings_prefix}_{name}', default)
+
+    def key(self, suffix):
+        return f'{self.key_prefix}:{suffix}'
+
+    def _store_snapshot(self, state, seq):
+        timeout = self.setting('SNAPSHOT_SECONDS', 24 * 60 * 60)
+        cache.set(self.key('snapshot'), {'seq': seq, 'state': state}, timeout)
+        cache.set(self.key('snapshot_seq'), seq, timeout)
+
+    def _load(self):
+        """
+        Загружает индекс из снимка в кэше или строит его из БД и сохраняет снимок.
+        """
+        snapshot = cache.get(self.key('snapshot'))
+        if snapshot is None:
+            # Номер читается до запроса к БД: изменения во время построения будут применены повторно
+            seq = cache.get(self.key('seq')) or 0
+            state = self.build()
+            self._store_snapshot(state, seq)
+            snapshot = {'seq': seq, 'state': state}
+        self.restore(snapshot['state'])
+        self.seq = snapshot['seq']
+        self.loaded = True
+
+    def _apply_journal(self, current_seq):
+        """
+        Применяет изменения с self.seq + 1 по current_seq.
+        """
+        if current_seq - self.seq > self.setting('MAX_REPLAY', 1000):
+            self._load()
+        keys = [self.key(f'journal:{seq}') for seq in range(self.seq + 1, current_seq + 1)]
+        journal = cache.get_many(keys)
+        for key in keys:
+            events = journal.get(key)
+            if events is None:
+                # Изменение еще не записано или уже вытеснено из кэша
+                if (cache.get(self.key('snapshot_seq')) or 0) > self.seq:
+                    self._load()
+                    return
+                if self.stalled_since is None:
+                    self.stalled_since = time.monotonic()
+                    return
+                if time.monotonic() - self.stalled_since < self.setting('STALL_SECONDS', 5):
+                    return
+                events = []  # Запись изменения потеряна: пропускаем ее
+            self.apply(events)
+            self.seq += 1
+            self.stalled_since = None
+
+        # Периодически сохраняем снимок, чтобы новые воркеры не применяли длинный журнал
+        if self.seq - (cache.get(self.key('snapshot_seq')) or 0) >= self.setting('SNAPSHOT_EVERY', 200):
+            if cache.add(self.key('snapshot_lock'), 1, timeout=60):
+                self._store_snapshot(self.dump(), self.seq)
+                cache.delete(self.key('snapshot_lock'))
+
+    def sync(self):
+        """
+        Загружает индекс при первом обращении и применяет новые изменения из журнала.
+
+        Между проверками проходит не меньше SYNC_SECONDS, поэтому большинство
+        обращений не затрагивает ни БД, ни кэш.
+        """
+        now = time.monotonic()
+        sync_seconds = self.setting('SYNC_SECONDS', 1)
+        if self.loaded and now - self.checked_at < sync_seconds:
+            return
+        with self.lock:
+            if self.loaded and now - self.checked_at < sync_seconds:
+                return
+            self.checked_at = now
+            try:
+                if not self.loaded:
+                    self._load()
+                current_seq = cache.get(self.key('seq')) or 0
+                if current_seq > self.seq:
+                    self._apply_journal(current_seq)
+            except Exception as e:
+                logger.warning(f"Не удалось синхронизировать индекс {self.key_prefix} с кэшем: {e}")
+                if not self.loaded:
+                    self.restore(self.build())
+                    self.loaded = True
+            self.publish()
+
+    def reset(self):
+        """
+        Забывает состояние воркера: следующее обращение загрузит индекс заново.
+        """
+        self.loaded = False
+        self.seq = 0
+        self.checked_at = 0.0
+        self.stalled_since = None
+
+    def warm(self):
+        """
+        Загружает индекс при старте воркера, чтобы первый запрос не ждал построения.
+        """
+        try:
+            self.sync()
+        except Exception as e:
+            logger.warning(f"Не удалось построить индекс {self.key_prefix}: {e}")
+
+    def record(self, events):
+        """
+        Записывает изменения в журнал после фиксации транзакции.
+
+        Args:
+            events (list | callable): Изменения или функция, которая вернет их
+                после фиксации (например, чтобы прочитать уже сохраненные данные).
+
+        Returns:
+            Обработчик, переданный в transaction.on_commit, или None.
+        """
+        def write():
+            changes = events() if callable(events) else events
+            if changes:
+                self.write_journal(changes)
+
+        if events:
+            transaction.on_commit(write)
+            return write
+        return None
+
+    def write_journal(self, changes):
+        """
+        Сразу записывает изменения в журнал (для вызова из своего обработчика on_commit).
+        """
+        try:
+            cache.add(self.key('seq'), 0, timeout=None)
+            seq = cache.incr(self.key('seq'))
+            cache.set(self.key(f'journal:{seq}'), changes, self.setting('SNAPSHOT_SECONDS', 24 * 60 * 60))
+        except Exception as e:
+            logger.warning(f"Не удалось записать изменение индекса {self.key_prefix}: {e}")
+        self.checked_at = 0.0  # Этот воркер увидит изменение при следующем обращении
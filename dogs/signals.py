@@ -0,0 +1,355 @@
+# dogs/signals.py
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import autocomplete, duplicates, facets, featured, images, page_cache, ratings, search, storage
+from .models import Breed, Dog, Pedigree, Review, User
+
+
+@receiver(pre_save, sender=Dog)
+def remember_previous_breed(sender, instance, **kwargs):
+    """
+    Запоминает породу, кличку и фотографию собаки до сохранения.
+
+    Порода нужна, чтобы при смене породы убрать собаку из резервуара старой породы
+    и перенести ее агрегаты отзывов, кличка - чтобы обновить автодополнение,
+    фотография - чтобы освободить ссылку на старый файл.
+    """
+    instance._previous_breed_id = None
+    instance._previous_name = None
+    instance._previous_image = None
+    if instance.pk:
+        previous = Dog.objects.filter(pk=instance.pk).values_list('breed_id', 'name', 'image').first()
+        if previous:
+            instance._previous_breed_id, instance._previous_name, instance._previous_image = previous
+
+
+@receiver(pre_save, sender=Dog)
+def update_image_hashes(sender, instance, update_fields=None, **kwargs):
+    """
+    Считает перцептивные хэши новой фотографии собаки (dogs/duplicates.py).
+    """
+    instance._hashes_changed = False
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    duplicates.update_hashes(instance, instance._previous_image)
+
+
+@receiver(post_save, sender=Dog)
+def update_featured_on_save(sender, instance, created, **kwargs):
+    """
+    Обновляет резервуары случайных собак при добавлении собаки или смене породы.
+
+    При смене породы переносит агрегаты отзывов собаки на новую породу.
+    """
+    previous_breed_id = getattr(instance, '_previous_breed_id', None)
+    if created or previous_breed_id is None:
+        featured.dog_added(instance.breed_id, instance.pk)
+    elif previous_breed_id != instance.breed_id:
+        featured.dog_removed(previous_breed_id, instance.pk)
+        featured.dog_added(instance.breed_id, instance.pk)
+        ratings.move_dog(instance.pk, previous_breed_id, instance.breed_id)
+
+
+@receiver(post_delete, sender=Dog)
+def update_featured_on_delete(sender, instance, **kwargs):
+    """
+    Убирает удаленную собаку из резервуара ее породы и вычитает ее отзывы из агрегатов породы.
+    """
+    featured.dog_removed(instance.breed_id, instance.pk)
+    ratings.dog_deleted(instance)
+
+
+def _touches_indexed_fields(entity, update_fields):
+    """
+    Проверяет, могли ли измениться индексируемые поля (save(update_fields=...) их не трогает).
+    """
+    if update_fields is None:
+        return True
+    return any(field.split('__')[0] in update_fields for field in search.ENTITIES[entity]['fields'])
+
+
+@receiver(post_save, sender=Dog)
+def index_dog(sender, instance, update_fields=None, **kwargs):
+    """
+    Обновляет поисковый индекс собаки.
+    """
+    if _touches_indexed_fields('dog', update_fields):
+        search.index_objects('dog', [instance.pk])
+
+
+@receiver(post_delete, sender=Dog)
+def unindex_dog(sender, instance, **kwargs):
+    search.unindex_objects('dog', [instance.pk])
+
+
+@receiver(pre_save, sender=Breed)
+def remember_previous_breed_name(sender, instance, **kwargs):
+    """
+    Запоминает название и изображение породы до сохранения.
+
+    Название нужно, чтобы переиндексировать собак породы при переименовании,
+    изображение - чтобы освободить ссылку на старый файл.
+    """
+    instance._previous_name = None
+    instance._previous_image = None
+    if instance.pk:
+        previous = Breed.objects.filter(pk=instance.pk).values_list('name', 'image').first()
+        if previous:
+            instance._previous_name, instance._previous_image = previous
+
+
+@receiver(post_save, sender=Breed)
+def index_breed(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Обновляет поисковый индекс породы, а при переименовании - и ее собак.
+    """
+    if not _touches_indexed_fields('breed', update_fields):
+        return
+    search.index_objects('breed', [instance.pk])
+    if not created and getattr(instance, '_previous_name', None) != instance.name:
+        transaction.on_commit(partial(search.reindex_related_dogs, 'breed_id', instance.pk))
+
+
+@receiver(post_delete, sender=Breed)
+def unindex_breed(sender, instance, **kwargs):
+    search.unindex_objects('breed', [instance.pk])
+
+
+@receiver(pre_save, sender=User)
+def remember_previous_username(sender, instance, update_fields=None, **kwargs):
+    """
+    Запоминает имя и город пользователя до сохранения.
+
+    Имя нужно, чтобы переиндексировать его собак при смене имени,
+    город - чтобы обновить фасет города у его собак.
+    """
+    instance._previous_username = None
+    instance._previous_city = None
+    if instance.pk and (_touches_indexed_fields('user', update_fields) or 'city' in update_fields):
+        previous = User.objects.filter(pk=instance.pk).values_list('username', 'city').first()
+        if previous:
+            instance._previous_username, instance._previous_city = previous
+
+
+@receiver(post_save, sender=User)
+def index_user(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Обновляет поисковый индекс пользователя, а при смене имени - и его собак.
+
+    Сохранения, не затрагивающие индексируемые поля (например, last_login при входе), пропускаются.
+    """
+    if not _touches_indexed_fields('user', update_fields):
+        return
+    search.index_objects('user', [instance.pk])
+    if not created and getattr(instance, '_previous_username', None) != instance.username:
+        transaction.on_commit(partial(search.reindex_related_dogs, 'owner_id', instance.pk))
+
+
+@receiver(pre_delete, sender=User)
+def remember_owned_dogs(sender, instance, **kwargs):
+    """
+    Запоминает собак пользователя: после удаления у них обнуляется владелец без сигналов.
+    """
+    instance._owned_dog_ids = list(Dog.objects.filter(owner_id=instance.pk).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def unindex_user(sender, instance, **kwargs):
+    search.unindex_objects('user', [instance.pk])
+    search.index_objects('dog', getattr(instance, '_owned_dog_ids', []))
+    facets.record_dogs(getattr(instance, '_owned_dog_ids', []))
+
+
+@receiver(post_save, sender=Dog)
+def update_autocomplete_on_dog_save(sender, instance, created, **kwargs):
+    """
+    Добавляет кличку новой собаки в автодополнение или заменяет старую кличку новой.
+    """
+    previous_name = getattr(instance, '_previous_name', None)
+    if created or previous_name is None:
+        autocomplete.record_change([('add', autocomplete.KIND_DOG, instance.name)])
+    elif previous_name != instance.name:
+        autocomplete.record_change([
+            ('remove', autocomplete.KIND_DOG, previous_name),
+            ('add', autocomplete.KIND_DOG, instance.name),
+        ])
+
+
+@receiver(post_delete, sender=Dog)
+def update_autocomplete_on_dog_delete(sender, instance, **kwargs):
+    autocomplete.record_change([('remove', autocomplete.KIND_DOG, instance.name)])
+
+
+@receiver(post_save, sender=Breed)
+def update_autocomplete_on_breed_save(sender, instance, created, **kwargs):
+    """
+    Добавляет новую породу в автодополнение или заменяет старое название новым.
+    """
+    previous_name = getattr(instance, '_previous_name', None)
+    if created or previous_name is None:
+        autocomplete.record_change([('add', autocomplete.KIND_BREED, instance.name, instance.slug)])
+    elif previous_name != instance.name:
+        autocomplete.record_change([
+            ('remove', autocomplete.KIND_BREED, previous_name),
+            ('add', autocomplete.KIND_BREED, instance.name, instance.slug),
+        ])
+
+
+@receiver(post_delete, sender=Breed)
+def update_autocomplete_on_breed_delete(sender, instance, **kwargs):
+    autocomplete.record_change([('remove', autocomplete.KIND_BREED, instance.name)])
+
+
+@receiver(post_save, sender=Dog)
+@receiver(post_delete, sender=Dog)
+def update_facets_on_dog_change(sender, instance, **kwargs):
+    """
+    Обновляет фасеты собаки (значения читаются из БД после фиксации транзакции).
+    """
+    facets.record_dogs([instance.pk])
+
+
+@receiver(post_save, sender=Pedigree)
+@receiver(post_delete, sender=Pedigree)
+def update_facets_on_pedigree_change(sender, instance, **kwargs):
+    facets.record_dogs([instance.dog_id])
+
+
+@receiver(post_save, sender=Pedigree)
+@receiver(post_delete, sender=Pedigree)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def touch_dog_on_related_change(sender, instance, **kwargs):
+    """
+    Обновляет updated_at собаки при изменении ее родословной или отзыва.
+
+    updated_at - версия страницы собаки (dogs/conditional.py) и ее карточки
+    в кэше фрагментов (dogs/cards.py).
+    """
+    Dog.objects.filter(pk=instance.dog_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Dog)
+@receiver(post_delete, sender=Dog)
+def purge_pages_on_dog_change(sender, instance, **kwargs):
+    """
+    Сбрасывает закэшированные страницы собаки и ее породы (старой и новой, dogs/page_cache.py).
+    """
+    tags = {f'dog:{instance.pk}', f'breed:{instance.breed_id}'}
+    if getattr(instance, '_previous_breed_id', None):
+        tags.add(f'breed:{instance._previous_breed_id}')
+    page_cache.purge(*tags)
+
+
+@receiver(post_save, sender=Breed)
+@receiver(post_delete, sender=Breed)
+def purge_pages_on_breed_change(sender, instance, **kwargs):
+    page_cache.purge(f'breed:{instance.pk}', 'breeds')
+
+
+@receiver(post_save, sender=Pedigree)
+@receiver(post_delete, sender=Pedigree)
+def purge_pages_on_pedigree_change(sender, instance, **kwargs):
+    page_cache.purge(f'dog:{instance.dog_id}')
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def purge_pages_on_review_change(sender, instance, **kwargs):
+    """
+    Сбрасывает страницы собаки и ее породы: отзыв меняет рейтинг породы в списке пород.
+    """
+    breed_ids = Dog.objects.filter(pk=instance.dog_id).values_list('breed_id', flat=True)
+    page_cache.purge(f'dog:{instance.dog_id}', *(f'breed:{breed_id}' for breed_id in breed_ids))
+
+
+@receiver(post_save, sender=User)
+def update_facets_on_city_change(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Обновляет фасет города у собак пользователя при смене города.
+    """
+    if created or (update_fields is not None and 'city' not in update_fields):
+        return
+    if getattr(instance, '_previous_city', None) != instance.city:
+        facets.record_dogs(Dog.objects.filter(owner_id=instance.pk).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Breed)
+def update_facets_on_breed_save(sender, instance, created, **kwargs):
+    """
+    Обновляет подпись породы в фасетах при создании и переименовании.
+    """
+    if created or getattr(instance, '_previous_name', None) != instance.name:
+        facets.record_label('breed', instance.pk, instance.name)
+
+
+@receiver(post_save, sender=Dog)
+@receiver(post_save, sender=Breed)
+def queue_image_derivatives(sender, instance, created, **kwargs):
+    """
+    Ставит новое изображение собаки или породы в очередь на создание уменьшенных копий
+    (их создает команда generate_image_derivatives) и удаляет копии замененного изображения.
+    """
+    previous_image = getattr(instance, '_previous_image', None) or ''
+    current_image = instance.image.name or ''
+    if created or previous_image == current_image:
+        return
+    if instance.image_derivatives is not False:
+        sender.objects.filter(pk=instance.pk).update(image_derivatives=False)
+        instance.image_derivatives = False
+    if previous_image:
+        images.delete_unused_after_commit(previous_image)
+
+
+@receiver(post_delete, sender=Dog)
+@receiver(post_delete, sender=Breed)
+def delete_image_derivatives(sender, instance, **kwargs):
+    if instance.image:
+        images.delete_unused_after_commit(instance.image.name)
+
+
+@receiver(post_save, sender=Dog)
+@receiver(post_save, sender=Breed)
+def update_image_references_on_save(sender, instance, **kwargs):
+    """
+    Учитывает ссылку на новый файл изображения и освобождает ссылку на замененный.
+    """
+    previous_image = getattr(instance, '_previous_image', None) or ''
+    current_image = instance.image.name or ''
+    if previous_image != current_image:
+        storage.add_reference(current_image)
+        storage.release_reference(previous_image)
+
+
+@receiver(post_delete, sender=Dog)
+@receiver(post_delete, sender=Breed)
+def update_image_references_on_delete(sender, instance, **kwargs):
+    if instance.image:
+        storage.release_reference(instance.image.name)
+
+
+@receiver(post_save, sender=Dog)
+def update_duplicates_on_save(sender, instance, update_fields=None, **kwargs):
+    """
+    Записывает новые хэши фотографии в индекс и обновляет пары похожих собак.
+    """
+    if not getattr(instance, '_hashes_changed', False):
+        return
+    if update_fields is not None and 'image_phash' not in update_fields:
+        # save(update_fields=['image', ...]) не записал хэши
+        Dog.objects.filter(pk=instance.pk).update(
+            image_dhash=instance.image_dhash, image_phash=instance.image_phash,
+            image_hash_failed=instance.image_hash_failed,
+        )
+    duplicates.record_dog(instance)
+
+
+@receiver(post_delete, sender=Dog)
+def update_duplicates_on_delete(sender, instance, **kwargs):
+    if instance.image_phash is not None:
+        duplicates.record_removal(instance.pk)
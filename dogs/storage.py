@@ -0,0 +1,169 @@
+# dogs/storage.py
+"""
+Хранилище изображений собак и пород по хэшу содержимого.
+
+Файл сохраняется под именем из SHA-256 его содержимого в каталогах,
+разбитых по первым символам хэша:
+    media/cas/ab/cd/abcd...ef.jpg
+
+Повторная загрузка того же файла ничего не записывает: имя уже существует,
+и поле модели просто ссылается на него. Количество ссылок на каждый файл
+хранится в MediaBlob и меняется сигналами Dog и Breed (dogs/signals.py).
+Файлы без ссылок не удаляются сразу (ссылку на тот же файл может
+сохранять параллельный запрос): их удаляет команда reclaim_media.
+
+Существующие файлы переводятся в это хранилище командой fold_media.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+CAS_DIR = 'cas'
+CHUNK_SIZE = 64 * 1024
+
+
+def content_name(digest, extension):
+    """
+    Возвращает имя файла в хранилище для хэша содержимого.
+    """
+    return posixpath.join(CAS_DIR, digest[:2], digest[2:4], f'{digest}{extension.lower()}')
+
+
+def file_digest(file):
+    """
+    Возвращает SHA-256 открытого файла, читая его частями.
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage, который именует файлы хэшем содержимого.
+
+    Каталог из upload_to и исходное имя файла не используются (кроме расширения),
+    поэтому одинаковые изображения собак и пород хранятся в одном экземпляре.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым в _save, подбирать свободное имя не нужно
+        return name
+
+    def _save(self, name, content):
+        """
+        Записывает содержимое во временный файл, одновременно считая хэш,
+        и переносит его под именем из хэша. Если такой файл уже есть,
+        временный файл удаляется, а у существующего обновляется время
+        изменения (чтобы reclaim_media не удалил его как давно неиспользуемый).
+        """
+        extension = os.path.splitext(name)[1]
+        os.makedirs(self.path(CAS_DIR), exist_ok=True)
+        digest = hashlib.sha256()
+        descriptor, temporary = tempfile.mkstemp(dir=self.path(CAS_DIR), suffix='.upload')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks(CHUNK_SIZE):
+                    digest.update(chunk)
+                    file.write(chunk)
+            stored_name = content_name(digest.hexdigest(), extension)
+            full_path = self.path(stored_name)
+            if os.path.exists(full_path):
+                os.utime(full_path)
+                os.remove(temporary)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temporary, self.file_permissions_mode)
+                os.replace(temporary, full_path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return stored_name
+
+
+def image_storage():
+    """
+    Хранилище полей Dog.image и Breed.image (вызывается при загрузке моделей).
+    """
+    return ContentAddressedStorage()
+
+
+def is_content_addressed(name):
+    return bool(name) and name.startswith(CAS_DIR + '/')
+
+
+def add_reference(name):
+    """
+    Увеличивает количество ссылок на файл хранилища.
+    """
+    from .models import MediaBlob
+
+    if not is_content_addressed(name):
+        return
+    updated = MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+    if not updated:
+        blob, created = MediaBlob.objects.get_or_create(name=name, defaults={'ref_count': 1, 'size': _size(name)})
+        if not created:
+            MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+
+
+def release_reference(name):
+    """
+    Уменьшает количество ссылок на файл. Файл без ссылок удаляется позже командой reclaim_media.
+    """
+    from .models import MediaBlob
+
+    if not is_content_addressed(name):
+        return
+    MediaBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1, updated_at=timezone.now())
+
+
+def _size(name):
+    try:
+        return image_storage().size(name)
+    except OSError:
+        return 0
+
+
+def recount_references():
+    """
+    Пересчитывает количество ссылок всех файлов хранилища по полям Dog.image и Breed.image.
+
+    Returns:
+        int: Количество файлов, на которые есть ссылки.
+    """
+    from .models import Breed, Dog, MediaBlob
+
+    counts = {}
+    for model in (Dog, Breed):
+        rows = (
+            model.objects.filter(image__startswith=CAS_DIR + '/')
+            .values('image').annotate(count=Count('pk')).order_by()
+        )
+        for row in rows:
+            counts[row['image']] = counts.get(row['image'], 0) + row['count']
+
+    with transaction.atomic():
+        MediaBlob.objects.update(ref_count=0)
+        existing = set(MediaBlob.objects.values_list('name', flat=True).iterator())
+        for name, count in counts.items():
+            if name in existing:
+                MediaBlob.objects.filter(name=name).update(ref_count=count)
+        MediaBlob.objects.bulk_create(
+            [MediaBlob(name=name, ref_count=count, size=_size(name)) for name, count in counts.items() if name not in existing],
+            batch_size=1000,
+        )
+    return len(counts)
@@ -0,0 +1,103 @@
+# dogs/templatetags/dog_cards.py
+from django import template
+from django.middleware.csrf import get_token
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+
+def _csrf_input(request):
+    return format_html('<input type="hidden" name="csrfmiddlewaretoken" value="{}">', get_token(request))
+
+
+def _owner_note(dog):
+    if not dog.owner_id:
+        return ''
+    return format_html('<p class="text-info">Собака принадлежит пользователю: {}</p>', dog.owner.username)
+
+
+def _add_to_profile_form(dog, csrf_input):
+    return format_html(
+        '<form method="post" action="{}">{}<button type="submit" class="btn btn-success">Добавить в профиль</button></form>',
+        reverse('dogs:add_to_profile', kwargs={'dog_id': dog.pk}), csrf_input,
+    )
+
+
+def _controls(dog, user, csrf_input):
+    """
+    Кнопки администратора и отметки владельца под карточкой.
+    """
+    if not user.is_authenticated:
+        return ''
+    if user.is_staff:
+        return format_html(
+            '<a href="{}" class="btn btn-warning">Редактировать (Администратор)</a>'
+            '<form method="post" action="{}">{}<button type="submit" class="btn btn-danger">Удалить (Администратор)</button></form>'
+            '{}{}',
+            reverse('dogs:dog_update', kwargs={'slug': dog.slug}),
+            reverse('dogs:dog_delete', kwargs={'slug': dog.slug}), csrf_input,
+            _owner_note(dog), _add_to_profile_form(dog, csrf_input),
+        )
+    if dog.owner_id == user.pk:
+        return mark_safe('<p class="text-success">В вашем профиле</p>')
+    if dog.owner_id:
+        return _owner_note(dog)
+    return _add_to_profile_form(dog, csrf_input)
+
+
+def _review_buttons(review_id, author_id, user, query):
+    if not (user.is_staff or author_id == user.pk):
+        return ''
+    return format_html(
+        '<a href="{}?{}" class="btn btn-sm btn-warning">Редактировать</a> '
+        '<a href="{}?{}" class="btn btn-sm btn-danger">Удалить</a>',
+        reverse('dogs:review_update', args=[review_id]), query,
+        reverse('dogs:review_delete', args=[review_id]), query,
+    )
+
+
+def _review_form(dog, context, csrf_input):
+    if not context['user'].is_authenticated:
+        return mark_safe('<p>Пожалуйста, войдите, чтобы оставить отзыв.</p>')
+    # Форма одна для всех карточек страницы, поэтому рендерится один раз
+    form_html = context.render_context.get('dog_card_review_form')
+    if form_html is None:
+        form_html = context.render_context['dog_card_review_form'] = context['review_form'].as_p()
+    return format_html(
+        '<form method="post" action="{}?{}">{}<input type="hidden" name="dog_id" value="{}">{}'
+        '<button type="submit" class="btn btn-primary">Отправить отзыв</button></form>',
+        reverse('dogs:dogs_list'), context['card_query'], csrf_input, dog.pk, form_html,
+    )
+
+
+@register.simple_tag(takes_context=True)
+def dog_card(context, dog):
+    """
+    Выводит карточку собаки: общую часть из кэша (dogs/cards.py) и слой зрителя.
+
+    Пример:
+        {% load dog_cards %}
+        {% for dog in page_obj %}{% dog_card dog %}{% endfor %}
+
+    Представление заранее заполняет dog.card (dogs.cards.attach_cards) и передает
+    в контекст review_form и card_query (параметры page и q для ссылок отзывов).
+
+    Returns:
+        Безопасный HTML карточки.
+    """
+    parts, reviews = dog.card
+    request, user = context['request'], context['user']
+    csrf_input = _csrf_input(request)
+    query = context['card_query']
+    slots = [
+        format_html('<p class="card-text mb-2">Просмотры: {}</p>', dog.views_count),
+        _controls(dog, user, csrf_input),
+        *(_review_buttons(review_id, author_id, user, query) for review_id, author_id in reviews),
+        _review_form(dog, context, csrf_input),
+    ]
+    html = [parts[0]]
+    for slot, part in zip(slots, parts[1:]):
+        html += [slot, part]
+    return mark_safe(''.join(html))
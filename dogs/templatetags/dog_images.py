@@ -0,0 +1,51 @@
+# dogs/templatetags/dog_images.py
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from dogs import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(image, variant='card', alt='', css_class='', style='', sizes=None, lazy=True, default='dummydog.jpg'):
+    """
+    Выводит изображение как <picture> с WebP и JPEG производными варианта variant.
+
+    Пример:
+        {% load dog_images %}
+        {% picture dog.image 'card' alt=dog.name css_class='card-img-top' %}
+
+    Args:
+        image: Поле ImageField (может быть пустым).
+        variant (str): Вариант из dogs.images.VARIANTS.
+        sizes (str): Атрибут sizes; по умолчанию - ширина варианта.
+        lazy (bool): Загружать изображение, только когда оно близко к видимой области.
+        default (str): Статический файл для пустого поля.
+
+    Returns:
+        Безопасный HTML. Если производных еще нет (поле image_derivatives объекта),
+        выводится <img> с оригиналом.
+    """
+    loading = 'lazy' if lazy else 'eager'
+    if not image:
+        return format_html('<img src="{}" alt="{}" class="{}" style="{}">', static(default), alt, css_class, style)
+    # Готовность производных хранится в объекте; если поле не загружено (only()), проверяется хранилище
+    instance = getattr(image, 'instance', None)
+    ready = None
+    if instance is not None and 'image_derivatives' not in instance.get_deferred_fields():
+        ready = bool(getattr(instance, 'image_derivatives', None))
+    data = images.sources(image.name, variant, ready)
+    if data is None:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" style="{}" loading="{}">', image.url, alt, css_class, style, loading,
+        )
+    sizes = sizes or f"{data['width']}px"
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" style="{}" '
+        'loading="{}" decoding="async"></picture>',
+        data['srcset']['webp'], sizes,
+        data['src'], data['srcset']['jpg'], sizes, data['width'], data['height'], alt, css_class, style, loading,
+    )
@@ -1,3 +1,1507 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from my_project.n_plus_one import HEADER as N_PLUS_ONE_HEADER, NPlusOneTestMixin
+from users.models import User
+from PIL import Image, ImageDraw
+
+from . import autocomplete, cards, duplicates, facets, featured, images, page_cache, ratings, search, uploads, view_counter
+from .management.commands.reclaim_media import Command as ReclaimMediaCommand
+from .models import Breed, Dog, DogDuplicate, MediaBlob, Pedigree, Review, SearchTrigram
+from .views import BreedsView, DogsListView
+
+
+class DogsListViewQueryBudgetTests(TestCase):
+    """
+    Проверяет, что список собак укладывается в фиксированное число запросов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('viewer', 'viewer@example.com', 'password')
+        cls.owner = User.objects.create_user('owner', 'owner@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        cache.clear()
+        facets.shared_index.reset()
+
+    def create_dogs(self, count, reviews_per_dog):
+        breed = Breed.objects.create(name=f'Порода {Breed.objects.count()}')
+        for i in range(count):
+            dog = Dog.objects.create(
+                name=f'Собака {i}', breed=breed, age=3, owner=self.owner,
+                description='Очень длинное описание. ' * 50, image='dog_images/dog.jpg',
+            )
+            for j in range(reviews_per_dog):
+                Review.objects.create(dog=dog, user=self.user, text=f'Отзыв {j}', rating=j % 5 + 1)
+        ratings.recompute_ratings()
+
+    def get_page(self, query=''):
+        facets.shared_index.sync()  # Индекс фасетов загружается при старте воркера
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dogs:dogs_list') + query)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_page_stays_within_query_budget(self):
+        self.create_dogs(DogsListView.paginate_by * 3, reviews_per_dog=10)
+        response, query_count = self.get_page()
+        self.assertLessEqual(query_count, DogsListView.query_budget)
+        self.assertEqual(len(response.context['page_obj']), DogsListView.paginate_by)
+
+    def test_query_count_does_not_grow_with_data(self):
+        self.create_dogs(1, reviews_per_dog=1)
+        _, small_count = self.get_page()
+        self.create_dogs(DogsListView.paginate_by * 5, reviews_per_dog=20)
+        _, large_count = self.get_page('?page=2')
+        self.assertEqual(small_count, large_count)
+
+    def test_cursor_pages_cost_the_same_and_cover_all_dogs(self):
+        self.create_dogs(DogsListView.paginate_by * 4, reviews_per_dog=2)
+        seen, query_counts = [], []
+        query = '?paginate=cursor&sort=rating'
+        while query:
+            response, query_count = self.get_page(query)
+            page = response.context['page_obj']
+            seen += [dog.pk for dog in page]
+            query_counts.append(query_count)
+            query = f"?{response.context['cursor_query']}&cursor={page.next_cursor}" if page.has_next() else None
+        self.assertEqual(len(seen), DogsListView.paginate_by * 4)
+        self.assertEqual(len(set(seen)), len(seen))
+        self.assertEqual(len(set(query_counts)), 1)
+        self.assertLessEqual(query_counts[0], DogsListView.query_budget)
+
+    def test_reviews_are_capped_per_dog(self):
+        self.create_dogs(1, reviews_per_dog=10)
+        response, _ = self.get_page()
+        dog = response.context['page_obj'][0]
+        self.assertEqual(len(dog.latest_reviews), DogsListView.reviews_per_dog)
+        self.assertEqual(dog.review_count, 10)
+        self.assertLessEqual(len(dog.description_snippet), DogsListView.snippet_length + 1)
+
+
+class BreedsViewQueryBudgetTests(TestCase):
+    """
+    Проверяет, что число запросов списка пород не растет с размером каталога.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('fancier', 'fancier@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def create_breeds(self, count, dogs_per_breed):
+        start = Breed.objects.count()
+        for i in range(start, start + count):
+            breed = Breed.objects.create(name=f'Порода {i:03}')
+            for j in range(dogs_per_breed):
+                Dog.objects.create(name=f'Собака {i}-{j}', breed=breed, age=2)
+
+    def get_page(self, query=''):
+        cache.clear()  # Кэш страниц и резервуары собак строятся заново
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dogs:breeds') + query)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_data(self):
+        self.create_breeds(BreedsView.paginate_by, dogs_per_breed=2)
+        response, small_count = self.get_page()
+        self.assertEqual(len(response.context['breeds_data']), BreedsView.paginate_by)
+        self.create_breeds(BreedsView.paginate_by * 2, dogs_per_breed=6)
+        _, large_count = self.get_page('?page=2')
+        self.assertEqual(small_count, large_count)
+
+
+class ViewCounterTests(TestCase):
+    """
+    Проверяет буфер просмотров: запись только командой, одно уведомление на сотню и интервал команды.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.breed = Breed.objects.create(name='Такса')
+        cls.dog = Dog.objects.create(name='Бублик', breed=cls.breed, age=4)
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(VIEW_COUNTER_FLUSH_INTERVAL=0)
+    def test_views_are_written_only_by_flush(self):
+        for _ in range(3):
+            view_counter.record_view(self.dog.pk)
+        self.dog.refresh_from_db()
+        self.assertEqual(self.dog.views_count, 0)
+        self.assertEqual(view_counter.flush(), 3)
+        self.dog.refresh_from_db()
+        self.assertEqual((self.dog.views_count, view_counter.pending_views(self.dog.pk)), (3, 0))
+
+    def test_milestone_is_claimed_once(self):
+        self.assertFalse(view_counter.claim_milestone(self.dog.pk, 99))
+        self.assertTrue(view_counter.claim_milestone(self.dog.pk, 100))
+        self.assertFalse(view_counter.claim_milestone(self.dog.pk, 100))
+
+    @override_settings(VIEW_COUNTER_FLUSH_INTERVAL=7)
+    def test_command_loop_uses_interval_setting(self):
+        with mock.patch('dogs.management.commands.flush_view_counts.time.sleep', side_effect=KeyboardInterrupt) as sleep:
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('flush_view_counts', '--loop', stdout=io.StringIO())
+        sleep.assert_called_once_with(7)
+
+
+@override_settings(FEATURED_DOGS_ROTATE_READS=10 ** 9)
+class FeaturedDogsTests(TestCase):
+    """
+    Проверяет резервуары случайных собак пород: построение, обновление сигналами и ротацию.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('breeder', 'breeder@example.com', 'password')
+        cls.collie = Breed.objects.create(name='Колли')
+        cls.beagle = Breed.objects.create(name='Бигль')
+        for i in range(4):
+            Dog.objects.create(name=f'Колли {i}', breed=cls.collie, age=2)
+            Dog.objects.create(name=f'Бигль {i}', breed=cls.beagle, age=2)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def reservoir(self, breed):
+        return cache.get(featured._key(breed.pk))
+
+    def test_reservoir_is_built_once_and_then_read_from_cache(self):
+        breed_ids = [self.collie.pk, self.beagle.pk]
+        with CaptureQueriesContext(connection) as queries:
+            sampled = featured.sample_dog_ids(breed_ids, 3)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual({breed_id: len(ids) for breed_id, ids in sampled.items()}, dict.fromkeys(breed_ids, 3))
+        self.assertEqual(self.reservoir(self.collie)['seen'], 4)
+
+        with CaptureQueriesContext(connection) as queries:
+            featured.sample_dog_ids(breed_ids, 3)
+            dogs = featured.featured_dogs(breed_ids, 3)
+        # Только загрузка собак по первичным ключам, без сортировки в случайном порядке
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('RANDOM', queries[0]['sql'].upper())
+        self.assertEqual({dog.breed_id for dog in dogs[self.collie.pk]}, {self.collie.pk})
+
+    def test_signals_update_reservoirs(self):
+        featured.sample_dog_ids([self.collie.pk, self.beagle.pk], 3)
+        rex = Dog.objects.create(name='Рекс', breed=self.collie, age=3)
+        self.assertIn(rex.pk, self.reservoir(self.collie)['ids'])
+        self.assertEqual(self.reservoir(self.collie)['seen'], 5)
+
+        rex.breed = self.beagle
+        rex.save()
+        self.assertNotIn(rex.pk, self.reservoir(self.collie)['ids'])
+        self.assertIn(rex.pk, self.reservoir(self.beagle)['ids'])
+        self.assertEqual((self.reservoir(self.collie)['seen'], self.reservoir(self.beagle)['seen']), (4, 5))
+
+        rex.delete()
+        self.assertNotIn(rex.pk, self.reservoir(self.beagle)['ids'])
+        self.assertEqual(self.reservoir(self.beagle)['seen'], 4)
+
+    @override_settings(FEATURED_DOGS_ROTATE_READS=1)
+    def test_reservoir_is_rebuilt_after_rotation(self):
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                featured.sample_dog_ids([self.collie.pk], 3)
+            self.assertEqual(len(queries), 1)
+            self.assertIsNone(self.reservoir(self.collie))
+
+    def test_breed_pages_show_only_dogs_of_the_breed(self):
+        moved = Dog.objects.filter(breed=self.collie).first()
+        featured.sample_dog_ids([self.collie.pk, self.beagle.pk], 3)
+        moved.breed = self.beagle
+        moved.save()
+
+        response = self.client.get(reverse('dogs:breeds'))
+        shown = {item['breed'].pk: item['dogs'] for item in response.context['breeds_data']}
+        self.assertEqual(set(shown), {self.collie.pk, self.beagle.pk})
+        for breed_id, dogs in shown.items():
+            self.assertTrue(dogs)
+            self.assertEqual({dog.breed_id for dog in dogs}, {breed_id})
+
+        for breed in (self.collie, self.beagle):
+            response = self.client.get(reverse('dogs:breed_detail', kwargs={'slug': breed.slug}))
+            dog_ids = [dog.pk for dog in response.context['featured_dogs']]
+            self.assertTrue(dog_ids)
+            self.assertEqual(set(Dog.objects.filter(pk__in=dog_ids).values_list('breed_id', flat=True)), {breed.pk})
+            self.assertEqual(moved.pk in dog_ids, breed == self.beagle)
+
+
+class RatingAggregatesTests(TestCase):
+    """
+    Проверяет поддержку агрегатов рейтинга при создании, изменении и удалении отзывов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reviewer', 'reviewer@example.com', 'password')
+        cls.breed = Breed.objects.create(name='Порода')
+        cls.other_breed = Breed.objects.create(name='Другая порода')
+        cls.dog = Dog.objects.create(name='Собака', breed=cls.breed, age=3, owner=cls.user, image='dog_images/dog.jpg')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def assertAggregates(self, obj, review_count, rating_sum):
+        obj.refresh_from_db()
+        self.assertEqual((obj.review_count, obj.rating_sum), (review_count, rating_sum))
+        self.assertAlmostEqual(obj.rating_avg, rating_sum / review_count if review_count else 0)
+
+    def test_review_views_update_aggregates(self):
+        for rating in (4, 2):
+            self.client.post(reverse('dogs:dogs_list'), {'dog_id': self.dog.pk, 'text': 'Отзыв', 'rating': rating})
+        self.assertAggregates(self.dog, 2, 6)
+        self.assertAggregates(self.breed, 2, 6)
+
+        review = Review.objects.get(rating=2)
+        self.client.post(reverse('dogs:review_update', args=[review.pk]), {'text': 'Отзыв', 'rating': 5})
+        self.assertAggregates(self.dog, 2, 9)
+
+        self.client.post(reverse('dogs:review_delete', args=[review.pk]))
+        self.assertAggregates(self.dog, 1, 4)
+        self.assertAggregates(self.breed, 1, 4)
+
+    def test_deleting_already_deleted_review_keeps_aggregates(self):
+        self.client.post(reverse('dogs:dogs_list'), {'dog_id': self.dog.pk, 'text': 'Отзыв', 'rating': 4})
+        review = Review.objects.get()
+        Review.objects.filter(pk=review.pk).delete()  # Удален параллельным запросом
+        with mock.patch('dogs.views.ReviewDeleteView.get_object', return_value=review):
+            self.client.post(reverse('dogs:review_delete', args=[review.pk]))
+        self.assertAggregates(self.dog, 1, 4)
+
+    def test_admin_change_keeps_counters(self):
+        stale = Dog.objects.get(pk=self.dog.pk)
+        Dog.objects.filter(pk=self.dog.pk).update(views_count=7, review_count=2, rating_sum=9)
+        stale.name = 'Новая кличка'
+        admin.site._registry[Dog].save_model(None, stale, None, change=True)
+        self.dog.refresh_from_db()
+        self.assertEqual((self.dog.name, self.dog.views_count, self.dog.rating_sum), ('Новая кличка', 7, 9))
+        self.assertIn('views_count', admin.site._registry[Dog].readonly_fields)
+
+        # Обычный save() сохраняет все поля, включая счетчики
+        self.dog.views_count = 3
+        self.dog.save()
+        self.dog.refresh_from_db()
+        self.assertEqual(self.dog.views_count, 3)
+
+    def test_breed_change_moves_aggregates_and_recompute_repairs(self):
+        self.client.post(reverse('dogs:dogs_list'), {'dog_id': self.dog.pk, 'text': 'Отзыв', 'rating': 3})
+        self.dog.refresh_from_db()
+        self.dog.breed = self.other_breed
+        self.dog.save()
+        self.assertAggregates(self.breed, 0, 0)
+        self.assertAggregates(self.other_breed, 1, 3)
+
+        Dog.objects.filter(pk=self.dog.pk).update(review_count=100, rating_sum=100)
+        ratings.recompute_ratings()
+        self.assertAggregates(self.dog, 1, 3)
+
+
+class TrigramSearchTests(TestCase):
+    """
+    Проверяет поиск собак по индексу триграмм и обновление индекса сигналами.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('ivanov', 'ivanov@example.com', 'password')
+        cls.breed = Breed.objects.create(name='Лабрадор')
+        cls.rex = Dog.objects.create(name='Рекс', breed=cls.breed, age=3, owner=cls.owner)
+        cls.friend = Dog.objects.create(name='Бобик', breed=cls.breed, age=2, description='Лучший друг Рекса')
+
+    def find(self, query):
+        queryset = search.TrigramBackend().filter('dog', Dog.objects.all(), query)
+        return list(queryset.order_by('-search_rank', '-pk').values_list('name', flat=True))
+
+    def test_name_match_ranks_above_description(self):
+        self.assertEqual(self.find('рекс'), ['Рекс', 'Бобик'])
+
+    def test_partial_and_related_fields(self):
+        self.assertEqual(self.find('лабрад'), ['Бобик', 'Рекс'])
+        self.assertEqual(self.find('ivanov'), ['Рекс'])
+
+    def test_index_follows_updates(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.breed.name = 'Ретривер'
+            self.breed.save()
+        # Собаки переименованной породы переиндексируются после фиксации транзакции
+        self.assertEqual(self.find('ретривер'), [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(self.find('ретривер')), 2)
+        self.rex.delete()
+        self.assertEqual(self.find('рекс'), ['Бобик'])
+
+    def test_rebuild_replaces_index_at_once(self):
+        backend = search.TrigramBackend()
+        seen = []
+        backend.rebuild('dog', batch_size=1, progress=lambda entity, indexed: seen.append(self.find('рекс')))
+        # Пока строится новый индекс, поиск работает по старому
+        self.assertEqual(seen, [['Рекс', 'Бобик']] * 2)
+        self.assertEqual(self.find('рекс'), ['Рекс', 'Бобик'])
+        self.assertFalse(SearchTrigram.objects.filter(entity='~dog').exists())
+
+    @override_settings(SEARCH_MAX_RESULTS=1)
+    def test_truncated_results_are_reported(self):
+        backend = search.TrigramBackend()
+        with self.assertLogs('dogs.search', 'INFO'):
+            self.assertTrue(backend.truncated('dog', 'рекс'))
+        self.assertFalse(backend.truncated('dog', 'ivanov'))
+        self.assertEqual(len(self.find('рекс')), 1)
+
+
+class AutocompleteTests(TestCase):
+    """
+    Проверяет автодополнение: ответ без запросов к БД и учет изменений из журнала.
+    """
+
+    def setUp(self):
+        cache.clear()
+        autocomplete.shared_index.reset()
+        self.breed = Breed.objects.create(name='Золотистый ретривер')
+        Dog.objects.create(name='Рекс', breed=self.breed, age=3)
+        self.client.force_login(User.objects.create_user('searcher', 'searcher@example.com', 'password'))
+
+    def suggest(self, query, **params):
+        response = self.client.get(reverse('dogs:autocomplete'), {'q': query, **params})
+        return [result['label'] for result in response.json()['results']]
+
+    def test_prefix_of_any_word_without_queries(self):
+        self.suggest('р')  # Загрузка индекса
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.suggest('ре'), ['Золотистый ретривер', 'Рекс'])
+            self.assertEqual(self.suggest('ре', kind='dog'), ['Рекс'])
+        # Запросы к БД - только сессия и пользователь
+        tables = (connection.ops.quote_name('django_session'), connection.ops.quote_name(User._meta.db_table))
+        self.assertTrue(all(any(table in query['sql'] for table in tables) for query in queries), queries.captured_queries)
+
+    def test_anonymous_request_redirects_to_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('dogs:autocomplete'), {'q': 'ре'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(reverse(settings.LOGIN_URL)))
+
+    def test_updates_do_not_change_index_in_use(self):
+        self.suggest('р')
+        index = autocomplete.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            Dog.objects.create(name='Ретро', breed=self.breed, age=1)
+        autocomplete.shared_index.checked_at = 0
+        self.assertIn('Ретро', self.suggest('ретр'))
+        # Изменения применены к копии: ссылка, полученная до синхронизации, не изменилась
+        self.assertNotIn('Ретро', [label for _, label, _ in index.lookup('ретр')])
+
+    def test_changes_reach_index_through_journal(self):
+        self.suggest('р')
+        with self.captureOnCommitCallbacks(execute=True):
+            dog = Dog.objects.create(name='Ретро', breed=self.breed, age=1)
+        autocomplete.shared_index.checked_at = 0
+        self.assertIn('Ретро', self.suggest('ретр'))
+        with self.captureOnCommitCallbacks(execute=True):
+            dog.delete()
+        autocomplete.shared_index.checked_at = 0
+        self.assertNotIn('Ретро', self.suggest('ретр'))
+
+
+class FacetTests(TestCase):
+    """
+    Проверяет фасеты: количества из индекса в памяти и фильтрацию списка.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('viewer', 'viewer@example.com', 'password', city='Казань')
+        cls.labrador = Breed.objects.create(name='Лабрадор')
+        cls.poodle = Breed.objects.create(name='Пудель')
+        cls.rex = Dog.objects.create(name='Рекс', breed=cls.labrador, age=1, owner=cls.user, image='dog_images/x.jpg')
+        cls.bim = Dog.objects.create(name='Бим', breed=cls.labrador, age=6, image='dog_images/x.jpg')
+        cls.toto = Dog.objects.create(name='Тото', breed=cls.poodle, age=3, owner=cls.user, image='dog_images/x.jpg')
+        Pedigree.objects.create(dog=cls.toto, father='Арчи')
+
+    def setUp(self):
+        cache.clear()
+        facets.shared_index.reset()
+        self.client.force_login(self.user)
+
+    def get_facets(self, **params):
+        response = self.client.get(reverse('dogs:dogs_list'), params)
+        counts = {
+            facet['name']: {option['value']: option['count'] for option in facet['options'] if option['count']}
+            for facet in response.context['facets']
+        }
+        return response, counts
+
+    def test_counts_ignore_own_facet_and_match_filtered_list(self):
+        response, counts = self.get_facets(breed=self.labrador.pk, pedigree='no')
+        self.assertEqual({dog.pk for dog in response.context['page_obj']}, {self.rex.pk, self.bim.pk})
+        self.assertEqual(response.context['facet_total'], 2)
+        # Значения того же фасета считаются без его собственного выбора
+        self.assertEqual(counts['breed'], {self.labrador.pk: 2})
+        self.assertEqual(counts['pedigree'], {'no': 2})
+        self.assertEqual(counts['age'], {'0-1': 1, '5-8': 1})
+        self.assertEqual(counts['availability'], {'available': 1, 'owned': 1})
+        self.assertEqual(counts['city'], {'Казань': 1})
+
+        response, counts = self.get_facets(pedigree='yes')
+        self.assertEqual([dog.pk for dog in response.context['page_obj']], [self.toto.pk])
+        self.assertEqual(counts['pedigree'], {'yes': 1, 'no': 2})
+
+    def test_changes_reach_counts_through_journal(self):
+        self.get_facets()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                review = Review.objects.create(dog=self.bim, user=self.user, text='Отлично', rating=5)
+                ratings.review_created(review)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.city = 'Москва'
+            self.user.save()
+        facets.shared_index.checked_at = 0
+        with CaptureQueriesContext(connection) as queries:
+            facets.shared_index.sync()
+            counts = facets.shared_index.counts({})
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(counts['rating'], {'4': 1, 'none': 2})
+        self.assertEqual(counts['city'], {'Москва': 2})
+        _, counts = self.get_facets(rating='4')
+        self.assertEqual(counts['breed'], {self.labrador.pk: 1})
+
+    def test_counts_follow_search_query(self):
+        response, counts = self.get_facets(q='рекс')
+        self.assertEqual([dog.pk for dog in response.context['page_obj']], [self.rex.pk])
+        self.assertEqual(response.context['facet_total'], 1)
+        self.assertEqual(counts['breed'], {self.labrador.pk: 1})
+        self.assertNotContains(response, 'name="min_rating"')
+
+    def test_pending_ids_belong_to_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                facets.record_dogs([self.rex.pk])
+                facets.record_dogs([self.bim.pk])
+        self.assertEqual(len(callbacks), 1)
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            facets.record_dogs([self.toto.pk])
+            1 / 0
+        # Обработчик откаченной транзакции отброшен: новые идентификаторы получают свой
+        with self.captureOnCommitCallbacks() as callbacks:
+            facets.record_dogs([self.toto.pk])
+        self.assertEqual(len(callbacks), 1)
+
+
+class MediaRootMixin:
+    """
+    Подменяет MEDIA_ROOT временным каталогом и создает тестовые изображения.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.breed = Breed.objects.create(name='Лабрадор')
+        self.client.force_login(User.objects.create_user('viewer', 'viewer@example.com', 'password'))
+
+    def upload(self, size=(2000, 1500)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 150, 100)).save(buffer, 'JPEG', quality=95)
+        return SimpleUploadedFile('rex.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+class ImageDerivativeTests(MediaRootMixin, TestCase):
+    """
+    Проверяет создание уменьшенных копий при загрузке и их вывод в шаблонах.
+    """
+
+    def test_upload_creates_small_variants_used_in_srcset(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            dog = Dog.objects.create(name='Рекс', breed=self.breed, age=3, image=self.upload())
+        # Производные создает очередь, а не сохранение собаки
+        self.assertFalse(os.path.exists(dog.image.storage.path(images.derivative_name(dog.image.name, 'card', 'webp'))))
+        self.assertEqual(images.process_pending(), (2, 0) if self.breed.image else (1, 0))
+        dog.refresh_from_db()
+        self.assertIs(dog.image_derivatives, True)
+        for variant, (width, height, crop) in images.VARIANTS.items():
+            for extension in images.FORMATS:
+                path = images.derivative_name(dog.image.name, variant, extension)
+                with Image.open(dog.image.storage.path(path)) as derivative:
+                    self.assertLessEqual(derivative.width, width)
+                    if crop:
+                        self.assertEqual(derivative.size, (width, height))
+        card = dog.image.storage.size(images.derivative_name(dog.image.name, 'card', 'webp'))
+        self.assertLess(card, dog.image.size / 5)
+
+        html = self.client.get(reverse('dogs:dog_read', kwargs={'slug': dog.slug})).content.decode()
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(images.derivative_name(dog.image.name, 'detail', 'webp'), html)
+
+    def test_image_change_requeues_and_removes_old_derivatives(self):
+        dog = Dog.objects.create(name='Рекс', breed=self.breed, age=3, image=self.upload())
+        images.process_pending()
+        dog.refresh_from_db()
+        old_card = dog.image.storage.path(images.derivative_name(dog.image.name, 'card', 'webp'))
+        self.assertTrue(os.path.exists(old_card))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            dog.image = self.upload(size=(300, 200))
+            dog.save()
+        dog.refresh_from_db()
+        self.assertIs(dog.image_derivatives, False)
+        self.assertFalse(os.path.exists(old_card))
+
+        # Пока производных нет, выводится оригинал, а хранилище не проверяется
+        with mock.patch.object(images.default_storage, 'exists') as exists:
+            html = self.client.get(reverse('dogs:dog_read', kwargs={'slug': dog.slug})).content.decode()
+        exists.assert_not_called()
+        self.assertNotIn('type="image/webp"', html)
+        self.assertIn(dog.image.url, html)
+
+    def test_same_photo_uploaded_again_gets_derivatives_again(self):
+        dog = Dog.objects.create(name='Рекс', breed=self.breed, age=3, image=self.upload())
+        images.process_pending()
+        dog.refresh_from_db()
+        name = dog.image.name
+        card = dog.image.storage.path(images.derivative_name(name, 'card', 'webp'))
+
+        # Производные удалил другой процесс (веб-воркер после смены фотографии),
+        # затем та же фотография загружена снова - с тем же именем (хранилище по хэшу)
+        shutil.rmtree(os.path.dirname(card))
+        with self.captureOnCommitCallbacks(execute=True):
+            dog.image = self.upload()
+            dog.save()
+        Dog.objects.filter(pk=dog.pk).update(image_derivatives=False)
+        dog.refresh_from_db()
+        self.assertEqual(dog.image.name, name)
+        images.process_pending()
+        dog.refresh_from_db()
+        self.assertIs(dog.image_derivatives, True)
+        self.assertTrue(os.path.exists(card))
+
+    def test_broken_image_is_not_retried(self):
+        dog = Dog.objects.create(name='Рекс', breed=self.breed, age=3)
+        Dog.objects.filter(pk=dog.pk).update(image='dog_images/missing.jpg')
+        with self.assertLogs('dogs.images', 'WARNING'):
+            self.assertEqual(images.process_pending(), (0, 1))
+        self.assertIsNone(Dog.objects.get(pk=dog.pk).image_derivatives)
+        self.assertEqual(images.process_pending(), (0, 0))
+
+    def test_dog_without_image_uses_placeholder(self):
+        dog = Dog.objects.create(name='Бим', breed=self.breed, age=2)
+        html = self.client.get(reverse('dogs:dog_read', kwargs={'slug': dog.slug})).content.decode()
+        self.assertIn('dummydog.jpg', html)
+
+    def test_resize_endpoint_caches_on_disk_and_answers_conditional_get(self):
+        os.makedirs(os.path.join(self.media_root, 'dog_images'))
+        Image.new('RGB', (2000, 1000)).save(os.path.join(self.media_root, 'dog_images', 'big.jpg'))
+        url = '/media/r/160x120/dog_images/big.jpg'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as resized:
+            self.assertEqual(resized.size, (160, 80))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, 'resized', '160x120', 'dog_images', 'big.jpg')))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/media/r/161x120/dog_images/big.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media/r/160x120/../settings.py').status_code, 404)
+
+    def test_concurrent_requests_render_once(self):
+        os.makedirs(os.path.join(self.media_root, 'dog_images'))
+        Image.new('RGB', (800, 600)).save(os.path.join(self.media_root, 'dog_images', 'rex.jpg'))
+        render = images._render
+        calls = []
+
+        def slow_render(*args):
+            calls.append(args)
+            time.sleep(0.2)
+            render(*args)
+
+        with mock.patch.object(images, '_render', slow_render):
+            threads = [threading.Thread(target=images.get_resized, args=('dog_images/rex.jpg', 480, 360)) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+
+
+class ContentAddressedStorageTests(MediaRootMixin, TestCase):
+    """
+    Проверяет хранение изображений по хэшу: повторная загрузка не создает файл,
+    ссылки считаются, fold_media переносит старые файлы и удаляет дубликаты.
+    """
+
+    def test_same_upload_is_stored_once_and_refcounted(self):
+        rex = Dog.objects.create(name='Рекс', breed=self.breed, age=3, image=self.upload())
+        bim = Dog.objects.create(name='Бим', breed=self.breed, age=2, image=self.upload())
+        self.assertEqual(rex.image.name, bim.image.name)
+        self.assertTrue(rex.image.name.startswith('cas/'))
+        self.assertEqual(len(os.listdir(os.path.dirname(rex.image.path))), 1)
+        self.assertEqual(MediaBlob.objects.get(name=rex.image.name).ref_count, 2)
+
+        bim.delete()
+        self.assertEqual(MediaBlob.objects.get(name=rex.image.name).ref_count, 1)
+        rex.image = self.upload(size=(300, 200))
+        rex.save()
+        self.assertEqual(MediaBlob.objects.get(name=bim.image.name).ref_count, 0)
+        self.assertEqual(MediaBlob.objects.get(name=rex.image.name).ref_count, 1)
+
+    def test_fold_media_moves_files_and_removes_duplicates(self):
+        os.makedirs(os.path.join(self.media_root, 'breed_images'))
+        content = self.upload().read()
+        for name in ('shepherd.jpg', 'shepherd_abc.jpg'):
+            with open(os.path.join(self.media_root, 'breed_images', name), 'wb') as file:
+                file.write(content)
+        Breed.objects.filter(pk=self.breed.pk).update(image='breed_images/shepherd.jpg')
+        other = Breed.objects.create(name='Овчарка')
+        Breed.objects.filter(pk=other.pk).update(image='breed_images/shepherd_abc.jpg')
+
+        call_command('fold_media', stdout=io.StringIO())
+
+        names = set(Breed.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(name.startswith('cas/'))
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'breed_images')), [])
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 2)
+
+    def test_fold_media_refreshes_pages_of_moved_images(self):
+        cache.clear()
+        os.makedirs(os.path.join(self.media_root, 'dog_images'))
+        with open(os.path.join(self.media_root, 'dog_images', 'rex.jpg'), 'wb') as file:
+            file.write(self.upload().read())
+        dog = Dog.objects.create(name='Рекс', breed=self.breed, age=3)
+        Dog.objects.filter(pk=dog.pk).update(image='dog_images/rex.jpg')
+        dog.refresh_from_db()
+        url = reverse('dogs:dog_read', kwargs={'slug': dog.slug})
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)[page_cache.STATUS_HEADER], 'hit')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('fold_media', stdout=io.StringIO())
+        moved = Dog.objects.get(pk=dog.pk)
+        self.assertGreater(moved.updated_at, dog.updated_at)
+        response = self.client.get(url)
+        self.assertEqual(response[page_cache.STATUS_HEADER], 'miss')
+        self.assertContains(response, moved.image.url)
+        self.assertNotContains(response, 'dog_images/rex.jpg')
+
+    def test_fold_media_keeps_file_until_rows_are_updated(self):
+        os.makedirs(os.path.join(self.media_root, 'breed_images'))
+        path = os.path.join(self.media_root, 'breed_images', 'shepherd.jpg')
+        with open(path, 'wb') as file:
+            file.write(self.upload().read())
+        Breed.objects.filter(pk=self.breed.pk).update(image='breed_images/shepherd.jpg')
+
+        with mock.patch('django.db.models.query.QuerySet.update', side_effect=DatabaseError), \
+                self.assertRaises(DatabaseError):
+            call_command('fold_media', stdout=io.StringIO())
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(Breed.objects.get(pk=self.breed.pk).image.name, 'breed_images/shepherd.jpg')
+
+
+class ReclaimMediaTests(MediaRootMixin, TestCase):
+    """
+    Проверяет удаление файлов без ссылок и дубликатов командой reclaim_media.
+    """
+
+    def write(self, name, content):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(content)
+        return path
+
+    def test_removes_orphans_and_folds_duplicates(self):
+        content = self.upload().read()
+        kept = self.write('dog_images/rex.jpg', content)
+        duplicate = self.write('dog_images/rex_copy.jpg', content)
+        orphan = self.write('dog_images/old.jpg', b'old')
+        orphan_derivative = self.write('derivatives/dog_images/old/card.webp', b'old')
+        rex = Dog.objects.create(name='Рекс', breed=self.breed, age=3)
+        bim = Dog.objects.create(name='Бим', breed=self.breed, age=2)
+        Dog.objects.filter(pk=rex.pk).update(image='dog_images/rex.jpg')
+        Dog.objects.filter(pk=bim.pk).update(image='dog_images/rex_copy.jpg')
+
+        call_command('reclaim_media', dry_run=True, grace_seconds=-60, stdout=io.StringIO())
+        self.assertTrue(all(map(os.path.exists, (duplicate, orphan, orphan_derivative))))
+
+        for use_bloom in (False, True):
+            call_command('reclaim_media', bloom=use_bloom, grace_seconds=-60, stdout=io.StringIO())
+        self.assertTrue(os.path.exists(kept))
+        self.assertFalse(any(map(os.path.exists, (duplicate, orphan, orphan_derivative))))
+        self.assertEqual(set(Dog.objects.values_list('image', flat=True)), {'dog_images/rex.jpg'})
+
+    def test_file_referenced_after_reading_is_kept(self):
+        path = self.write('dog_images/rex.jpg', b'rex')
+        rex = Dog.objects.create(name='Рекс', breed=self.breed, age=3)
+        Dog.objects.filter(pk=rex.pk).update(image='dog_images/rex.jpg')
+
+        # Ссылка появилась после того, как команда прочитала ссылки из БД
+        with mock.patch.object(ReclaimMediaCommand, 'load_references', return_value=(set(), set())):
+            call_command('reclaim_media', grace_seconds=-60, stdout=io.StringIO())
+        self.assertTrue(os.path.exists(path))
+
+    def test_duplicate_rows_are_queued_when_kept_file_has_no_derivatives(self):
+        content = self.upload().read()
+        self.write('dog_images/rex.jpg', content)
+        self.write('dog_images/rex_copy.jpg', content)
+        duplicate_derivative = self.write('derivatives/dog_images/rex_copy/card.webp', b'card')
+        rex = Dog.objects.create(name='Рекс', breed=self.breed, age=3)
+        bim = Dog.objects.create(name='Бим', breed=self.breed, age=2)
+        Dog.objects.filter(pk=rex.pk).update(image='dog_images/rex.jpg', image_derivatives=None)
+        Dog.objects.filter(pk=bim.pk).update(image='dog_images/rex_copy.jpg', image_derivatives=True)
+
+        cache.clear()
+        url = reverse('dogs:dog_read', kwargs={'slug': bim.slug})
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)[page_cache.STATUS_HEADER], 'hit')
+        updated_at = Dog.objects.get(pk=bim.pk).updated_at
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reclaim_media', grace_seconds=-60, stdout=io.StringIO())
+        self.assertFalse(os.path.exists(duplicate_derivative))
+        self.assertGreater(Dog.objects.get(pk=bim.pk).updated_at, updated_at)
+        response = self.client.get(url)
+        self.assertEqual(response[page_cache.STATUS_HEADER], 'miss')
+        self.assertNotContains(response, 'rex_copy')
+        self.assertEqual(Dog.objects.get(pk=bim.pk).image.name, 'dog_images/rex.jpg')
+        self.assertIs(Dog.objects.get(pk=bim.pk).image_derivatives, False)
+
+        images.process_pending()
+        self.assertTrue(images.has_derivatives('dog_images/rex.jpg'))
+        self.assertIs(Dog.objects.get(pk=bim.pk).image_derivatives, True)
+
+
+class ImageUploadTests(MediaRootMixin, TestCase):
+    """
+    Проверяет потоковую загрузку: проверку по заголовку, отклонение больших
+    изображений и удаление EXIF.
+    """
+
+    def encode(self, image_format, **params):
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуто на 90 градусов
+        exif[0x010F] = 'Phone'  # Make
+        Image.new('RGB', (64, 48), (200, 150, 100)).save(buffer, image_format, exif=exif, **params)
+        return buffer.getvalue()
+
+    def strip(self, data, chunk_size=7):
+        """
+        Пропускает файл через разборщик мелкими частями, как при загрузке.
+        """
+        output = io.BytesIO()
+        parser = uploads._parser_for(data[:12], output.write)
+        for start in range(0, len(data), chunk_size):
+            parser.feed(data[start:start + chunk_size])
+        parser.finish(output)
+        return parser.info, output.getvalue()
+
+    def create_dog(self, content, name='rex.jpg'):
+        return self.client.post(reverse('dogs:dog_create'), {
+            'name': 'Рекс', 'breed': self.breed.pk, 'age': 3,
+            'image': SimpleUploadedFile(name, content, content_type='image/jpeg'),
+            'pedigrees-TOTAL_FORMS': 0, 'pedigrees-INITIAL_FORMS': 0,
+        })
+
+    def test_upload_strips_exif_but_keeps_orientation(self):
+        response = self.create_dog(self.encode('JPEG'))
+        self.assertEqual(response.status_code, 302)
+        dog = Dog.objects.get()
+        with Image.open(dog.image.path) as image:
+            image.load()
+            self.assertEqual(image.size, (64, 48))
+            self.assertEqual(dict(image.getexif()), {0x0112: 6})
+
+    def test_png_and_webp_metadata_is_removed(self):
+        for image_format in ('PNG', 'WEBP'):
+            info, data = self.strip(self.encode(image_format, lossless=True))
+            self.assertEqual((info.format, info.width, info.height), (image_format, 64, 48))
+            with Image.open(io.BytesIO(data)) as image:
+                image.load()
+                self.assertEqual(image.size, (64, 48))
+                self.assertEqual(dict(image.getexif()), {})
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=1000)
+    def test_oversized_and_fake_images_are_rejected(self):
+        response = self.create_dog(self.encode('JPEG'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Изображение слишком большое (64x48)', response.content.decode())
+        response = self.create_dog(b'GIF89a' + b'\x00' * 100)
+        self.assertIn('Поддерживаются только изображения JPEG, PNG и WebP', response.content.decode())
+        self.assertFalse(Dog.objects.exists())
+
+
+class DuplicateTests(MediaRootMixin, TestCase):
+    """
+    Проверяет поиск собак с одинаковыми фотографиями по перцептивным хэшам.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        duplicates.shared_index.reset()
+
+    def photo(self, seed, size=(1200, 900), quality=95):
+        image = Image.new('RGB', (1200, 900), (40 * seed % 255, 120, 200))
+        draw = ImageDraw.Draw(image)
+        for step in range(8):
+            x, y = (seed * 137 + step * 311) % 1000, (seed * 71 + step * 197) % 700
+            draw.ellipse((x, y, x + 150 + step * 20, y + 120), fill=(255 - step * 30, step * 30, 60))
+        buffer = io.BytesIO()
+        image.resize(size).save(buffer, 'JPEG', quality=quality)
+        return SimpleUploadedFile(f'dog{seed}.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_same_photo_under_another_dog_is_found(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            rex = Dog.objects.create(name='Рекс', breed=self.breed, age=3, image=self.photo(1))
+        with self.captureOnCommitCallbacks(execute=True):
+            copy = Dog.objects.create(name='Рекс 2', breed=self.breed, age=3, image=self.photo(1, (600, 450), 60))
+            other = Dog.objects.create(name='Бим', breed=self.breed, age=2, image=self.photo(5))
+        self.assertNotEqual(rex.image.name, copy.image.name)
+        self.assertIsNotNone(other.image_phash)
+
+        pair = DogDuplicate.objects.get()
+        self.assertEqual((pair.dog, pair.duplicate), (copy, rex))
+        self.assertLessEqual(pair.distance, 6)
+
+        response = self.client.get(reverse('dogs:dog_duplicates', kwargs={'slug': rex.slug}))
+        self.assertEqual([result['name'] for result in response.json()['results']], ['Рекс 2'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            copy.image = self.photo(7)
+            copy.save()
+        self.assertFalse(DogDuplicate.objects.exists())
+
+    def test_index_and_pairs_are_written_together_after_commit(self):
+        calls = mock.Mock()
+        with mock.patch.object(duplicates.shared_index, 'write_journal', calls.write_journal), \
+                mock.patch.object(duplicates, 'save_pairs', calls.save_pairs):
+            with self.captureOnCommitCallbacks() as callbacks:
+                rex = Dog.objects.create(name='Рекс', breed=self.breed, age=3, image=self.photo(1))
+            self.assertEqual(calls.mock_calls, [])
+            for callback in callbacks:
+                callback()
+        self.assertEqual([call[0] for call in calls.mock_calls], ['write_journal', 'save_pairs'])
+        self.assertEqual(calls.mock_calls[0].args[0][0][:2], ('dog', rex.pk))
+
+    def test_hash_failure_is_not_retried_on_every_save(self):
+        Dog.objects.create(name='Рекс', breed=self.breed, age=3, image=self.photo(1))
+        rex = Dog.objects.get()
+        with mock.patch.object(duplicates, 'image_hashes', side_effect=OSError('broken')) as image_hashes:
+            Dog.objects.filter(pk=rex.pk).update(image_phash=None, image_dhash=None)
+            rex.refresh_from_db()
+            for name in ('Рекс', 'Рекс II'):
+                rex.name = name
+                rex.save()
+        self.assertEqual(image_hashes.call_count, 1)
+        self.assertTrue(Dog.objects.get(pk=rex.pk).image_hash_failed)
+
+        call_command('find_duplicates', workers=1, stdout=io.StringIO(), stderr=io.StringIO())
+        rex.refresh_from_db()
+        self.assertFalse(rex.image_hash_failed)
+        self.assertIsNotNone(rex.image_phash)
+
+    def test_probing_finds_the_same_dogs_as_full_scan(self):
+        import random
+
+        rng = random.Random(1)
+        index = duplicates.DuplicateIndex()
+        base = rng.getrandbits(64)
+        for dog_id in range(1, 3000):
+            value = rng.getrandbits(64) if dog_id % 3 else base ^ rng.getrandbits(64) & rng.getrandbits(64) & rng.getrandbits(64)
+            index.set_hashes(dog_id, 0, value)
+        index.set_hashes(5, 0, None)
+        for max_distance in (0, 3, 6, 11):
+            found = {dog_id for dog_id, _, _ in index.near(base, max_distance=max_distance)}
+            self.assertEqual(found, index._scan(base, max_distance))
+        self.assertNotIn(5, index._scan(base, 64))
+
+
+class StaticPipelineTests(TestCase):
+    """
+    Проверяет сборку статики с хэшами и сжатыми копиями и ее раздачу WSGIStaticFiles.
+    """
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        override = override_settings(STATIC_ROOT=self.static_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def request(self, app, path, **headers):
+        response = {}
+
+        def start_response(status, response_headers):
+            response['status'] = status
+            response['headers'] = dict(response_headers)
+
+        body = b''.join(app({'REQUEST_METHOD': 'GET', 'PATH_INFO': path, **headers}, start_response))
+        return response.get('status'), response.get('headers'), body
+
+    def test_collected_files_are_hashed_compressed_and_served_immutable(self):
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        from my_project.staticfiles import WSGIStaticFiles
+
+        call_command('collectstatic', interactive=False, verbosity=0)
+        collected = [name for _, _, names in os.walk(self.static_root) for name in names]
+        self.assertFalse([name for name in collected if name.endswith('.map') or name.startswith('bootstrap')])
+
+        url = staticfiles_storage.url('js/autocomplete.js')
+        self.assertRegex(url, r'^/static/js/autocomplete\.[0-9a-f]{12}\.js$')
+        self.assertTrue(os.path.exists(os.path.join(self.static_root, url[len('/static/'):] + '.gz')))
+
+        app = WSGIStaticFiles(lambda environ, start_response: [b'django'])
+        status, headers, body = self.request(app, url, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', headers['Cache-Control'])
+        with open(os.path.join('static', 'js', 'autocomplete.js'), 'rb') as file:
+            self.assertEqual(gzip.decompress(body), file.read())
+
+        status, _, body = self.request(app, url, HTTP_IF_NONE_MATCH=headers['ETag'], HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual((status, body), ('304 Not Modified', b''))
+        status, headers, _ = self.request(app, '/static/js/autocomplete.js')
+        self.assertNotIn('immutable', headers['Cache-Control'])
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertEqual(self.request(app, '/static/js/missing.js')[2], b'django')
+
+
+class ConditionalPageTests(TestCase):
+    """
+    Проверяет ответы 304 для страниц собаки и породы и смену их версии.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('visitor', 'visitor@example.com', 'password')
+        cls.owner = User.objects.create_user('keeper', 'keeper@example.com', 'password')
+        cls.breed = Breed.objects.create(name='Бигль')
+        cls.dog = Dog.objects.create(name='Рекс', breed=cls.breed, age=3, owner=cls.owner)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.url = reverse('dogs:dog_read', kwargs={'slug': self.dog.slug})
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_dog_page_answers_304_and_counts_view(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first['Cache-Control'])
+        with mock.patch('django.template.response.SimpleTemplateResponse.render') as render:
+            second = self.revalidate(self.url, first)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+        render.assert_not_called()
+        self.assertEqual(view_counter.pending_views(self.dog.pk), 2)
+
+        since = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+    def test_pedigree_breed_and_user_change_version(self):
+        first = self.client.get(self.url)
+        pedigree = Pedigree.objects.create(dog=self.dog, father='Бим')
+        second = self.revalidate(self.url, first)
+        self.assertEqual(second.status_code, 200)
+        self.assertContains(second, 'Бим')
+
+        self.breed.name = 'Бигль-харьер'
+        self.breed.save()
+        self.assertEqual(self.revalidate(self.url, second).status_code, 200)
+
+        self.client.force_login(self.owner)
+        self.assertEqual(self.revalidate(self.url, second).status_code, 200)
+
+        third = self.client.get(self.url)
+        pedigree.delete()
+        self.assertEqual(self.revalidate(self.url, third).status_code, 200)
+
+    def test_view_count_flush_keeps_version(self):
+        first = self.client.get(self.url)
+        view_counter.flush()
+        self.assertEqual(self.revalidate(self.url, first).status_code, 304)
+
+    def test_breed_page_version_follows_its_dogs(self):
+        url = reverse('dogs:breed_detail', kwargs={'slug': self.breed.slug})
+        first = self.client.get(url)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+        other = Dog.objects.create(name='Бим', breed=self.breed, age=2)
+        second = self.revalidate(url, first)
+        self.assertEqual(second.status_code, 200)
+        other.delete()
+        self.assertEqual(self.revalidate(url, second).status_code, 200)
+
+
+class DogCardCacheTests(TestCase):
+    """
+    Проверяет кэш карточек собак: повторное использование, слой зрителя и смену версии.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        cls.staff = User.objects.create_user('moderator', 'moderator@example.com', 'password', is_staff=True)
+        cls.breed = Breed.objects.create(name='Такса')
+        cls.dog = Dog.objects.create(name='Рекс', breed=cls.breed, age=3, owner=cls.user)
+        cls.review = Review.objects.create(dog=cls.dog, user=cls.user, text='Хороший пес', rating=5)
+
+    def setUp(self):
+        cache.clear()
+        cards.reset_stats()
+        facets.shared_index.reset()
+        self.client.force_login(self.user)
+
+    def get_list(self):
+        facets.shared_index.sync()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dogs:dogs_list'))
+        return response, len(queries)
+
+    def test_warm_page_reuses_cards_without_reviews_query(self):
+        cold, cold_queries = self.get_list()
+        self.assertIn('dogs/dog_card.html', [template.name for template in cold.templates])
+        warm, warm_queries = self.get_list()
+        self.assertNotIn('dogs/dog_card.html', [template.name for template in warm.templates])
+        self.assertEqual(warm_queries, cold_queries - 1)
+        self.assertContains(warm, 'Хороший пес')
+        self.assertContains(warm, 'В вашем профиле')
+        self.assertContains(warm, reverse('dogs:review_update', args=[self.review.pk]))
+
+        cards.flush_stats()
+        self.assertEqual(cards.stats(), {'hits': 1, 'misses': 1, 'ratio': 0.5})
+
+    def test_viewer_controls_are_not_cached(self):
+        self.get_list()
+        self.client.force_login(self.staff)
+        response, _ = self.get_list()
+        self.assertNotIn('dogs/dog_card.html', [template.name for template in response.templates])
+        self.assertContains(response, 'Удалить (Администратор)')
+        self.assertContains(response, 'Собака принадлежит пользователю: reader')
+        self.assertNotContains(response, 'В вашем профиле')
+
+    def test_review_and_breed_changes_invalidate_card(self):
+        self.get_list()
+        self.review.text = 'Отличный пес'
+        self.review.save()
+        self.assertContains(self.get_list()[0], 'Отличный пес')
+
+        Review.objects.create(dog=self.dog, user=self.staff, text='Новый отзыв', rating=4)
+        response, _ = self.get_list()
+        self.assertContains(response, 'Новый отзыв')
+        self.assertNotContains(response, reverse('dogs:review_update', args=[Review.objects.latest('pk').pk]))
+
+        self.breed.name = 'Кроличья такса'
+        self.breed.save()
+        self.assertContains(self.get_list()[0], 'Кроличья такса')
+
+
+class PageCacheTests(TestCase):
+    """
+    Проверяет кэш страниц: варианты для ролей, учет просмотров и сброс по меткам.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('guest', 'guest@example.com', 'password')
+        cls.staff = User.objects.create_user('curator', 'curator@example.com', 'password', is_staff=True)
+        cls.breed = Breed.objects.create(name='Пудель')
+        cls.other_breed = Breed.objects.create(name='Мопс')
+        cls.dog = Dog.objects.create(name='Артемон', breed=cls.breed, age=4, owner=cls.staff)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, response[page_cache.STATUS_HEADER]
+
+    def test_pages_are_cached_per_role(self):
+        url = reverse('dogs:breed_detail', kwargs={'slug': self.breed.slug})
+        self.assertEqual(self.get(url)[1], 'miss')
+        response, status = self.get(url)
+        self.assertEqual(status, 'hit')
+        self.assertContains(response, 'Артемон')
+        self.assertEqual(response.templates, [])
+
+        self.client.force_login(self.staff)
+        self.assertEqual(self.get(url)[1], 'miss')
+        self.assertEqual(self.get(reverse('dogs:index'))[1], 'miss')
+        self.assertEqual(self.get(reverse('dogs:index'))[1], 'hit')
+
+    def test_cached_dog_page_counts_views_and_keeps_owner_variant(self):
+        url = reverse('dogs:dog_read', kwargs={'slug': self.dog.slug})
+        self.get(url)
+        response, status = self.get(url)
+        self.assertEqual(status, 'hit')
+        self.assertContains(response, '<strong>Просмотров:</strong> 2')
+        self.assertNotContains(response, 'Редактировать')
+
+        self.client.force_login(self.staff)
+        response, status = self.get(url)
+        self.assertEqual(status, 'miss')
+        self.assertContains(response, 'Редактировать')
+
+    def test_signals_purge_only_tagged_pages(self):
+        breeds_url = reverse('dogs:breeds')
+        dog_url = reverse('dogs:dog_read', kwargs={'slug': self.dog.slug})
+        other_url = reverse('dogs:breed_detail', kwargs={'slug': self.other_breed.slug})
+        for url in (breeds_url, dog_url, other_url):
+            self.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Pedigree.objects.create(dog=self.dog, father='Карабас')
+        response, status = self.get(dog_url)
+        self.assertEqual(status, 'miss')
+        self.assertContains(response, 'Карабас')
+        self.assertEqual(self.get(breeds_url)[1], 'hit')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.breed.name = 'Королевский пудель'
+            self.breed.save()
+        response, status = self.get(breeds_url)
+        self.assertEqual(status, 'miss')
+        self.assertContains(response, 'Королевский пудель')
+        self.assertEqual(self.get(other_url)[1], 'hit')
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'my_project.metrics.InstrumentedCache',
+    'WRAPPED_BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+}})
+class RequestMetricsTests(TestCase):
+    """
+    Проверяет Server-Timing, гистограммы по имени URL и вывод /metrics/.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('watcher', 'watcher@example.com', 'password')
+        cls.staff = User.objects.create_user('operator', 'operator@example.com', 'password', is_staff=True)
+        Breed.objects.create(name='Колли')
+
+    def setUp(self):
+        from my_project import metrics
+
+        self.metrics = metrics
+        cache.clear()
+        metrics.registry.reset()
+        self.client.force_login(self.user)
+
+    def test_server_timing_reports_queries_cache_and_templates(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('dogs:breeds')))
+
+        self.client.force_login(self.staff)
+        self.client.get(reverse('dogs:breeds'))
+        response = self.client.get(reverse('dogs:breeds'))
+        timing = {part.split(';')[0]: part for part in response['Server-Timing'].split(', ')}
+        self.assertEqual(set(timing), {'db', 'cache', 'tpl', 'total'})
+        self.assertRegex(timing['db'], r'desc="[1-9]\d* queries"')
+        self.assertRegex(timing['cache'], r'desc="hits=[1-9]')
+        self.assertEqual(response[page_cache.STATUS_HEADER], 'hit')
+
+    def test_instrumented_cache_counts_reads_of_wrapped_backend(self):
+        from django.core.cache.backends.locmem import LocMemCache
+
+        self.assertIsInstance(cache._cache, LocMemCache)
+        metrics = self.metrics.RequestMetrics()
+        token = self.metrics._current.set(metrics)
+        try:
+            cache.set('dog', 'Рекс')
+            self.assertTrue(cache.add('counter', 0))
+            self.assertEqual(cache.incr('counter'), 1)
+            self.assertIn('dog', cache)
+            self.assertEqual(cache.get('dog'), 'Рекс')
+            self.assertIsNone(cache.get('cat'))
+            self.assertEqual(cache.get('cat', 'нет'), 'нет')
+            self.assertEqual(cache.get_many(['dog', 'counter', 'cat']), {'dog': 'Рекс', 'counter': 1})
+        finally:
+            self.metrics._current.reset(token)
+        self.assertEqual((metrics.cache_hits, metrics.cache_misses), (3, 3))
+        self.assertGreater(metrics.cache_time, 0)
+
+        # Вне запроса обращения не учитываются
+        self.assertEqual(cache.get('dog'), 'Рекс')
+        self.assertEqual(metrics.cache_hits, 3)
+
+    def test_metrics_endpoint_aggregates_histograms(self):
+        for _ in range(3):
+            self.client.get(reverse('dogs:breeds'))
+        self.metrics.registry.flush()
+        self.client.get(reverse('dogs:index'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+        self.client.force_login(self.staff)
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE django_request_duration_seconds histogram', text)
+        self.assertIn('django_request_duration_seconds_count{view="dogs:breeds",method="GET"} 3', text)
+        self.assertIn('django_request_duration_seconds_bucket{view="dogs:breeds",method="GET",le="+Inf"} 3', text)
+        self.assertIn('django_request_duration_seconds_count{view="dogs:index",method="GET"} 1', text)
+        self.assertRegex(text, r'django_cache_hits_total\{view="dogs:breeds",method="GET"\} [1-9]')
+
+        with override_settings(METRICS_TOKEN='secret'):
+            self.client.logout()
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
+class SlowQueryLogTests(TestCase):
+    """
+    Проверяет отбор запросов в журнал медленных запросов, планы и страницу администратора.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('analyst', 'analyst@example.com', 'password')
+        cls.staff = User.objects.create_user('dba', 'dba@example.com', 'password', is_staff=True)
+        Breed.objects.create(name='Бигль')
+
+    def setUp(self):
+        from my_project import slow_queries
+
+        self.slow_queries = slow_queries
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_normalize_replaces_literals_and_collapses_in_lists(self):
+        self.assertEqual(
+            self.slow_queries.normalize("SELECT  *\nFROM dog WHERE id IN (%s, %s, %s) AND name LIKE '%rex%' AND age > 3"),
+            'SELECT * FROM dog WHERE id IN (...) AND name LIKE ? AND age > ?',
+        )
+
+    @override_settings(SLOW_QUERY_MS=10 ** 6, SLOW_QUERY_SAMPLE_RATE=0)
+    def test_fast_queries_are_not_recorded(self):
+        self.client.get(reverse('dogs:breeds'))
+        self.assertEqual(self.slow_queries.entries(), [])
+
+    @override_settings(SLOW_QUERY_SAMPLE_RATE=1, SLOW_QUERY_LOG_SIZE=3)
+    def test_sampled_queries_keep_view_caller_and_plan_in_ring_buffer(self):
+        self.client.get(reverse('dogs:breeds'))
+        entries = self.slow_queries.entries()
+        self.assertEqual(len(entries), 3)
+        self.assertEqual([entry['number'] for entry in entries], sorted((entry['number'] for entry in entries), reverse=True))
+        self.assertGreater(entries[0]['number'], 3)
+        entry = next(entry for entry in entries if 'dogs_breed' in entry['sql'])
+        self.assertEqual(entry['view'], 'dogs:breeds')
+        self.assertEqual(entry['reason'], 'sample')
+        self.assertTrue(entry['caller'].startswith('dogs/'))
+        self.assertTrue(entry['plan'])
+
+    @override_settings(SLOW_QUERY_SAMPLE_RATE=1)
+    def test_plans_are_taken_when_response_is_closed(self):
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+
+        def view(request):
+            list(Breed.objects.all())
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        with mock.patch.object(self.slow_queries, 'explain', return_value='plan') as explain:
+            response = self.slow_queries.SlowQueryMiddleware(view)(request)
+            self.assertEqual((explain.call_count, self.slow_queries.entries()), (0, []))
+            response.close()
+        explain.assert_called_once()
+        self.assertEqual([entry['plan'] for entry in self.slow_queries.entries()], ['plan'])
+
+    @override_settings(SLOW_QUERY_SAMPLE_RATE=1)
+    def test_admin_page_is_staff_only_and_clears_log(self):
+        self.client.get(reverse('dogs:breeds'))
+        self.assertEqual(self.client.get(reverse('slow_queries')).status_code, 302)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('slow_queries'))
+        self.assertContains(response, 'dogs_breed')
+        self.client.post(reverse('slow_queries'))
+        # Остаются только запросы самой очистки (сессия и пользователь)
+        self.assertFalse([entry for entry in self.slow_queries.entries() if 'dogs_breed' in entry['sql']])
+
+
+class NPlusOneTests(NPlusOneTestMixin, TestCase):
+    """
+    Проверяет, что страницы каталога и профилей не повторяют запросы для каждой собаки или породы.
+    """
+    n_plus_one_threshold = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('collector', 'collector@example.com', 'password')
+        for i in range(6):
+            breed = Breed.objects.create(name=f'Порода {i}')
+            for j in range(3):
+                dog = Dog.objects.create(name=f'Собака {i}-{j}', breed=breed, age=2, owner=cls.user)
+                Review.objects.create(dog=dog, user=cls.user, text='Отзыв', rating=4)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        facets.shared_index.reset()
+        self.client.force_login(self.user)
+
+    def test_catalog_and_profile_pages_do_not_repeat_queries(self):
+        facets.shared_index.sync()
+        for url in (
+            reverse('dogs:breeds'),
+            reverse('dogs:dogs_list'),
+            reverse('users:user_detail', args=[self.user.pk]),
+            reverse('users:user_profile'),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_assertion_reports_repeated_query_location(self):
+        with self.assertRaisesMessage(AssertionError, '18x dogs/tests.py'):
+            with self.assertNoNPlusOne():
+                [dog.breed.name for dog in Dog.objects.all()]
+
+    @override_settings(N_PLUS_ONE_DETECTION='warn', N_PLUS_ONE_THRESHOLD=0)
+    def test_middleware_warns_with_header(self):
+        with self.assertLogs('my_project.n_plus_one', 'WARNING'):
+            response = self.client.get(reverse('dogs:breeds'))
+        self.assertRegex(response[N_PLUS_ONE_HEADER], r'^\d+ repeated; \d+x ')
+
+
+class ProfilerTests(TestCase):
+    """
+    Проверяет профилирование запросов персонала, хранение профилей и страницы администратора.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('visitor', 'visitor@example.com', 'password')
+        cls.staff = User.objects.create_user('profiler', 'profiler@example.com', 'password', is_staff=True)
+        Breed.objects.create(name='Пудель')
+
+    def setUp(self):
+        from my_project import profiler
+
+        self.profiler = profiler
+        cache.clear()
+        spool = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool)
+        override = override_settings(PROFILE_SPOOL_DIR=spool, PROFILE_SPOOL_SIZE=2, PROFILE_SAMPLE_INTERVAL=0.0005)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_only_staff_requests_are_profiled(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('dogs:breeds') + '?_profile=sample')
+        self.assertNotIn(self.profiler.ID_HEADER, response)
+        self.assertEqual(self.profiler.profiles(), [])
+        self.assertEqual(self.client.get(reverse('profiles')).status_code, 302)
+
+    def test_sampled_profile_is_listed_and_rendered_as_flamegraph(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('dogs:breeds'), HTTP_X_PROFILE='sample')
+        profile_id = response[self.profiler.ID_HEADER]
+        self.assertContains(self.client.get(reverse('profiles')), profile_id)
+        self.assertContains(self.client.get(reverse('profile_detail', args=[profile_id])), '<svg')
+        download = self.client.get(reverse('profile_download', args=[profile_id]))
+        self.assertEqual(download['Content-Disposition'], f'attachment; filename="{profile_id}.collapsed"')
+
+    def test_cprofile_mode_shows_pstats_table(self):
+        self.client.force_login(self.staff)
+        profile_id = self.client.get(reverse('dogs:breeds') + '?_profile=cprofile')[self.profiler.ID_HEADER]
+        self.assertContains(self.client.get(reverse('profile_detail', args=[profile_id])), 'function calls')
+
+    def test_spool_keeps_only_latest_profiles(self):
+        self.client.force_login(self.staff)
+        ids = [self.client.get(reverse('dogs:index') + '?_profile=1')[self.profiler.ID_HEADER] for _ in range(3)]
+        self.assertEqual([profile['id'] for profile in self.profiler.profiles()], ids[:0:-1])
+        self.assertEqual(len(os.listdir(self.profiler.spool_dir())), 4)
+
+    def test_flamegraph_widths_follow_sample_counts(self):
+        stacks = self.profiler.parse_collapsed('main (app.py:1);render (app.py:5) 3\nmain (app.py:1);query (db.py:2) 1\n')
+        self.assertEqual(stacks['main (app.py:1);render (app.py:5)'], 3)
+        svg = self.profiler.flamegraph(stacks, width=400)
+        self.assertIn('<title>render (app.py:5) (3 выб., 75.0%)</title>', svg)
+        self.assertIn('width="300.0"', svg)
+
+
+class TemplateProfilerTests(TestCase):
+    """
+    Проверяет замер шаблонов, тегов, итераций и обращений к переменным (?_profile=templates).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('designer', 'designer@example.com', 'password', is_staff=True)
+        for i in range(4):
+            Breed.objects.create(name=f'Терьер {i}')
+
+    def setUp(self):
+        from my_project import profiler, template_profiler
+
+        self.profiler = profiler
+        self.template_profiler = template_profiler
+        cache.clear()
+        spool = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool)
+        override = override_settings(PROFILE_SPOOL_DIR=spool)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client.force_login(self.staff)
+
+    def test_recorder_counts_templates_loops_and_lookups(self):
+        from django.template import Context, Template
+
+        template = Template('{% for item in items %} {{ item.name }}{% endfor %}')
+        with self.template_profiler.recording() as recorder:
+            template.render(Context({'items': [{'name': 'a'}, {'name': 'b'}, {'name': 'c'}]}))
+        report = recorder.report()
+        loop = next(entry for entry in report['nodes'] if entry['node'] == 'ForNode')
+        self.assertEqual((loop['renders'], loop['iterations'], loop['contents']), (1, 3, 'for item in items'))
+        self.assertEqual(report['iterations'], 3)
+        self.assertEqual(dict(report['lookups'])['item.name'], 3)
+        self.assertGreaterEqual(loop['total'], loop['self'])
+
+    def test_patches_are_removed_after_recording(self):
+        from django.template.base import Node
+
+        original = Node.render_annotated
+        with self.template_profiler.recording():
+            self.assertIsNot(Node.render_annotated, original)
+        self.assertIs(Node.render_annotated, original)
+
+    def test_templates_profile_reports_base_and_page_templates(self):
+        response = self.client.get(reverse('dogs:breeds') + '?_profile=templates')
+        profile_id = response[self.profiler.ID_HEADER]
+        _, data_path = self.profiler.load(profile_id)
+        stats = json.loads(data_path.read_text(encoding='utf-8'))
+        self.assertEqual({'dogs/breeds.html', 'base.html'} - {entry['template'] for entry in stats['templates']}, set())
+        loop = next(entry for entry in stats['nodes'] if entry['contents'] == 'for breed_data in breeds_data')
+        self.assertEqual(loop['iterations'], 4)
+        page = self.client.get(reverse('profile_detail', args=[profile_id]))
+        self.assertContains(page, 'dogs/breeds.html:')
+        self.assertContains(page, 'Итераций циклов')
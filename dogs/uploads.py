@@ -0,0 +1,467 @@
+# dogs/uploads.py
+"""
+Потоковая загрузка фотографий собак и пород.
+
+ImageUploadHandler (FILE_UPLOAD_HANDLERS в settings.py) принимает файлы
+полей с именами из IMAGE_FIELDS. Файл не держится в памяти: части
+запроса по мере поступления разбираются и сразу пишутся во временный файл
+на диске, так что на один загружаемый файл приходится не больше
+одного заголовочного сегмента (до 64 КБ) в памяти.
+
+По ходу записи:
+    - формат (JPEG, PNG, WebP) определяется по сигнатуре в начале файла,
+      а не по расширению или Content-Type;
+    - ширина и высота читаются из заголовка (SOF у JPEG, IHDR у PNG,
+      VP8/VP8L/VP8X у WebP) без декодирования пикселей; слишком большие
+      изображения отклоняются сразу, остаток файла не записывается;
+    - удаляются метаданные: EXIF и XMP (APP1 у JPEG, eXIf и текстовые
+      блоки у PNG, EXIF и XMP у WebP). У JPEG сохраняется только
+      ориентация (минимальный блок EXIF), чтобы фото с телефона
+      не оказалось повернутым.
+
+Ошибку загрузки показывает поле формы ImageUploadField, которому
+обработчик передает уже известные формат и размеры, поэтому форма
+не открывает файл в Pillow повторно.
+"""
+import os
+from collections import namedtuple
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+# Имена полей формы, файлы которых принимает ImageUploadHandler (Dog.image, Breed.image)
+IMAGE_FIELDS = {'image'}
+# Сколько байт от начала файла можно прочитать в поисках размеров изображения
+HEADER_LIMIT = 1024 * 1024
+
+ImageInfo = namedtuple('ImageInfo', 'format content_type width height')
+
+
+class UploadRejected(Exception):
+    """
+    Файл не прошел проверку; текст исключения показывается пользователю.
+    """
+
+
+def _check_dimensions(image_format, content_type, width, height):
+    """
+    Проверяет размеры из заголовка и возвращает ImageInfo.
+    """
+    if not width or not height:
+        raise UploadRejected('Не удалось определить размеры изображения.')
+    max_side = settings.IMAGE_UPLOAD_MAX_SIDE
+    if width > max_side or height > max_side or width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise UploadRejected(
+            f'Изображение слишком большое ({width}x{height}). '
+            f'Допустимо не больше {max_side} точек по стороне и {settings.IMAGE_UPLOAD_MAX_PIXELS // 1_000_000} Мп.'
+        )
+    return ImageInfo(image_format, content_type, width, height)
+
+
+class _StreamParser:
+    """
+    Разбирает файл по частям: заголовочные блоки собираются в буфер
+    (need() байт) и обрабатываются step(), данные изображения
+    передаются в write() без буферизации.
+    """
+
+    def __init__(self, write):
+        self._write = write
+        self.buffer = bytearray()
+        self.info = None
+        self.written = 0
+        self.read = 0
+        self.passthrough = 0  # Сколько следующих байт записать как есть
+        self.skip = 0  # Сколько следующих байт отбросить
+        self.streaming = False  # Дальше весь поток пишется без разбора
+
+    def write(self, data):
+        self._write(bytes(data))
+        self.written += len(data)
+
+    def feed(self, data):
+        view = memoryview(data)
+        self.read += len(data)
+        position = 0
+        while position < len(view):
+            if self.passthrough:
+                size = min(self.passthrough, len(view) - position)
+                self.write(view[position:position + size])
+                self.passthrough -= size
+                position += size
+                continue
+            if self.streaming:
+                self.write(view[position:])
+                return
+            if self.skip:
+                size = min(self.skip, len(view) - position)
+                self.skip -= size
+                position += size
+                continue
+            missing = self.need() - len(self.buffer)
+            self.buffer += view[position:position + missing]
+            position += missing
+            if len(self.buffer) >= self.need():
+                self.step()
+        if self.info is None and self.read > HEADER_LIMIT:
+            raise UploadRejected('Не удалось определить размеры изображения.')
+
+    def need(self):
+        raise NotImplementedError
+
+    def step(self):
+        raise NotImplementedError
+
+    def finish(self, file):
+        """
+        Вызывается после записи всего файла.
+        """
+        if self.info is None or self.buffer or self.passthrough or self.skip:
+            raise UploadRejected('Файл изображения поврежден или загружен не полностью.')
+
+
+class _JPEGParser(_StreamParser):
+    # Маркеры SOF с размерами кадра (кроме DHT C4, JPG C8 и DAC CC)
+    SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+    # Маркеры без длины: TEM и RST0-RST7
+    STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+    APP1 = 0xE1
+    SOS = 0xDA
+
+    state = 'start'
+
+    def need(self):
+        if self.state in ('start', 'marker'):
+            return 2
+        if self.state == 'length':
+            return 4
+        return 2 + int.from_bytes(self.buffer[2:4], 'big')
+
+    def step(self):
+        buffer = self.buffer
+        if self.state == 'start':
+            if buffer != b'\xff\xd8':
+                raise UploadRejected('Файл не является изображением JPEG.')
+            self.write(buffer)
+            self.buffer = bytearray()
+            self.state = 'marker'
+        elif self.state == 'marker':
+            if buffer[0] != 0xFF:
+                raise UploadRejected('Файл изображения поврежден.')
+            if buffer[1] == 0xFF:
+                # Байт-заполнитель перед маркером
+                del buffer[0]
+            elif buffer[1] in self.STANDALONE_MARKERS:
+                self.write(buffer)
+                self.buffer = bytearray()
+            elif buffer[1] in (0x00, 0xD8, 0xD9):
+                raise UploadRejected('Файл изображения поврежден.')
+            else:
+                self.state = 'length'
+        elif self.state == 'length':
+            marker, length = buffer[1], int.from_bytes(buffer[2:4], 'big')
+            if length < 2:
+                raise UploadRejected('Файл изображения поврежден.')
+            if marker == self.APP1 or marker == self.SOS or marker in self.SOF_MARKERS:
+                # Сегмент читается целиком: из APP1 (EXIF, XMP) берется только ориентация,
+                # из SOF - размеры; сегменты не длиннее 64 КБ
+                self.state = 'segment'
+            else:
+                self.write(buffer)
+                self.buffer = bytearray()
+                self.passthrough = length - 2
+                self.state = 'marker'
+            if self.state == 'segment' and len(buffer) >= self.need():
+                self.step()
+        else:
+            marker = buffer[1]
+            self.buffer = bytearray()
+            self.state = 'marker'
+            if marker == self.APP1:
+                if buffer[4:10] == b'Exif\x00\x00':
+                    orientation = _exif_orientation(bytes(buffer[10:]))
+                    if orientation and orientation != 1:
+                        self.write(_orientation_segment(orientation))
+                return
+            if marker in self.SOF_MARKERS and self.info is None:
+                if len(buffer) < 9:
+                    raise UploadRejected('Файл изображения поврежден.')
+                height = int.from_bytes(buffer[5:7], 'big')
+                width = int.from_bytes(buffer[7:9], 'big')
+                self.info = _check_dimensions('JPEG', 'image/jpeg', width, height)
+            elif marker == self.SOS:
+                if self.info is None:
+                    raise UploadRejected('Не удалось определить размеры изображения.')
+                # Дальше идут сжатые данные; метаданные после них не встречаются
+                self.streaming = True
+            self.write(buffer)
+
+
+def _exif_orientation(tiff):
+    """
+    Возвращает значение тега Orientation (0x0112) из IFD0 блока EXIF или None.
+    """
+    if len(tiff) < 8 or tiff[:2] not in (b'II', b'MM'):
+        return None
+    order = 'little' if tiff[:2] == b'II' else 'big'
+    offset = int.from_bytes(tiff[4:8], order)
+    if offset + 2 > len(tiff):
+        return None
+    count = int.from_bytes(tiff[offset:offset + 2], order)
+    for index in range(count):
+        entry = offset + 2 + index * 12
+        if entry + 12 > len(tiff):
+            break
+        if int.from_bytes(tiff[entry:entry + 2], order) == 0x0112:
+            return int.from_bytes(tiff[entry + 8:entry + 10], order)
+    return None
+
+
+def _orientation_segment(orientation):
+    """
+    Собирает сегмент APP1 с EXIF, в котором есть только тег Orientation.
+    """
+    tiff = (
+        b'MM\x00\x2a\x00\x00\x00\x08'  # Заголовок TIFF, IFD0 со смещения 8
+        + b'\x00\x01'  # Одна запись
+        + b'\x01\x12\x00\x03\x00\x00\x00\x01' + orientation.to_bytes(2, 'big') + b'\x00\x00'
+        + b'\x00\x00\x00\x00'  # Следующего IFD нет
+    )
+    body = b'Exif\x00\x00' + tiff
+    return b'\xff\xe1' + (len(body) + 2).to_bytes(2, 'big') + body
+
+
+class _PNGParser(_StreamParser):
+    SIGNATURE = b'\x89PNG\r\n\x1a\n'
+    # Метаданные: EXIF и текстовые блоки (в них пишут XMP и "Raw profile type exif")
+    DROP_CHUNKS = {b'eXIf', b'tEXt', b'zTXt', b'iTXt'}
+
+    state = 'start'
+
+    def need(self):
+        if self.state == 'start':
+            return 8
+        if self.state == 'chunk':
+            return 8
+        # IHDR: заголовок, 13 байт данных и CRC
+        return 8 + 13 + 4
+
+    def step(self):
+        buffer = self.buffer
+        self.buffer = bytearray()
+        if self.state == 'start':
+            if buffer != self.SIGNATURE:
+                raise UploadRejected('Файл не является изображением PNG.')
+            self.write(buffer)
+            self.state = 'ihdr'
+            return
+        length, chunk_type = int.from_bytes(buffer[:4], 'big'), bytes(buffer[4:8])
+        if self.state == 'ihdr':
+            if chunk_type != b'IHDR' or length != 13:
+                raise UploadRejected('Файл изображения поврежден.')
+            width = int.from_bytes(buffer[8:12], 'big')
+            height = int.from_bytes(buffer[12:16], 'big')
+            self.info = _check_dimensions('PNG', 'image/png', width, height)
+            self.write(buffer)
+            self.state = 'chunk'
+        elif chunk_type in self.DROP_CHUNKS:
+            self.skip = length + 4
+        else:
+            self.write(buffer)
+            self.passthrough = length + 4
+            if chunk_type == b'IEND':
+                self.streaming = True
+
+
+class _WebPParser(_StreamParser):
+    DROP_CHUNKS = {b'EXIF', b'XMP '}
+    # Сколько байт данных первого блока нужно для размеров
+    FIRST_CHUNKS = {b'VP8 ': 10, b'VP8L': 5, b'VP8X': 10}
+    # Флаги VP8X: есть EXIF, есть XMP
+    METADATA_FLAGS = 0x08 | 0x04
+
+    state = 'start'
+
+    def need(self):
+        if self.state == 'start':
+            return 12
+        if self.state == 'chunk' or len(self.buffer) < 8:
+            return 8
+        return 8 + self.FIRST_CHUNKS[bytes(self.buffer[:4])]
+
+    def step(self):
+        buffer = self.buffer
+        if self.state == 'start':
+            if buffer[:4] != b'RIFF' or buffer[8:12] != b'WEBP':
+                raise UploadRejected('Файл не является изображением WebP.')
+            self.write(buffer)
+            self.buffer = bytearray()
+            self.state = 'first'
+            return
+        chunk_type = bytes(buffer[:4])
+        size = int.from_bytes(buffer[4:8], 'little')
+        padded = size + (size & 1)
+        if self.state == 'first' and len(buffer) == 8:
+            if chunk_type not in self.FIRST_CHUNKS or size < self.FIRST_CHUNKS[chunk_type]:
+                raise UploadRejected('Файл изображения поврежден.')
+            if len(buffer) >= self.need():
+                self.step()
+            return
+        self.buffer = bytearray()
+        if self.state == 'first':
+            if chunk_type == b'VP8X':
+                buffer[8] &= ~self.METADATA_FLAGS & 0xFF
+            data = buffer[8:]
+            if chunk_type == b'VP8X':
+                width = int.from_bytes(data[4:7], 'little') + 1
+                height = int.from_bytes(data[7:10], 'little') + 1
+            elif chunk_type == b'VP8L':
+                if data[0] != 0x2F:
+                    raise UploadRejected('Файл изображения поврежден.')
+                bits = int.from_bytes(data[1:5], 'little')
+                width, height = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            else:
+                if data[3:6] != b'\x9d\x01\x2a':
+                    raise UploadRejected('Файл изображения поврежден.')
+                width = int.from_bytes(data[6:8], 'little') & 0x3FFF
+                height = int.from_bytes(data[8:10], 'little') & 0x3FFF
+            self.info = _check_dimensions('WEBP', 'image/webp', width, height)
+            self.write(buffer)
+            self.passthrough = padded - len(data)
+            self.state = 'chunk'
+        elif chunk_type in self.DROP_CHUNKS:
+            self.skip = padded
+        else:
+            self.write(buffer)
+            self.passthrough = padded
+
+    def finish(self, file):
+        """
+        После удаления блоков метаданных исправляет размер в заголовке RIFF.
+        """
+        super().finish(file)
+        file.seek(4)
+        file.write((self.written - 8).to_bytes(4, 'little'))
+        file.seek(0, os.SEEK_END)
+
+
+def _parser_for(header, write):
+    """
+    Выбирает разборщик по сигнатуре первых 12 байт файла.
+    """
+    if header.startswith(b'\xff\xd8\xff'):
+        return _JPEGParser(write)
+    if header.startswith(_PNGParser.SIGNATURE):
+        return _PNGParser(write)
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return _WebPParser(write)
+    raise UploadRejected('Поддерживаются только изображения JPEG, PNG и WebP.')
+
+
+class RejectedImage(SimpleUploadedFile):
+    """
+    Пустой файл на месте отклоненной загрузки; upload_error - причина для формы.
+    """
+
+    def __init__(self, name, error):
+        super().__init__(name, b'')
+        self.upload_error = error
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """
+    Обработчик загрузки изображений: проверка заголовка и удаление метаданных на лету,
+    запись во временный файл. Файлы других полей передаются следующим обработчикам.
+    """
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.active = field_name in IMAGE_FIELDS
+        if not self.active:
+            return
+        self.error = None
+        self.header = bytearray()
+        self.parser = None
+        self.received = 0
+        self.file = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        if self.content_length and self.content_length > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self.reject(self.size_error())
+        raise StopFutureHandlers()
+
+    def size_error(self):
+        return f'Файл слишком большой. Максимальный размер - {settings.IMAGE_UPLOAD_MAX_BYTES // (1024 * 1024)} МБ.'
+
+    def reject(self, error):
+        """
+        Запоминает ошибку и удаляет временный файл; остаток файла из запроса отбрасывается.
+        """
+        self.error = error
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if self.error:
+            return None
+        self.received += len(raw_data)
+        try:
+            if self.received > settings.IMAGE_UPLOAD_MAX_BYTES:
+                raise UploadRejected(self.size_error())
+            if self.parser is None:
+                self.header += raw_data
+                if len(self.header) < 12:
+                    return None
+                self.parser = _parser_for(bytes(self.header[:12]), self.file.write)
+                raw_data, self.header = bytes(self.header), None
+            self.parser.feed(raw_data)
+        except UploadRejected as e:
+            self.reject(str(e))
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        if self.error is None:
+            try:
+                if self.parser is None:
+                    raise UploadRejected('Файл не является изображением.')
+                self.parser.finish(self.file)
+            except UploadRejected as e:
+                self.reject(str(e))
+        if self.error:
+            return RejectedImage(self.file_name, self.error)
+        self.file.seek(0)
+        self.file.size = self.parser.written
+        self.file.content_type = self.parser.info.content_type
+        self.file.image_info = self.parser.info
+        return self.file
+
+    def upload_interrupted(self):
+        if getattr(self, 'active', False) and self.file is not None:
+            self.file.close()
+
+
+class ImageUploadField(forms.ImageField):
+    """
+    Поле изображения, которое использует проверку ImageUploadHandler.
+
+    Если файл пришел через обработчик, формат и размеры уже известны
+    и файл не открывается в Pillow; иначе проверка обычная.
+    """
+
+    def to_python(self, data):
+        error = getattr(data, 'upload_error', None)
+        if error:
+            raise ValidationError(error, code='invalid_image')
+        info = getattr(data, 'image_info', None)
+        if info is None:
+            return super().to_python(data)
+        file = forms.FileField.to_python(self, data)
+        if file is not None:
+            file.content_type = info.content_type
+        return file
@@ -13,7 +13,9 @@ from .views import (
     RemoveDogFromProfileView,
     ReviewUpdateView,  # Добавлено
     ReviewDeleteView,   # Добавлено,
-    BreedDetailView
+    BreedDetailView,
+    AutocompleteView,
+    DogDuplicatesView,
 )
 
 app_name = 'dogs'
@@ -21,11 +23,13 @@ app_name = 'dogs'
 urlpatterns = [
     path('', IndexView.as_view(), name='index'),
     path('breeds/', BreedsView.as_view(), name='breeds'),
+    path('autocomplete/', AutocompleteView.as_view(), name='autocomplete'),
     path('dogs/', DogsListView.as_view(), name='dogs_list'),
     path('dogs/create/', DogCreateView.as_view(), name='dog_create'),
     path('dogs/<slug:slug>/', DogReadView.as_view(), name='dog_read'),
     path('dogs/<slug:slug>/update/', DogUpdateView.as_view(), name='dog_update'),
     path('dogs/<slug:slug>/delete/', DogDeleteView.as_view(), name='dog_delete'),
+    path('dogs/<slug:slug>/duplicates/', DogDuplicatesView.as_view(), name='dog_duplicates'),
     path('dogs/<int:dog_id>/add_to_profile/', AddDogToProfileView.as_view(), name='add_to_profile'),
     path('dogs/<int:dog_id>/remove_from_profile/', RemoveDogFromProfileView.as_view(), name='remove_dog_from_profile'),
     path('reviews/<int:pk>/update/', ReviewUpdateView.as_view(), name='review_update'),  # Добавлено
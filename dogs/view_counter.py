@@ -0,0 +1,197 @@
+# dogs/view_counter.py
+"""
+Буферизованный счетчик просмотров карточек собак.
+
+Просмотры не записываются в базу на каждый запрос. Приращения накапливаются
+в кэше (Redis) в ключах со сроком жизни VIEW_COUNTER_KEY_TTL. Накопленные значения
+сбрасывает в базу команда flush_view_counts (--loop раз в
+VIEW_COUNTER_FLUSH_INTERVAL секунд) атомарными UPDATE ... SET views_count = views_count + n,
+сгруппированными по величине приращения; запросы пользователей сброс не выполняют.
+Если кэш недоступен, просмотр записывается в БД сразу после фиксации транзакции.
+
+Основные функции:
+    record_view(dog_id): Учитывает один просмотр и возвращает число
+        несброшенных просмотров собаки.
+    pending_views(dog_id): Возвращает число несброшенных просмотров.
+    live_views_count(dog): Значение из БД плюс несброшенные просмотры.
+    flush(): Сбрасывает все накопленные просмотры в БД.
+    claim_milestone(dog_id, views_count): Разрешает одно уведомление о круглом числе просмотров.
+"""
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'dog_views:pending:'
+MILESTONE_PREFIX = 'dog_views:milestone:'
+MILESTONE_STEP = 100  # Уведомление владельцу - на каждые 100 просмотров
+
+# Идентификаторы собак, для которых этот процесс писал приращения в кэш.
+# Нужны для бэкендов кэша без перебора ключей (например, locmem).
+_known_ids = set()
+_lock = threading.Lock()
+
+
+def _key(dog_id):
+    return f'{KEY_PREFIX}{dog_id}'
+
+
+def _add_pending(dog_id, delta):
+    """
+    Прибавляет delta к счетчику собаки в кэше и возвращает новое значение.
+
+    Срок жизни ключа задается при создании и не продлевается приращениями:
+    если сброс не работает дольше VIEW_COUNTER_KEY_TTL, просмотры теряются,
+    но ключи не копятся в кэше бесконечно.
+    """
+    key = _key(dog_id)
+    cache.add(key, 0, timeout=settings.VIEW_COUNTER_KEY_TTL)
+    pending = cache.incr(key, delta)
+    with _lock:
+        _known_ids.add(dog_id)
+    return pending
+
+
+def record_view(dog_id):
+    """
+    Учитывает один просмотр собаки.
+
+    Args:
+        dog_id (int): Идентификатор собаки.
+
+    Returns:
+        int: Количество несброшенных просмотров собаки после приращения.
+    """
+    try:
+        return _add_pending(dog_id, 1)
+    except Exception as e:
+        from .models import Dog
+
+        logger.warning(f"Кэш недоступен, просмотр записывается в БД: {e}")
+        transaction.on_commit(lambda: Dog.objects.filter(pk=dog_id).update(views_count=F('views_count') + 1))
+        return 0
+
+
+def pending_views(dog_id):
+    """
+    Возвращает количество просмотров собаки, еще не записанных в БД.
+    """
+    try:
+        return cache.get(_key(dog_id)) or 0
+    except Exception:
+        return 0
+
+
+def live_views_count(dog):
+    """
+    Возвращает актуальное количество просмотров: значение из БД плюс буфер.
+    """
+    return dog.views_count + pending_views(dog.pk)
+
+
+def _cached_dog_ids():
+    """
+    Возвращает идентификаторы собак, для которых в кэше есть приращения.
+    """
+    ids = set()
+    if hasattr(cache, 'iter_keys'):  # django-redis
+        for key in cache.iter_keys(f'{KEY_PREFIX}*'):
+            try:
+                ids.add(int(key[len(KEY_PREFIX):]))
+            except ValueError:
+                continue
+    with _lock:
+        ids |= _known_ids
+    return ids
+
+
+def _collect_deltas():
+    """
+    Забирает накопленные приращения из кэша.
+
+    Из кэша значение вычитается через decr, поэтому просмотры, пришедшие
+    во время сброса, не теряются.
+
+    Returns:
+        dict: {dog_id: приращение}.
+    """
+    deltas = Counter()
+    try:
+        dog_ids = _cached_dog_ids()
+        keys = {_key(dog_id): dog_id for dog_id in dog_ids}
+        values = cache.get_many(list(keys))
+        for key, value in values.items():
+            if value:
+                cache.decr(key, value)
+                deltas[keys[key]] += value
+        with _lock:
+            _known_ids.difference_update(dog_id for dog_id in dog_ids if _key(dog_id) not in values)
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать счетчики просмотров из кэша: {e}")
+
+    return deltas
+
+
+def _restore(deltas):
+    """
+    Возвращает несброшенные приращения в кэш.
+    """
+    try:
+        for dog_id, delta in deltas.items():
+            _add_pending(dog_id, delta)
+    except Exception as e:
+        logger.error(f"Потеряны просмотры {dict(deltas)}: не удалось вернуть их в кэш: {e}")
+
+
+def flush():
+    """
+    Записывает все накопленные просмотры в БД.
+
+    Собаки группируются по величине приращения, и для каждой группы
+    выполняется один UPDATE с F('views_count') + n.
+
+    Returns:
+        int: Общее количество записанных просмотров.
+    """
+    from .models import Dog
+
+    deltas = _collect_deltas()
+    if not deltas:
+        return 0
+
+    groups = defaultdict(list)
+    for dog_id, delta in deltas.items():
+        groups[delta].append(dog_id)
+
+    try:
+        with transaction.atomic():
+            for delta, dog_ids in groups.items():
+                Dog.objects.filter(pk__in=dog_ids).update(views_count=F('views_count') + delta)
+    except Exception:
+        # Возвращаем приращения в кэш, чтобы не потерять просмотры
+        _restore(deltas)
+        raise
+
+    return sum(deltas.values())
+
+
+def claim_milestone(dog_id, views_count):
+    """
+    Возвращает True, если уведомление о views_count просмотрах нужно отправить.
+
+    Кратность проверяется по значению, которое видит запрос, а отметка в кэше
+    (cache.add) гарантирует, что о каждой сотне просмотров уведомит только
+    один запрос, даже если несколько воркеров увидели одно и то же число.
+    """
+    if not views_count or views_count % MILESTONE_STEP:
+        return False
+    try:
+        return cache.add(f'{MILESTONE_PREFIX}{dog_id}:{views_count}', 1, timeout=settings.VIEW_COUNTER_KEY_TTL)
+    except Exception:
+        return False
@@ -1,50 +1,96 @@
 # dogs/views.py
+import os
+
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Breed, Dog, Review
+from .models import Breed, Dog, Review, Pedigree, fields_without_counters
+from . import autocomplete, cards, conditional, duplicates, facets, featured, images, ratings, search, view_counter
+from .page_cache import PageCacheMixin
+from .pagination import CursorPaginationMixin
 from .forms import DogForm, ReviewForm, ReviewUpdateForm, PedigreeFormSet  # Import PedigreeFormSet
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse, reverse_lazy
-from django.http import JsonResponse, Http404
+from django.http import FileResponse, HttpResponseRedirect, JsonResponse, Http404
 from django.views import View
 from django.views.generic import TemplateView, ListView, CreateView, UpdateView, DeleteView, DetailView, FormView
 from django.contrib import messages
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.core.exceptions import ValidationError
-from django.core.mail import send_mail
+from users.outbox import enqueue_mail
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.utils import timezone
+from django.utils.safestring import mark_safe
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, urlencode
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Count, Max, Q, Prefetch
+from django.db.models.functions import Substr
 
 
-class DogsListView(LoginRequiredMixin, ListView):
+class DogsListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     """
     Представление для отображения списка всех собак.
 
     Позволяет пользователям просматривать список собак, добавлять отзывы и фильтровать/искать собак.
+    Страница укладывается в фиксированное число запросов (см. query_budget):
+    порода и владелец загружаются через select_related, из собаки выбираются только
+    поля карточки, а из отзывов - только последние reviews_per_dog для каждой собаки.
+    Поддерживает курсорную пагинацию (?paginate=cursor, см. dogs/pagination.py)
+    и фасетные фильтры с количествами из индекса в памяти (см. dogs/facets.py).
+    Карточки собак берутся из кэша фрагментов (dogs/cards.py); отзывы загружаются
+    только для карточек, которых в кэше нет.
     Требует авторизации.
     """
     model = Dog
     template_name = 'dogs/dogs_list.html'
     context_object_name = 'dogs'
     paginate_by = 6
+    reviews_per_dog = 3  # Сколько последних отзывов показывается в карточке
+    snippet_length = 200  # Длина фрагмента описания в карточке
+    # Сессия, пользователь, COUNT(*) (в курсорном режиме - ограниченный), страница собак,
+    # отзывы (только если не все карточки есть в кэше)
+    query_budget = 5
+    card_fields = (
+        'name', 'slug', 'age', 'image', 'image_derivatives', 'views_count', 'review_count', 'rating_avg', 'updated_at',
+        'breed__name', 'breed__updated_at', 'owner__username',
+    )
+    # Варианты сортировки: параметр ?sort= -> поля order_by
+    sort_options = {
+        '': ('pk',),
+        'name': ('name', 'pk'),
+        'rating': ('-rating_avg', '-pk'),
+        'reviews': ('-review_count', '-pk'),
+    }
 
     def get_queryset(self):
         """
         Возвращает отфильтрованный список объектов Dog.
 
-        Фильтрует по запросу поиска, если он предоставлен.
+        Фильтрует по запросу поиска, если он предоставлен, и без явной сортировки
+        упорядочивает найденных собак по релевантности.
+        Фильтрует по выбранным фасетам (рейтинг - тоже фасет), сортирует по параметру sort. Вместо полного описания загружает только его начало (description_snippet).
+        Последние отзывы загружаются в get_context_data и только для карточек, которых нет в кэше.
         """
-        queryset = Dog.objects.all().prefetch_related('reviews__user')
+        queryset = (
+            Dog.objects.select_related('breed', 'owner')
+            .only(*self.card_fields)
+            # Берем на символ больше, чтобы шаблон мог показать многоточие
+            .annotate(description_snippet=Substr('description', 1, self.snippet_length + 1))
+        )
+        ordering = self.sort_options.get(self.request.GET.get('sort'), self.sort_options[''])
 
-        # ПОИСК
+        # ПОИСК по кличке, владельцу, породе и описанию (dogs/search.py)
         search_query = self.request.GET.get('q')
         if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) | Q(owner__username__icontains=search_query)
-            )
+            queryset = search.search('dog', queryset, search_query)
+            if not self.request.GET.get('sort'):
+                ordering = ('-search_rank', '-pk')  # Без явной сортировки - по релевантности
+        queryset = queryset.order_by(*ordering)
+
+        # Фасеты: порода, возраст, год рождения, родословная, владелец, город, рейтинг
+        self.facet_selection = facets.parse_selection(self.request.GET)
+        queryset = facets.filter_queryset(queryset, self.facet_selection)
 
         return queryset
 
@@ -52,19 +98,43 @@ class DogsListView(LoginRequiredMixin, ListView):
         """
         Добавляет дополнительные данные в контекст шаблона.
 
-        Включает заголовок, форму отзыва и запрос поиска.
+        Включает заголовок, форму отзыва, запрос поиска и фасеты с количествами
+        (считаются в памяти; при поиске - среди найденных собак, которые
+        загружаются одним запросом идентификаторов).
         """
         context = super().get_context_data(**kwargs)
         context['title'] = 'Список всех собак'
         context['review_form'] = ReviewForm()
         context['search_query'] = self.request.GET.get('q', '')  # Передаем запрос в шаблон
+        context['search_truncated'] = bool(context['search_query']) and search.truncated('dog', context['search_query'])
+        context['search_limit'] = settings.SEARCH_MAX_RESULTS
+        context['snippet_length'] = self.snippet_length
+        context['sort'] = self.request.GET.get('sort', '')
+        search_ids = None
+        if context['search_query']:
+            search_ids = search.search('dog', Dog.objects.all(), context['search_query']).values_list('pk', flat=True)
+        context['facets'], context['facet_total'] = facets.facet_context(self.facet_selection, search_ids)
+        context['card_query'] = urlencode({'page': self.request.GET.get('page', ''), 'q': context['search_query']})
+        cards.attach_cards(list(context['page_obj']), self.reviews_prefetch(), self.snippet_length)
         return context
 
+    def reviews_prefetch(self):
+        """
+        Возвращает загрузку последних reviews_per_dog отзывов собаки в dog.latest_reviews.
+        """
+        reviews = (
+            Review.objects.select_related('user')
+            .only('dog_id', 'text', 'rating', 'created_at', 'updated_at', 'user__username')
+            .order_by('-created_at')[:self.reviews_per_dog]
+        )
+        return Prefetch('reviews', queryset=reviews, to_attr='latest_reviews')
+
     def post(self, request, *args, **kwargs):
         """
         Обрабатывает POST-запросы для добавления отзывов к собакам.
 
-        Сохраняет новый отзыв, связанный с собакой и пользователем.
+        Сохраняет новый отзыв, связанный с собакой и пользователем,
+        и в той же транзакции обновляет агрегаты рейтинга.
         """
         dog_id = request.POST.get('dog_id')
         dog = get_object_or_404(Dog, pk=dog_id)
@@ -74,11 +144,14 @@ class DogsListView(LoginRequiredMixin, ListView):
             review = form.save(commit=False)
             review.dog = dog
             review.user = request.user
-            review.save()
+            with transaction.atomic():
+                review.save()
+                ratings.review_created(review)  # Обновляем агрегаты рейтинга собаки и породы
             messages.success(request, 'Спасибо за ваш отзыв!')
             return redirect(reverse('dogs:dogs_list') + f'?page={request.GET.get("page", 1)}&q={self.request.GET.get("q", "")}')
         else:
             messages.error(request, 'Пожалуйста, исправьте ошибки в форме.')
+            self.object_list = self.get_queryset()
             context = self.get_context_data()
             context['review_form'] = form
             return self.render_to_response(context)
@@ -103,7 +176,7 @@ class AddDogToProfileView(LoginRequiredMixin, View):
             messages.error(request, f"Собака '{dog.name}' уже принадлежит {dog.owner.username}.")
         else:
             dog.owner = request.user
-            dog.save()
+            dog.save(update_fields=['owner', 'updated_at'])
             messages.success(request, f"Собака '{dog.name}' успешно добавлена в ваш профиль.")
 
         return redirect(reverse('dogs:dogs_list') + f'?q={self.request.GET.get("q", "")}')  # Передаем параметр поиска
@@ -125,7 +198,7 @@ class RemoveDogFromProfileView(LoginRequiredMixin, View):
         try:
             dog = get_object_or_404(Dog, pk=dog_id, owner=request.user)
             dog.owner = None
-            dog.save()
+            dog.save(update_fields=['owner', 'updated_at'])
             return JsonResponse({'message': f'Собака "{dog.name}" успешно удалена из профиля.'})
         except Http404:
             return JsonResponse({'message': 'У вас нет прав на удаление этой собаки.'}, status=403)
@@ -133,72 +206,215 @@ class RemoveDogFromProfileView(LoginRequiredMixin, View):
             return JsonResponse({'message': f'Произошла ошибка: {str(e)}'}, status=500)
 
 
-class IndexView(LoginRequiredMixin, TemplateView):
+class AutocompleteView(LoginRequiredMixin, View):
+    """
+    Представление для автодополнения кличек собак и названий пород.
+
+    Отвечает JSON из индекса в памяти процесса (dogs/autocomplete.py); к БД обращается
+    только проверка авторизации. Требует авторизации, как и списки, в которых ищут.
+
+    Параметры запроса:
+        q: Префикс названия.
+        kind: 'breed' или 'dog' - ограничить вид подсказок.
+    """
+    limit = 10
+
+    def get(self, request):
+        kind = request.GET.get('kind')
+        if kind not in autocomplete.KIND_ORDER:
+            kind = None
+        suggestions = autocomplete.suggest(request.GET.get('q', '')[:100], self.limit, kind)
+        dogs_url = reverse('dogs:dogs_list')
+        results = [
+            {
+                'kind': entry_kind,
+                'label': label,
+                'url': reverse('dogs:breed_detail', kwargs={'slug': value})
+                if entry_kind == autocomplete.KIND_BREED else f"{dogs_url}?{urlencode({'q': label})}",
+            }
+            for entry_kind, label, value in suggestions
+        ]
+        return JsonResponse({'results': results})
+
+
+class DogDuplicatesView(LoginRequiredMixin, View):
+    """
+    Представление для поиска собак с похожей фотографией (JSON).
+
+    Похожие собаки ищутся по перцептивным хэшам в индексе в памяти процесса
+    (dogs/duplicates.py), из БД читаются только сами найденные собаки.
+
+    Параметры запроса:
+        distance: Максимальное расстояние pHash (по умолчанию DUPLICATES_MAX_DISTANCE, не больше 32).
+        dhash_distance: Максимальное расстояние dHash (по умолчанию DUPLICATES_DHASH_DISTANCE).
+    """
+    limit = 50
+
+    def int_param(self, name, default):
+        try:
+            return min(max(int(self.request.GET[name]), 0), 32)
+        except (KeyError, ValueError):
+            return default
+
+    def get(self, request, slug):
+        dog = get_object_or_404(Dog.objects.only('pk', 'image_dhash', 'image_phash'), slug=slug)
+        if dog.image_phash is None:
+            return JsonResponse({'results': []})
+        duplicates.shared_index.sync()
+        found = duplicates.shared_index.near(
+            duplicates.from_db(dog.image_phash), duplicates.from_db(dog.image_dhash),
+            max_distance=self.int_param('distance', settings.DUPLICATES_MAX_DISTANCE),
+            dhash_distance=self.int_param('dhash_distance', settings.DUPLICATES_DHASH_DISTANCE),
+            exclude=dog.pk,
+        )[:self.limit]
+        dogs = Dog.objects.select_related('breed').only('name', 'slug', 'image', 'breed__name').in_bulk(
+            [dog_id for dog_id, _, _ in found]
+        )
+        results = [
+            {
+                'id': dog_id,
+                'name': dogs[dog_id].name,
+                'breed': dogs[dog_id].breed.name,
+                'url': reverse('dogs:dog_read', kwargs={'slug': dogs[dog_id].slug}),
+                'image': dogs[dog_id].image.url if dogs[dog_id].image else None,
+                'distance': phash_distance,
+                'dhash_distance': dhash_distance,
+            }
+            for dog_id, phash_distance, dhash_distance in found
+            if dog_id in dogs  # Индекс мог еще не узнать об удалении собаки
+        ]
+        return JsonResponse({'results': results})
+
+
+class ResizedImageView(View):
+    """
+    Представление для уменьшенных копий изображений: /media/r/<ширина>x<высота>/<путь>.
+
+    Копия создается при первом запросе и берется из дискового кэша при следующих
+    (dogs/images.py). Отвечает с ETag и Last-Modified, на условные запросы
+    с совпадающим ETag - 304 без тела. Не требует авторизации и не обращается к БД,
+    как и раздача самих медиафайлов.
+    """
+
+    def get(self, request, width, height, path):
+        try:
+            filename = images.get_resized(path, width, height)
+        except (FileNotFoundError, ValueError):
+            raise Http404('Изображение не найдено')
+        stat = os.stat(filename)
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+        if response is None:
+            response = FileResponse(open(filename, 'rb'))
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(stat.st_mtime)
+        patch_cache_control(response, public=True, max_age=settings.IMAGE_RESIZE_MAX_AGE)
+        return response
+
+
+class IndexView(LoginRequiredMixin, PageCacheMixin, TemplateView):
     """
     Представление для главной страницы.
 
-    Отображает главную страницу приложения.
+    Отображает главную страницу приложения. Страница берется из кэша страниц
+    (dogs/page_cache.py) и сбрасывается только по времени жизни или PAGE_VERSION.
     Требует авторизации.
     """
     template_name = 'dogs/index.html'
     extra_context = {'title': 'Главная страница'}
 
+    def get(self, request, *args, **kwargs):
+        return self.cached_page(request, lambda: super(IndexView, self).get(request, *args, **kwargs))
+
 
-class BreedsView(LoginRequiredMixin, ListView):  # Изменено на ListView
+class BreedsView(LoginRequiredMixin, PageCacheMixin, CursorPaginationMixin, ListView):  # Изменено на ListView
     """
     Представление для отображения списка пород собак.
 
     Отображает список пород с возможностью пагинации и поиска.
+    Пагинация выполняется в БД, а примеры собак для пород текущей страницы
+    выбираются из резервуаров в кэше (dogs/featured.py) и загружаются одним запросом,
+    поэтому число запросов не зависит от размера каталога.
+    Поддерживает курсорную пагинацию (?paginate=cursor, см. dogs/pagination.py).
+    Страницы списка берутся из кэша страниц (dogs/page_cache.py) с метками
+    'breeds' и 'breed:<id>' показанных пород.
     Требует авторизации.
     """
     model = Breed
     template_name = 'dogs/breeds.html'
     context_object_name = 'breeds_data'  # Используем другое имя для удобства
     paginate_by = 6  # Добавлена пагинация
+    sample_size = 3  # Количество собак, показываемых в карточке породы
+    # Варианты сортировки: параметр ?sort= -> поля order_by
+    sort_options = {
+        '': ('name',),
+        'rating': ('-rating_avg', 'name'),
+    }
 
     def get_queryset(self):
         """
-        Возвращает отфильтрованный список пород.
+        Возвращает отфильтрованный QuerySet пород.
 
-        Фильтрует по запросу поиска, если он предоставлен.
+        Фильтрует по запросу поиска, если он предоставлен, и сортирует по параметру sort.
         """
-        breeds = Breed.objects.prefetch_related('dogs')
+        breeds = Breed.objects.all()
+        ordering = self.sort_options.get(self.request.GET.get('sort'), self.sort_options[''])
 
-        #  ПОИСК
+        #  ПОИСК (dogs/search.py)
         search_query = self.request.GET.get('q')
         if search_query:
-            breeds = breeds.filter(name__icontains=search_query)
+            breeds = search.search('breed', breeds, search_query)
+            if not self.request.GET.get('sort'):
+                ordering = ('-search_rank', 'name')  # Без явной сортировки - по релевантности
 
-        breeds_data = []  # Формируем данные для шаблона
-        for breed in breeds:
-            dogs = breed.dogs.order_by('?')[:3]
-            breeds_data.append({'breed': breed, 'dogs': dogs})
+        return breeds.order_by(*ordering)
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Пагинирует QuerySet в БД.
 
-        return breeds_data  # Возвращаем список словарей
+        Неверный или слишком большой номер страницы заменяется ближайшей
+        существующей страницей вместо ошибки 404.
+        В курсорном режиме пагинацию выполняет CursorPaginationMixin.
+        """
+        if self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = self.get_paginator(queryset, page_size)
+        page_obj = paginator.get_page(self.request.GET.get('page'))
+        return paginator, page_obj, page_obj.object_list, page_obj.has_other_pages()
 
     def get_context_data(self, **kwargs):
         """
         Добавляет дополнительные данные в контекст шаблона.
 
-        Включает заголовок, запрос поиска и объект пагинации.
+        Включает заголовок, запрос поиска и объект пагинации,
+        элементы которого содержат породу и примеры собак этой породы.
         """
         context = super().get_context_data(**kwargs)
         context['title'] = 'Породы собак'
         context['search_query'] = self.request.GET.get('q', '')  # Передаем запрос в шаблон
-
-        # Пагинация
-        paginator = Paginator(self.object_list, self.paginate_by)
-        page_number = self.request.GET.get('page')
-        try:
-            page_obj = paginator.get_page(page_number)
-        except PageNotAnInteger:
-            page_obj = paginator.get_page(1)
-        except EmptyPage:
-            page_obj = paginator.get_page(paginator.num_pages)
+        context['search_truncated'] = bool(context['search_query']) and search.truncated('breed', context['search_query'])
+        context['search_limit'] = settings.SEARCH_MAX_RESULTS
+        context['sort'] = self.request.GET.get('sort', '')
+
+        page_obj = context['page_obj']
+        breeds = list(page_obj.object_list)
+        # Случайные собаки берутся из резервуаров в кэше, без ORDER BY NEWID()
+        samples = featured.featured_dogs(
+            [breed.pk for breed in breeds], self.sample_size, Dog.objects.only('name', 'slug', 'breed_id')
+        )
+        page_obj.object_list = [{'breed': breed, 'dogs': samples[breed.pk]} for breed in breeds]
+        self.page_cache_tags = ['breeds'] + [f'breed:{breed.pk}' for breed in breeds]
 
         context['breeds_data'] = page_obj  # Передаем объект страницы
         return context
 
+    def get(self, request, *args, **kwargs):
+        return self.cached_page(request, lambda: super(BreedsView, self).get(request, *args, **kwargs))
+
+    def get_page_cache_tags(self):
+        return getattr(self, 'page_cache_tags', ['breeds'])
+
 
 class DogCreateView(LoginRequiredMixin, CreateView):
     """
@@ -310,11 +526,14 @@ class DogUpdateView(LoginRequiredMixin, UpdateView):
                 return self.form_invalid(form)
 
             form.instance.owner = self.request.user
-            self.object = form.save()  # Сохраняем Dog instance, чтобы использовать его для pedigree_formset
+            # Счетчики не сохраняются: форма загрузила их до приращений, сделанных другими запросами
+            self.object = form.save(commit=False)
+            self.object.save(update_fields=fields_without_counters(self.object))
+            form.save_m2m()
             pedigree_formset.instance = self.object
             pedigree_formset.save()
             messages.success(self.request, f"Информация о собаке '{form.instance.name}' успешно обновлена!")
-            return super().form_valid(form)
+            return HttpResponseRedirect(self.get_success_url())
         else:
             messages.error(self.request, 'Пожалуйста, исправьте ошибки в форме родословной.')
             return self.form_invalid(form)
@@ -375,38 +594,85 @@ class DogDeleteView(LoginRequiredMixin, DeleteView):
         return reverse('dogs:dogs_list') + f'?q={self.request.GET.get("q", "")}'  # Передаем параметр поиска
 
 
-class DogReadView(LoginRequiredMixin, DetailView):
+class DogReadView(LoginRequiredMixin, conditional.ConditionalPageMixin, PageCacheMixin, DetailView):
     """
     Представление для отображения детальной информации о собаке.
 
     Позволяет пользователям просматривать подробную информацию о конкретной собаке.
+    Отвечает 304 на условные запросы, если собака, ее порода и родословная
+    не менялись (dogs/conditional.py). Иначе страница берется из кэша страниц
+    (dogs/page_cache.py) с метками 'dog:<id>' и 'breed:<id>'; число просмотров
+    в нее подставляется при каждом запросе.
     """
+    # Место числа просмотров в закэшированной странице
+    views_count_slot = '<!--views-count-->'
+
     model = Dog
     template_name = 'dogs/dog_read.html'
     context_object_name = 'dog'
     slug_field = 'slug'
     slug_url_kwarg = 'slug'
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('breed')
+
     def get(self, request, *args, **kwargs):
         """
         Обрабатывает GET-запросы.
 
-        Увеличивает счетчик просмотров, если просмотр осуществляется не владельцем.
+        Учитывает просмотр в буфере счетчика, если просмотр осуществляется не владельцем,
+        и показывает актуальное количество просмотров (БД + буфер).
         Отправляет уведомление владельцу, если количество просмотров кратно 100.
+        Просмотр учитывается и тогда, когда страница не изменилась и отдается ответ 304.
         """
         self.object = self.get_object()
-        # Увеличиваем счетчик, если пользователь не владелец
-        if self.object.owner != request.user:
-            self.object.views_count += 1
-            self.object.save()
-
-            # Проверяем кратность 100 и отправляем письмо
-            if self.object.views_count % 100 == 0 and self.object.owner:
+        # Увеличиваем счетчик, если пользователь не владелец.
+        # Просмотр попадает в буфер и позже записывается в БД одним UPDATE.
+        is_owner = self.object.owner_id == request.user.pk
+        if not is_owner:
+            pending = view_counter.record_view(self.object.pk)
+            self.object.views_count += pending
+
+            # Проверяем кратность 100 и отправляем письмо (один раз на каждую сотню)
+            if self.object.owner_id and view_counter.claim_milestone(self.object.pk, self.object.views_count):
                 self.send_views_notification_email(self.object)  # Вызов функции отправки email
 
+        not_modified = self.conditional_response(request)
+        if not_modified is not None:
+            return not_modified
+        if is_owner:
+            self.object.views_count = view_counter.live_views_count(self.object)
+
+        self.is_owner = is_owner
+        return self.finalize_response(self.cached_page(request, self.render_page))
+
+    def render_page(self):
         context = self.get_context_data(object=self.object)
+        context['views_count'] = mark_safe(self.views_count_slot)
         return self.render_to_response(context)
 
+    def get_page_cache_variant(self):
+        # Владелец видит кнопку редактирования, поэтому для него - отдельный вариант
+        return (self.is_owner, *self.page_version)
+
+    def get_page_cache_tags(self):
+        return (f'dog:{self.object.pk}', f'breed:{self.object.breed_id}')
+
+    def fill_page_content(self, content):
+        return content.replace(self.views_count_slot.encode(), str(self.object.views_count).encode())
+
+    def get_page_version(self):
+        """
+        Версия страницы: отметки изменения собаки (включая родословную) и породы
+        и наличие уменьшенных копий фотографии (от него зависит разметка <picture>).
+        """
+        dog = self.object
+        image = dog.image.name if dog.image else ''
+        return (
+            (dog.pk, dog.updated_at, dog.breed.updated_at, image, dog.image_derivatives),
+            max(dog.updated_at, dog.breed.updated_at),
+        )
+
     def get_context_data(self, **kwargs):
         """
         Добавляет дополнительные данные в контекст шаблона.
@@ -428,20 +694,24 @@ class DogReadView(LoginRequiredMixin, DetailView):
         """
         Отправляет уведомление владельцу о количестве просмотров.
 
-        Использует django.core.mail.send_mail для отправки email.
+        Письмо ставится в очередь отправки (users.outbox) и не задерживает ответ.
         """
         subject = f'Вашу собаку {dog.name} просмотрели {dog.views_count} раз!'
         message = f'Поздравляем! Карточку вашей собаки {dog.name} просмотрели {dog.views_count} раз. Спасибо за использование нашего сервиса!'
         from_email = settings.DEFAULT_FROM_EMAIL
         recipient_list = [dog.owner.email]  # Отправляем владельцу
-        send_mail(subject, message, from_email, recipient_list)
+        enqueue_mail(subject, message, recipient_list, from_email=from_email)
 
 
-class BreedDetailView(LoginRequiredMixin, DetailView):  # Добавлено
+class BreedDetailView(LoginRequiredMixin, conditional.ConditionalPageMixin, PageCacheMixin, DetailView):  # Добавлено
     """
     Представление для отображения детальной информации о породе.
 
     Позволяет пользователям просматривать подробную информацию о конкретной породе.
+    Отвечает 304 на условные запросы, если не менялись порода и ее собаки
+    (dogs/conditional.py), иначе берет страницу из кэша страниц с меткой
+    'breed:<id>' (dogs/page_cache.py). Случайные собаки породы при этом остаются
+    теми, что были показаны в сохраненной копии страницы.
     Требует авторизации.
     """
     model = Breed
@@ -449,6 +719,49 @@ class BreedDetailView(LoginRequiredMixin, DetailView):  # Добавлено
     context_object_name = 'breed'
     slug_field = 'slug'
     slug_url_kwarg = 'slug'
+    featured_count = 6  # Количество случайных собак породы на странице
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        not_modified = self.conditional_response(request)
+        if not_modified is not None:
+            return not_modified
+        return self.finalize_response(self.cached_page(request, self.render_page))
+
+    def render_page(self):
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+    def get_page_cache_variant(self):
+        return self.page_version
+
+    def get_page_cache_tags(self):
+        return (f'breed:{self.object.pk}',)
+
+    def get_page_version(self):
+        """
+        Версия страницы: отметка изменения породы, последнее изменение ее собак
+        и их количество (удаление собаки не оставляет отметки времени).
+
+        Один запрос по индексу dog_breed_updated_idx.
+        """
+        breed = self.object
+        image = breed.image.name if breed.image else ''
+        dogs = Dog.objects.filter(breed_id=breed.pk).aggregate(changed=Max('updated_at'), count=Count('pk'))
+        return (
+            (breed.pk, breed.updated_at, dogs['changed'], dogs['count'], image, breed.image_derivatives),
+            max(breed.updated_at, dogs['changed'] or breed.updated_at),
+        )
+
+    def get_context_data(self, **kwargs):
+        """
+        Добавляет дополнительные данные в контекст шаблона.
+
+        Включает заголовок и случайных собак породы из резервуара (dogs/featured.py).
+        """
+        context = super().get_context_data(**kwargs)
+        context['title'] = self.object.name
+        context['featured_dogs'] = featured.featured_dogs([self.object.pk], self.featured_count)[self.object.pk]
+        return context
 
 
 # Добавьте или обновите ProfileView
@@ -501,18 +814,22 @@ class ReviewUpdateView(LoginRequiredMixin, UpdateView):
         # Проверка прав: админ, модератор или владелец отзыва
         if not (self.request.user.is_staff or self.request.user == review.user):
             raise Http404("У вас нет прав на редактирование этого отзыва.")
+        review._original_rating = review.rating  # Нужна для обновления агрегатов рейтинга
         return review
 
     def form_valid(self, form):
         """
         Обрабатывает успешное обновление отзыва.
 
-        Обновляет дату последнего изменения.
+        Обновляет дату последнего изменения и агрегаты рейтинга.
         Отображает сообщение об успехе.
         """
         form.instance.updated_at = timezone.now()  # Обновляем время изменения
+        with transaction.atomic():
+            response = super().form_valid(form)
+            ratings.review_rating_changed(self.object, self.object._original_rating)
         messages.success(self.request, "Отзыв успешно обновлен!")
-        return super().form_valid(form)
+        return response
 
     def form_invalid(self, form):
         """
@@ -553,11 +870,18 @@ class ReviewDeleteView(LoginRequiredMixin, DeleteView):
             raise Http404("У вас нет прав на удаление этого отзыва.")
         return review
 
-    def delete(self, request, *args, **kwargs):
+    def form_valid(self, form):
         """
         Обрабатывает удаление отзыва.
 
+        Удаляет отзыв и в той же транзакции обновляет агрегаты рейтинга,
+        если отзыв еще не был удален другим запросом.
         Отображает сообщение об успехе.
         """
-        messages.success(request, "Отзыв успешно удален.")
-        return super().delete(request, *args, **kwargs)
\ No newline at end of file
+        with transaction.atomic():
+            # Агрегаты уменьшаются, только если отзыв удалил этот запрос, а не параллельный
+            deleted, _ = Review.objects.filter(pk=self.object.pk).delete()
+            if deleted == 1:
+                ratings.review_deleted(self.object)
+        messages.success(self.request, "Отзыв успешно удален.")
+        return HttpResponseRedirect(self.get_success_url())
\ No newline at end of file
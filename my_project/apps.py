@@ -0,0 +1,17 @@
+from django.contrib.staticfiles.apps import StaticFilesConfig as BaseStaticFilesConfig
+
+
+class StaticFilesConfig(BaseStaticFilesConfig):
+    """
+    Настройки django.contrib.staticfiles для collectstatic.
+
+    В STATIC_ROOT не копируются карты исходников и копии Bootstrap, Popper и Holder
+    из static/: шаблоны подключают эти библиотеки с CDN.
+    """
+    ignore_patterns = BaseStaticFilesConfig.ignore_patterns + [
+        '*.map',
+        'bootstrap*.css',
+        'bootstrap*.js',
+        'popper.min.js',
+        'holder.min.js',
+    ]
@@ -14,3 +14,15 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_project.settings')
 
 application = get_asgi_application()
+
+# Статика из STATIC_ROOT (с хэшами в именах и сжатыми копиями) отдается без Django
+from my_project.staticfiles import ASGIStaticFiles  # noqa: E402
+
+application = ASGIStaticFiles(application)
+
+# Индексы автодополнения, фасетов и хэшей фотографий загружаются при старте воркера, а не на первом запросе
+from dogs import autocomplete, duplicates, facets  # noqa: E402
+
+autocomplete.warm()
+facets.shared_index.warm()
+duplicates.shared_index.warm()
@@ -0,0 +1,383 @@
+"""
+Измерение производительности запросов: заголовок Server-Timing и гистограммы в формате Prometheus.
+
+PerformanceMiddleware для каждого запроса измеряет:
+    - полное время обработки;
+    - количество и время запросов к БД (connection.execute_wrapper);
+    - попадания и промахи кэша (InstrumentedCache - обертка над бэкендом кэша);
+    - время рендеринга шаблонов (DjangoTemplates - бэкенд шаблонов с замером
+      времени; вложенные рендеринги не суммируются дважды).
+Результат возвращается персоналу (или всем при DEBUG) в заголовке Server-Timing
+(виден в DevTools браузера): остальным время БД и кэша не показывается. Он же добавляется к гистограммам по имени URL (resolver_match.view_name).
+
+Гистограммы копятся в памяти процесса и раз в METRICS_FLUSH_INTERVAL секунд
+добавляются атомарными incr к общим счетчикам в кэше, поэтому MetricsView
+(/metrics/) показывает сумму по всем воркерам без отдельного сервиса сбора.
+Доступ к /metrics/ - для персонала или с заголовком
+Authorization: Bearer <METRICS_TOKEN>.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates as BaseDjangoTemplates
+from django.utils.crypto import constant_time_compare
+from django.utils.module_loading import import_string
+from django.views import View
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'metrics:'
+SERIES_KEY = 'metrics:series'
+# Границы корзин гистограмм
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+# Гистограммы: имя -> (описание, границы корзин, единица суммы в счетчике)
+HISTOGRAMS = {
+    'request_duration_seconds': ('Время обработки запроса', DURATION_BUCKETS, 1e-6),
+    'db_duration_seconds': ('Время запросов к БД за запрос', DURATION_BUCKETS, 1e-6),
+    'db_queries': ('Количество запросов к БД за запрос', QUERY_BUCKETS, 1),
+    'template_duration_seconds': ('Время рендеринга шаблонов за запрос', DURATION_BUCKETS, 1e-6),
+}
+COUNTERS = {
+    'cache_hits_total': 'Попадания кэша',
+    'cache_misses_total': 'Промахи кэша',
+}
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Показатели одного запроса.
+    """
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.total = 0.0
+
+    def execute(self, execute, sql, params, many, context):
+        """
+        Обертка connection.execute_wrapper: замеряет время каждого запроса к БД.
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def server_timing(self):
+        """
+        Возвращает значение заголовка Server-Timing (длительности в миллисекундах).
+        """
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+            f'cache;dur={self.cache_time * 1000:.1f};desc="hits={self.cache_hits} misses={self.cache_misses}"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ))
+
+
+def current():
+    """
+    Возвращает показатели текущего запроса или None вне PerformanceMiddleware.
+    """
+    return _current.get()
+
+
+class Registry:
+    """
+    Гистограммы и счетчики процесса по меткам (view, method) с периодическим сбросом в кэш.
+
+    Значения хранятся целыми числами (суммы времени - в микросекундах), чтобы
+    их можно было складывать cache.incr.
+    """
+
+    def __init__(self):
+        self.values = Counter()
+        self.series = {}
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    @staticmethod
+    def _series_id(name, labels):
+        return hashlib.blake2b(repr((name, labels)).encode(), digest_size=8).hexdigest()
+
+    def _add(self, name, labels, suffix, value):
+        series_id = self._series_id(name, labels)
+        self.series.setdefault(series_id, (name, labels))
+        self.values[f'{series_id}:{suffix}'] += value
+
+    def observe(self, labels, metrics):
+        """
+        Добавляет показатели запроса к гистограммам с метками labels.
+        """
+        observations = {
+            'request_duration_seconds': metrics.total,
+            'db_duration_seconds': metrics.db_time,
+            'db_queries': metrics.db_queries,
+            'template_duration_seconds': metrics.template_time,
+        }
+        with self.lock:
+            for name, value in observations.items():
+                _, buckets, unit = HISTOGRAMS[name]
+                for index, bound in enumerate(buckets):
+                    if value <= bound:
+                        self._add(name, labels, f'b{index}', 1)
+                self._add(name, labels, 'count', 1)
+                self._add(name, labels, 'sum', round(value / unit))
+            self._add('cache_hits_total', labels, 'value', metrics.cache_hits)
+            self._add('cache_misses_total', labels, 'value', metrics.cache_misses)
+        if time.monotonic() - self.last_flush >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 15):
+            self.flush()
+
+    def flush(self):
+        """
+        Добавляет накопленные значения к общим счетчикам в кэше.
+        """
+        self.last_flush = time.monotonic()
+        with self.lock:
+            values, series = dict(self.values), dict(self.series)
+            self.values.clear()
+        if not values:
+            return
+        try:
+            # Список рядов восстанавливается при каждом сбросе, если параллельная запись его потеряла
+            known = cache.get(SERIES_KEY) or {}
+            if not series.keys() <= known.keys():
+                cache.set(SERIES_KEY, {**known, **series}, timeout=None)
+            for key, value in values.items():
+                if value:
+                    cache.add(KEY_PREFIX + key, 0, timeout=None)
+                    cache.incr(KEY_PREFIX + key, value)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить метрики в кэш: {e}")
+            with self.lock:
+                self.values.update(values)
+
+    def snapshot(self):
+        """
+        Возвращает значения всех воркеров (из кэша) вместе с несброшенными значениями процесса.
+
+        Returns:
+            tuple: ({id ряда: (имя, метки)}, {ключ значения: число}).
+        """
+        with self.lock:
+            values, series = Counter(self.values), dict(self.series)
+        try:
+            series = {**(cache.get(SERIES_KEY) or {}), **series}
+            keys = [KEY_PREFIX + key for key in self._value_keys(series)]
+            for key, value in cache.get_many(keys).items():
+                values[key[len(KEY_PREFIX):]] += value
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать метрики из кэша: {e}")
+        return series, values
+
+    @staticmethod
+    def _value_keys(series):
+        for series_id, (name, _) in series.items():
+            if name in HISTOGRAMS:
+                yield from (f'{series_id}:b{index}' for index in range(len(HISTOGRAMS[name][1])))
+                yield from (f'{series_id}:count', f'{series_id}:sum')
+            else:
+                yield f'{series_id}:value'
+
+    def reset(self):
+        with self.lock:
+            series = {**(cache.get(SERIES_KEY) or {}), **self.series}
+            self.values.clear()
+            self.series.clear()
+        cache.delete_many([KEY_PREFIX + key for key in self._value_keys(series)] + [SERIES_KEY])
+
+
+registry = Registry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(labels, **extra):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in (*labels, *extra.items())) + '}'
+
+
+def render_prometheus(series, values):
+    """
+    Форматирует значения в текстовом формате Prometheus 0.0.4.
+    """
+    by_name = {}
+    for series_id, (name, labels) in sorted(series.items(), key=lambda item: item[1]):
+        by_name.setdefault(name, []).append((series_id, labels))
+    lines = []
+    for name, (help_text, buckets, unit) in HISTOGRAMS.items():
+        lines += [f'# HELP django_{name} {help_text}', f'# TYPE django_{name} histogram']
+        for series_id, labels in by_name.get(name, ()):
+            for index, bound in enumerate(buckets):
+                lines.append(f'django_{name}_bucket{_label_text(labels, le=bound)} {values[f"{series_id}:b{index}"]}')
+            count = values[f'{series_id}:count']
+            lines.append(f'django_{name}_bucket{_label_text(labels, le="+Inf")} {count}')
+            lines.append(f'django_{name}_sum{_label_text(labels)} {values[f"{series_id}:sum"] * unit:.6g}')
+            lines.append(f'django_{name}_count{_label_text(labels)} {count}')
+    for name, help_text in COUNTERS.items():
+        lines += [f'# HELP django_{name} {help_text}', f'# TYPE django_{name} counter']
+        for series_id, labels in by_name.get(name, ()):
+            lines.append(f'django_{name}{_label_text(labels)} {values[f"{series_id}:value"]}')
+    return '\n'.join(lines) + '\n'
+
+
+class PerformanceMiddleware:
+    """
+    Middleware, которое измеряет запрос, добавляет Server-Timing (при DEBUG или персоналу)
+    и обновляет гистограммы.
+
+    Должно стоять в MIDDLEWARE первым, чтобы учитывать время остальных middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    @staticmethod
+    def shows_timing(request):
+        """
+        Проверяет, можно ли вернуть Server-Timing: только при DEBUG или персоналу.
+        """
+        if settings.DEBUG:
+            return True
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_staff
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.execute))
+                response = self.get_response(request)
+        finally:
+            metrics.total = time.perf_counter() - started
+            _current.reset(token)
+        if self.shows_timing(request):
+            response['Server-Timing'] = metrics.server_timing()
+        match = request.resolver_match
+        registry.observe((('view', match.view_name if match else 'unresolved'), ('method', request.method)), metrics)
+        return response
+
+
+class MetricsView(View):
+    """
+    Представление с метриками в текстовом формате Prometheus.
+    """
+
+    def get(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        authorization = request.headers.get('Authorization', '')
+        allowed = (
+            (token and constant_time_compare(authorization, f'Bearer {token}'))
+            or (request.user.is_authenticated and request.user.is_staff)
+        )
+        if not allowed:
+            return HttpResponseForbidden()
+        return HttpResponse(render_prometheus(*registry.snapshot()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class InstrumentedCache:
+    """
+    Бэкенд кэша, который считает попадания, промахи и время обращений текущего запроса.
+
+    Настоящий бэкенд указывается в параметре WRAPPED_BACKEND, остальные
+    параметры передаются ему без изменений:
+
+        CACHES = {'default': {
+            'BACKEND': 'my_project.metrics.InstrumentedCache',
+            'WRAPPED_BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': 'redis://127.0.0.1:6379/0',
+        }}
+
+    Все методы, кроме чтения, передаются бэкенду как есть.
+    """
+    _missing = object()
+
+    def __init__(self, location, params):
+        self._cache = import_string(params['WRAPPED_BACKEND'])(location, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+    def __contains__(self, key):
+        return self.has_key(key)
+
+    def _record(self, started, hits, misses):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.cache_time += time.perf_counter() - started
+            metrics.cache_hits += hits
+            metrics.cache_misses += misses
+
+    def get(self, key, default=None, version=None):
+        started = time.perf_counter()
+        value = self._cache.get(key, self._missing, version=version)
+        hit = value is not self._missing
+        self._record(started, hit, not hit)
+        return value if hit else default
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        started = time.perf_counter()
+        values = self._cache.get_many(keys, version=version)
+        self._record(started, len(values), len(keys) - len(values))
+        return values
+
+
+class _TimedTemplate:
+    """
+    Шаблон бэкенда, render() которого учитывается во времени рендеринга запроса.
+    """
+
+    def __init__(self, template):
+        self._template = template
+
+    def __getattr__(self, name):
+        return getattr(self._template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self._template.render(context, request)
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return self._template.render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            # Шаблоны, отрендеренные внутри другого шаблона, уже входят в его время
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - started
+
+
+class DjangoTemplates(BaseDjangoTemplates):
+    """
+    Бэкенд шаблонов Django, который замеряет время рендеринга (TEMPLATES['BACKEND']).
+    """
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
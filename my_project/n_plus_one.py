@@ -0,0 +1,175 @@
+"""
+Обнаружение N+1: одинаковых запросов, повторяющихся в пределах одного HTTP-запроса.
+
+QueryRepeats (обертка connection.execute_wrapper) считает запросы по отпечатку
+нормализованного SQL (my_project/slow_queries.normalize) и запоминает, где
+выполнился первый из них: тег шаблона ('dogs/breeds.html:35') и строку кода
+проекта ('dogs/views.py:120 get_context_data'). Отпечаток, повторившийся
+больше N_PLUS_ONE_THRESHOLD раз, считается N+1.
+
+Режим задает N_PLUS_ONE_DETECTION:
+    - '' - проверка выключена (по умолчанию, в том числе при DEBUG);
+    - 'warn' - NPlusOneMiddleware пишет повторы в лог и добавляет к ответу
+      заголовок X-N-Plus-One;
+    - 'raise' - middleware выбрасывает NPlusOneError (для тестов).
+
+В тестах NPlusOneTestMixin включает режим 'raise' для запросов тестового
+клиента, а assertNoNPlusOne() проверяет произвольный блок кода.
+"""
+import logging
+import sys
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from my_project import slow_queries
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'X-N-Plus-One'
+
+
+class NPlusOneError(Exception):
+    """
+    Запрос выполнил одинаковые SQL-запросы больше допустимого числа раз.
+    """
+
+
+def template_location():
+    """
+    Возвращает тег шаблона, который сейчас рендерится ('dogs/breeds.html:35'), или ''.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            origin, token = getattr(node, 'origin', None), getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                return f'{origin.template_name}:{token.lineno}'
+        frame = frame.f_back
+    return ''
+
+
+class QueryRepeats:
+    """
+    Обертка connection.execute_wrapper, которая считает запросы по отпечаткам.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.samples = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        normalized = slow_queries.normalize(sql)
+        query_fingerprint = slow_queries.fingerprint(normalized)
+        self.counts[query_fingerprint] += 1
+        if query_fingerprint not in self.samples:
+            self.samples[query_fingerprint] = {
+                'sql': normalized,
+                'template': template_location(),
+                'caller': slow_queries.caller(),
+            }
+        return execute(sql, params, many, context)
+
+    def repeats(self, threshold=None):
+        """
+        Возвращает повторы больше threshold раз, начиная с самого частого.
+
+        Returns:
+            list: словари с ключами count, sql, template и caller.
+        """
+        if threshold is None:
+            threshold = settings.N_PLUS_ONE_THRESHOLD
+        return [
+            {'count': count, **self.samples[query_fingerprint]}
+            for query_fingerprint, count in self.counts.most_common()
+            if count > threshold
+        ]
+
+    @contextmanager
+    def watch(self):
+        """
+        Подключает счетчик ко всем базам данных на время блока.
+        """
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+
+def location(repeat):
+    return ' '.join(part for part in (repeat['template'], repeat['caller']) if part) or 'неизвестно'
+
+
+def describe(repeats):
+    """
+    Возвращает текст отчета о повторах для лога и сообщения об ошибке.
+    """
+    return '\n'.join(f"{repeat['count']}x {location(repeat)}: {repeat['sql']}" for repeat in repeats)
+
+
+class NPlusOneMiddleware:
+    """
+    Middleware, которое сообщает о повторяющихся запросах (см. N_PLUS_ONE_DETECTION).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = settings.N_PLUS_ONE_DETECTION
+        if not mode:
+            return self.get_response(request)
+        with QueryRepeats().watch() as counter:
+            response = self.get_response(request)
+        repeats = counter.repeats()
+        if not repeats:
+            return response
+        report = describe(repeats)
+        if mode == 'raise':
+            raise NPlusOneError(f'{request.method} {request.path}:\n{report}')
+        logger.warning(f"N+1 в {request.method} {request.path}:\n{report}")
+        worst = repeats[0]
+        response[HEADER] = f"{len(repeats)} repeated; {worst['count']}x {location(worst)}"
+        return response
+
+
+class NPlusOneTestMixin:
+    """
+    Примесь для TestCase: запросы тестового клиента с N+1 завершаются ошибкой NPlusOneError.
+
+    Пример:
+        class BreedsViewTests(NPlusOneTestMixin, TestCase):
+            def test_list(self):
+                self.client.get(reverse('dogs:breeds'))  # NPlusOneError при повторах
+
+    Порог можно изменить атрибутом n_plus_one_threshold.
+    """
+    n_plus_one_threshold = None
+
+    def setUp(self):
+        # django.test импортируется только в тестах, а не при загрузке middleware
+        from django.test import override_settings
+
+        super().setUp()
+        overrides = {'N_PLUS_ONE_DETECTION': 'raise'}
+        if self.n_plus_one_threshold is not None:
+            overrides['N_PLUS_ONE_THRESHOLD'] = self.n_plus_one_threshold
+        override = override_settings(**overrides)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    @contextmanager
+    def assertNoNPlusOne(self, threshold=None):
+        """
+        Проверяет, что код внутри блока не повторяет запросы больше threshold раз.
+        """
+        if threshold is None:
+            threshold = self.n_plus_one_threshold
+        with QueryRepeats().watch() as counter:
+            yield counter
+        repeats = counter.repeats(threshold)
+        if repeats:
+            self.fail(f'Повторяющиеся запросы:\n{describe(repeats)}')
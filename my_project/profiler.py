@@ -0,0 +1,345 @@
+"""
+Профилирование отдельных запросов по требованию персонала.
+
+Запрос профилируется, только если пользователь - персонал (is_staff) и запрос
+содержит параметр ?_profile=<режим> или заголовок X-Profile: <режим>:
+    - sample (по умолчанию) - сэмплирующий профилировщик: отдельный поток раз
+      в PROFILE_SAMPLE_INTERVAL секунд снимает стек потока запроса. Результат -
+      свернутые стеки (collapsed stacks, формат flamegraph.pl и speedscope)
+      и flamegraph;
+    - cprofile - cProfile: таблица функций pstats и файл .prof (snakeviz, pstats);
+    - templates - время шаблонов и тегов, итерации циклов и обращения к переменным
+      контекста (my_project/template_profiler.py).
+Остальные запросы проходят через ProfilerMiddleware без дополнительной работы,
+кроме проверки параметра и заголовка.
+
+Профили сохраняются в каталог PROFILE_SPOOL_DIR; хранятся PROFILE_SPOOL_SIZE
+последних, более старые удаляются при сохранении нового. Ответ на профилированный
+запрос содержит заголовок X-Profile-Id, а профили показывает страница
+администратора /admin/profiles/ (ProfileListView, ProfileDetailView).
+"""
+import cProfile
+import io
+import json
+import logging
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.utils import timezone
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+from django.views.generic import TemplateView
+from django.views import View
+
+from my_project import template_profiler
+
+logger = logging.getLogger(__name__)
+
+PARAMETER = '_profile'
+HEADER = 'X-Profile'
+ID_HEADER = 'X-Profile-Id'
+MODES = ('sample', 'cprofile', 'templates')
+# Файлы профиля: <id>.json - описание, <id>.collapsed или <id>.prof - результат
+PROFILE_ID = re.compile(r'^\d{8}T\d{12}-[0-9a-f]{8}$')
+SUFFIXES = {'sample': '.collapsed', 'cprofile': '.prof', 'templates': '.templates'}
+
+_PROJECT_DIR = str(Path(settings.BASE_DIR).resolve())
+
+
+def spool_dir():
+    return Path(settings.PROFILE_SPOOL_DIR)
+
+
+def _frame_label(code):
+    filename = code.co_filename
+    if filename.startswith(_PROJECT_DIR):
+        filename = filename[len(_PROJECT_DIR) + 1:]
+    elif 'site-packages' in filename:
+        filename = filename.split('site-packages', 1)[1].lstrip('/\\')
+    # ';' и пробел разделяют кадры и число выборок в свернутых стеках
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ':').replace(' ', ' ')
+
+
+class Sampler:
+    """
+    Сэмплирующий профилировщик одного потока: стеки копятся в Counter без остановки потока.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='profiler-sampler', daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def parse_collapsed(text):
+    """
+    Разбирает свернутые стеки в {стек: число выборок}.
+    """
+    stacks = Counter()
+    for line in text.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if stack and count.isdigit():
+            stacks[stack] += int(count)
+    return stacks
+
+
+def _color(name):
+    # Теплые цвета, постоянные для одной и той же функции
+    value = sum(name.encode()) % 100
+    return f'rgb({205 + value % 50}, {80 + value}, {40 + value % 30})'
+
+
+def flamegraph(stacks, width=1200, row_height=17):
+    """
+    Рисует flamegraph (SVG) по свернутым стекам: корень сверху, ширина - доля выборок.
+
+    Returns:
+        Безопасный HTML с элементом svg.
+    """
+    root = {'count': 0, 'children': {}}
+    for stack, count in stacks.items():
+        root['count'] += count
+        node = root
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'count': 0, 'children': {}})
+            node['count'] += count
+    total = root['count'] or 1
+    rects, depth_max = [], 0
+
+    def draw(name, node, x, depth):
+        nonlocal depth_max
+        node_width = node['count'] / total * width
+        if node_width < 1:
+            return
+        depth_max = max(depth_max, depth)
+        label = name if len(name) * 7 < node_width else name[:max(int(node_width / 7) - 2, 0)] + '..'
+        rects.append(format_html(
+            '<g><title>{} ({} выб., {}%)</title>'
+            '<rect x="{}" y="{}" width="{}" height="{}" fill="{}" stroke="white"></rect>'
+            '<text x="{}" y="{}" font-size="12" font-family="monospace">{}</text></g>',
+            name, node['count'], round(node['count'] / total * 100, 1),
+            round(x, 2), depth * row_height, round(node_width, 2), row_height, _color(name),
+            round(x + 3, 2), depth * row_height + 12, label if node_width > 21 else '',
+        ))
+        for child_name, child in sorted(node['children'].items()):
+            draw(child_name, child, x, depth + 1)
+            x += child['count'] / total * width
+
+    draw('all', root, 0, 0)
+    height = (depth_max + 1) * row_height
+    return format_html(
+        '<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="{}" viewBox="0 0 {} {}">{}</svg>',
+        width, height, width, height, mark_safe(''.join(rects)),
+    )
+
+
+def _prune():
+    descriptions = sorted(spool_dir().glob('*.json'))
+    for description in descriptions[:max(len(descriptions) - settings.PROFILE_SPOOL_SIZE, 0)]:
+        for path in spool_dir().glob(f'{description.stem}.*'):
+            path.unlink(missing_ok=True)
+
+
+def save(request, mode, duration, status_code, result):
+    """
+    Сохраняет профиль в каталог PROFILE_SPOOL_DIR и удаляет лишние старые профили.
+
+    Args:
+        result: Свернутые стеки (str) для sample, cProfile.Profile для cprofile
+            или статистика шаблонов (dict) для templates.
+
+    Returns:
+        str: Идентификатор профиля.
+    """
+    now = timezone.now()
+    # Идентификаторы упорядочены по времени, по ним удаляются старые профили
+    profile_id = f'{now:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}'
+    directory = spool_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    data_path = directory / f'{profile_id}{SUFFIXES[mode]}'
+    if mode == 'sample':
+        data_path.write_text(result, encoding='utf-8')
+    elif mode == 'templates':
+        data_path.write_text(json.dumps(result, ensure_ascii=False), encoding='utf-8')
+    else:
+        result.dump_stats(data_path)
+    match = request.resolver_match
+    description = {
+        'id': profile_id,
+        'time': now.isoformat(),
+        'mode': mode,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': match.view_name if match else '',
+        'user': request.user.get_username(),
+        'status': status_code,
+        'duration_ms': round(duration * 1000, 1),
+    }
+    # Описание пишется последним: профиль без описания в списке не показывается
+    (directory / f'{profile_id}.json').write_text(json.dumps(description, ensure_ascii=False), encoding='utf-8')
+    _prune()
+    return profile_id
+
+
+def profiles():
+    """
+    Возвращает описания сохраненных профилей, начиная с самого нового.
+    """
+    result = []
+    for path in sorted(spool_dir().glob('*.json'), reverse=True):
+        try:
+            result.append(json.loads(path.read_text(encoding='utf-8')))
+        except (OSError, ValueError):
+            continue  # Профиль удален параллельно
+    return result
+
+
+def load(profile_id):
+    """
+    Возвращает описание профиля и путь к файлу результата или выбрасывает Http404.
+    """
+    if not PROFILE_ID.match(profile_id):
+        raise Http404
+    try:
+        description = json.loads((spool_dir() / f'{profile_id}.json').read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        raise Http404
+    return description, spool_dir() / f"{profile_id}{SUFFIXES[description['mode']]}"
+
+
+def requested_mode(request):
+    """
+    Возвращает режим профилирования, запрошенный персоналом, или None.
+    """
+    mode = request.GET.get(PARAMETER) or request.headers.get(HEADER)
+    if not mode or not request.user.is_staff:
+        return None
+    return mode if mode in MODES else MODES[0]
+
+
+class ProfilerMiddleware:
+    """
+    Middleware, которое профилирует запросы персонала с ?_profile= или заголовком X-Profile.
+
+    Должно стоять после AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if PARAMETER not in request.GET and HEADER not in request.headers:
+            return self.get_response(request)
+        mode = requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        started = time.perf_counter()
+        if mode == 'sample':
+            with Sampler(settings.PROFILE_SAMPLE_INTERVAL) as sampler:
+                response = self.get_response(request)
+            result = sampler.collapsed()
+        elif mode == 'templates':
+            with template_profiler.recording() as recorder:
+                response = self.get_response(request)
+            result = recorder.report(settings.PROFILE_TEMPLATE_NODES)
+        else:
+            result = cProfile.Profile()
+            result.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                result.disable()
+        duration = time.perf_counter() - started
+        try:
+            response[ID_HEADER] = save(request, mode, duration, response.status_code, result)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить профиль запроса {request.path}: {e}")
+        return response
+
+
+class ProfileListView(TemplateView):
+    """
+    Страница администратора со списком последних профилей.
+    """
+    template_name = 'admin/profiles.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({
+            **admin.site.each_context(self.request),
+            'title': 'Профили запросов',
+            'profiles': profiles(),
+            'spool_size': settings.PROFILE_SPOOL_SIZE,
+        })
+        return context
+
+
+class ProfileDetailView(TemplateView):
+    """
+    Страница администратора с профилем: flamegraph для sample, таблица pstats для cprofile,
+    самые медленные шаблоны и теги для templates.
+    """
+    template_name = 'admin/profile_detail.html'
+    stats_limit = 60  # Сколько функций показывать в таблице pstats
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        profile, data_path = load(self.kwargs['profile_id'])
+        context.update({
+            **admin.site.each_context(self.request),
+            'title': f"Профиль {profile['method']} {profile['path']}",
+            'profile': profile,
+        })
+        if profile['mode'] == 'sample':
+            stacks = parse_collapsed(data_path.read_text(encoding='utf-8'))
+            context['samples'] = sum(stacks.values())
+            context['flamegraph'] = flamegraph(stacks)
+        elif profile['mode'] == 'templates':
+            context['templates'] = json.loads(data_path.read_text(encoding='utf-8'))
+        else:
+            output = io.StringIO()
+            pstats.Stats(str(data_path), stream=output).sort_stats('cumulative').print_stats(self.stats_limit)
+            context['stats'] = output.getvalue()
+        return context
+
+
+class ProfileDownloadView(View):
+    """
+    Отдает файл результата профиля (.collapsed или .prof).
+    """
+
+    def get(self, request, profile_id):
+        _, data_path = load(profile_id)
+        return FileResponse(data_path.open('rb'), as_attachment=True, filename=data_path.name)
@@ -0,0 +1,255 @@
+"""
+Журнал медленных SQL-запросов с планами выполнения.
+
+SlowQueryMiddleware оборачивает запросы к БД (connection.execute_wrapper) и
+сохраняет только те, что выполнялись дольше SLOW_QUERY_MS, и случайную долю
+SLOW_QUERY_SAMPLE_RATE остальных. Запись содержит нормализованный SQL (литералы
+и параметры заменены на ?, списки IN свернуты), представление, функцию проекта,
+из которой выполнен запрос, длительность и план выполнения:
+    - MSSQL: SET SHOWPLAN_XML ON (запрос не выполняется повторно);
+    - SQLite: EXPLAIN QUERY PLAN;
+    - другие СУБД: EXPLAIN.
+План снимается только для SELECT и хранится в кэше по отпечатку нормализованного
+SQL SLOW_QUERY_PLAN_SECONDS, чтобы частый медленный запрос не объяснялся каждый раз.
+
+Записи хранятся в кэше в кольцевом буфере из SLOW_QUERY_LOG_SIZE ячеек, общем
+для всех воркеров: номер записи выдает cache.incr, ячейка - номер по модулю
+размера, поэтому новые записи вытесняют самые старые. Журнал показывает страница
+администратора /admin/slow-queries/ (SlowQueryAdminView).
+"""
+import hashlib
+import logging
+import random
+import re
+import sys
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import cache
+from django.db import connections
+from django.shortcuts import redirect
+from django.utils import timezone
+from django.views.generic import TemplateView
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'slow_queries:'
+COUNTER_KEY = 'slow_queries:next'
+PLAN_PREFIX = 'slow_queries:plan:'
+
+_STRING = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PARAM = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+# Файлы, кадры которых пропускаются при поиске вызывающей функции проекта (обертки запросов)
+_PROJECT_DIR = str(Path(settings.BASE_DIR).resolve())
+_SKIP_FILES = tuple(str(Path(__file__).with_name(name)) for name in ('slow_queries.py', 'metrics.py', 'n_plus_one.py'))
+
+
+def normalize(sql):
+    """
+    Приводит SQL к виду, одинаковому для запросов, отличающихся только значениями.
+
+    Пример:
+        normalize("SELECT * FROM dog WHERE id IN (%s, %s) AND name LIKE '%rex%'")
+        -> "SELECT * FROM dog WHERE id IN (...) AND name LIKE ?"
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _PARAM.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.blake2b(normalized_sql.encode(), digest_size=8).hexdigest()
+
+
+def caller():
+    """
+    Возвращает ближайшую к запросу функцию кода проекта ('dogs/views.py:120 get_queryset').
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(_PROJECT_DIR) and filename not in _SKIP_FILES
+                and 'site-packages' not in filename):
+            path = Path(filename).relative_to(_PROJECT_DIR).as_posix()
+            return f'{path}:{frame.f_lineno} {frame.f_code.co_name}'
+        frame = frame.f_back
+    return ''
+
+
+def _format_sqlite_plan(rows):
+    # Строки EXPLAIN QUERY PLAN: (id, parent, notused, detail) - выводятся деревом
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return '\n'.join(lines)
+
+
+def explain(connection, sql, params):
+    """
+    Возвращает план выполнения запроса sql в текстовом виде.
+
+    Используется курсор драйвера (без оберток Django), поэтому объяснение
+    не попадает ни в журнал, ни в метрики запроса.
+    """
+    with connection.cursor() as wrapper:
+        cursor = wrapper.cursor
+        if connection.vendor == 'microsoft':
+            cursor.execute('SET SHOWPLAN_XML ON')
+            try:
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+            finally:
+                cursor.execute('SET SHOWPLAN_XML OFF')
+            return '\n'.join(row[0] for row in rows)
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return _format_sqlite_plan(cursor.fetchall())
+        cursor.execute(f'EXPLAIN {sql}', params)
+        return '\n'.join(' '.join(str(value) for value in row) for row in cursor.fetchall())
+
+
+def _plan(connection, sql, params, query_fingerprint):
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return ''
+    key = f'{PLAN_PREFIX}{connection.alias}:{query_fingerprint}'
+    plan = cache.get(key)
+    if plan is None:
+        try:
+            plan = explain(connection, sql, params)
+        except Exception as e:
+            plan = f'Не удалось получить план: {e}'
+        cache.set(key, plan, settings.SLOW_QUERY_PLAN_SECONDS)
+    return plan
+
+
+def record(entry):
+    """
+    Добавляет запись в кольцевой буфер и возвращает ее номер.
+    """
+    cache.add(COUNTER_KEY, 0, timeout=None)
+    number = cache.incr(COUNTER_KEY)
+    entry['number'] = number
+    cache.set(f'{KEY_PREFIX}{number % settings.SLOW_QUERY_LOG_SIZE}', entry, timeout=None)
+    return number
+
+
+def entries():
+    """
+    Возвращает записи журнала, начиная с самой новой.
+    """
+    keys = [f'{KEY_PREFIX}{slot}' for slot in range(settings.SLOW_QUERY_LOG_SIZE)]
+    return sorted(cache.get_many(keys).values(), key=lambda entry: entry['number'], reverse=True)
+
+
+def clear():
+    cache.delete_many([f'{KEY_PREFIX}{slot}' for slot in range(settings.SLOW_QUERY_LOG_SIZE)] + [COUNTER_KEY])
+
+
+class QueryObserver:
+    """
+    Обертка connection.execute_wrapper, которая отбирает запросы одного HTTP-запроса в журнал.
+
+    Планы снимаются в flush() при закрытии ответа: во время запроса результат курсора
+    еще не прочитан (на MSSQL без MARS второй запрос в этот момент невозможен),
+    а объяснение не должно удлинять транзакцию и время ответа.
+    """
+
+    def __init__(self, request, connection):
+        self.request = request
+        self.connection = connection
+        self.pending = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - started
+        if duration * 1000 >= settings.SLOW_QUERY_MS:
+            reason = 'slow'
+        elif random.random() < settings.SLOW_QUERY_SAMPLE_RATE:
+            reason = 'sample'
+        else:
+            return result
+        normalized = normalize(sql)
+        entry = {
+            'time': timezone.now(),
+            'reason': reason,
+            'duration_ms': round(duration * 1000, 1),
+            'sql': normalized,
+            'fingerprint': fingerprint(normalized),
+            'database': self.connection.alias,
+            'caller': caller(),
+        }
+        self.pending.append((entry, None if many else (sql, params)))
+        return result
+
+    def flush(self):
+        """
+        Снимает планы отобранных запросов и добавляет их в журнал.
+        """
+        match = self.request.resolver_match
+        view = match.view_name if match else self.request.path
+        for entry, query in self.pending:
+            try:
+                entry['view'] = view
+                entry['plan'] = _plan(self.connection, *query, entry['fingerprint']) if query else ''
+                record(entry)
+            except Exception as e:
+                logger.warning(f"Не удалось записать запрос в журнал медленных запросов: {e}")
+        self.pending = []
+
+
+class SlowQueryMiddleware:
+    """
+    Middleware, которое подключает QueryObserver ко всем базам данных на время запроса.
+
+    Отобранные запросы записываются при закрытии ответа (response.close()), то есть
+    после его отправки клиенту, но до сигнала request_finished, который закрывает
+    соединения с БД.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        observers = [QueryObserver(request, connection) for connection in connections.all()]
+        with ExitStack() as stack:
+            for observer in observers:
+                stack.enter_context(observer.connection.execute_wrapper(observer))
+            response = self.get_response(request)
+        # Обработчики закрытия ответа вызываются раньше request_finished (HttpResponseBase.close)
+        response._resource_closers.extend(observer.flush for observer in observers)
+        return response
+
+
+class SlowQueryAdminView(TemplateView):
+    """
+    Страница администратора с журналом медленных запросов (подключается через admin.site.admin_view).
+    """
+    template_name = 'admin/slow_queries.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({
+            **admin.site.each_context(self.request),
+            'title': 'Медленные SQL-запросы',
+            'entries': entries(),
+            'threshold_ms': settings.SLOW_QUERY_MS,
+            'sample_rate': settings.SLOW_QUERY_SAMPLE_RATE,
+            'log_size': settings.SLOW_QUERY_LOG_SIZE,
+        })
+        return context
+
+    def post(self, request):
+        clear()
+        return redirect('slow_queries')
@@ -0,0 +1,265 @@
+"""
+Статика с хэшами в именах, заранее сжатая, и ее раздача без Django.
+
+CompressedManifestStaticFilesStorage (STORAGES['staticfiles']) при collectstatic:
+    - дает файлам имена с хэшем содержимого (css/album.3f2a9c1b7e4d.css)
+      и записывает соответствие в staticfiles.json - {% static %} выдает
+      имена с хэшем;
+    - рядом с текстовыми файлами кладет сжатые копии .gz и, если установлен
+      пакет brotli, .br (только если копия заметно меньше оригинала).
+Карты исходников и неиспользуемые копии Bootstrap в STATIC_ROOT не попадают
+(my_project/apps.py).
+
+WSGIStaticFiles и ASGIStaticFiles оборачивают приложение (my_project/wsgi.py,
+my_project/asgi.py) и отдают файлы из STATIC_ROOT по STATIC_URL, не доходя
+до Django: выбирают .br или .gz по Accept-Encoding, отвечают 304 на
+If-None-Match и ставят Cache-Control: immutable на год для имен с хэшем
+(их содержимое под этим именем никогда не меняется). Список файлов
+читается один раз при старте воркера; после collectstatic воркеры
+перезапускаются.
+"""
+import gzip
+import json
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.utils.http import http_date, parse_http_date_safe
+
+try:
+    import brotli
+except ImportError:  # brotli не обязателен: без него создаются только .gz
+    brotli = None
+
+# Расширения файлов, которые имеет смысл сжимать (изображения и шрифты woff уже сжаты)
+COMPRESS_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.ico', '.ttf', '.otf', '.eot'}
+# Сжатая копия сохраняется, только если она меньше оригинала хотя бы на 5%
+MIN_RATIO = 0.95
+# Кодировки по убыванию предпочтения: (Content-Encoding, расширение)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+BLOCK_SIZE = 64 * 1024
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage, который после расстановки хэшей создает сжатые копии файлов.
+
+    Пока collectstatic не запускался (манифеста нет: разработка, тесты), ссылки
+    выдаются без хэша, как у обычного хранилища.
+    """
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in COMPRESS_EXTENSIONS and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        """
+        Создает рядом с файлом name копии .gz и .br (или удаляет устаревшие, если сжатие не помогает).
+        """
+        path = self.path(name)
+        with open(path, 'rb') as file:
+            data = file.read()
+        compressors = {'.gz': lambda content: gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressors['.br'] = lambda content: brotli.compress(content, quality=11)
+        for extension, compressor in compressors.items():
+            compressed = compressor(data)
+            target = path + extension
+            if len(compressed) < len(data) * MIN_RATIO:
+                with open(target, 'wb') as file:
+                    file.write(compressed)
+            elif os.path.exists(target):
+                os.remove(target)
+
+
+class StaticFile:
+    """
+    Файл из STATIC_ROOT и его сжатые копии: {кодировка: (путь, заголовки)}.
+    """
+
+    def __init__(self, path, content_type, cache_control):
+        self.variants = {}
+        for encoding, extension in ((None, ''),) + ENCODINGS:
+            variant_path = path + extension
+            if not os.path.isfile(variant_path):
+                continue
+            stat = os.stat(variant_path)
+            headers = [
+                ('Content-Type', content_type),
+                ('Content-Length', str(stat.st_size)),
+                ('Last-Modified', http_date(stat.st_mtime)),
+                ('ETag', f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'),
+                ('Cache-Control', cache_control),
+                ('Vary', 'Accept-Encoding'),
+            ]
+            if encoding:
+                headers.append(('Content-Encoding', encoding))
+            self.variants[encoding] = (variant_path, headers, int(stat.st_mtime))
+
+    def select(self, accept_encoding):
+        """
+        Выбирает вариант по заголовку Accept-Encoding.
+        """
+        accepted = set()
+        for part in accept_encoding.split(','):
+            token, _, params = part.strip().partition(';')
+            if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                continue
+            accepted.add(token.strip().lower())
+        for encoding, _ in ENCODINGS:
+            if encoding in self.variants and (encoding in accepted or '*' in accepted):
+                return self.variants[encoding]
+        return self.variants[None]
+
+
+class StaticFiles:
+    """
+    Список файлов STATIC_ROOT по URL и ответы на запросы к ним.
+    """
+
+    def __init__(self, root=None, url=None):
+        self.root = str(root or settings.STATIC_ROOT)
+        self.prefix = url or settings.STATIC_URL
+        self.files = self.scan()
+
+    def scan(self):
+        """
+        Читает STATIC_ROOT: {URL: StaticFile}. Имена с хэшем берутся из манифеста.
+        """
+        files = {}
+        if not os.path.isdir(self.root):
+            return files
+        hashed = set()
+        manifest_path = os.path.join(self.root, ManifestStaticFilesStorage.manifest_name)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf-8') as file:
+                hashed = set(json.load(file).get('paths', {}).values())
+        immutable = f'public, max-age={settings.STATIC_IMMUTABLE_MAX_AGE}, immutable'
+        mutable = f'public, max-age={settings.STATIC_MAX_AGE}'
+        compressed = tuple(extension for _, extension in ENCODINGS)
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(compressed):
+                    continue
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+                content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+                    content_type += '; charset=utf-8'
+                files[self.prefix + relative] = StaticFile(
+                    path, content_type, immutable if relative in hashed else mutable,
+                )
+        return files
+
+    def respond(self, method, path, headers):
+        """
+        Возвращает ответ на запрос статического файла или None, если файла нет.
+
+        Args:
+            method (str): Метод запроса.
+            path (str): Путь запроса.
+            headers (dict): Заголовки запроса (accept-encoding, if-none-match, if-modified-since).
+
+        Returns:
+            tuple: (статус, заголовки, путь файла или None для ответа без тела).
+        """
+        if method not in ('GET', 'HEAD') or not path.startswith(self.prefix):
+            return None
+        # Ключи - только реальные файлы STATIC_ROOT, поэтому пути с .. сюда не подходят
+        static_file = self.files.get(path)
+        if static_file is None:
+            return None
+        file_path, response_headers, modified = static_file.select(headers.get('accept-encoding', ''))
+        etag = dict(response_headers)['ETag']
+        if_none_match = headers.get('if-none-match')
+        if if_none_match is not None:
+            not_modified = if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+        else:
+            since = parse_http_date_safe(headers.get('if-modified-since', ''))
+            not_modified = since is not None and modified <= since
+        if not_modified:
+            kept = ('ETag', 'Cache-Control', 'Vary', 'Last-Modified')
+            return '304 Not Modified', [header for header in response_headers if header[0] in kept], None
+        return '200 OK', response_headers, None if method == 'HEAD' else file_path
+
+
+class WSGIStaticFiles:
+    """
+    WSGI-обертка, которая отдает статику из STATIC_ROOT, а остальные запросы передает приложению.
+    """
+
+    def __init__(self, application, root=None, url=None):
+        self.application = application
+        self.static_files = StaticFiles(root, url)
+
+    def __call__(self, environ, start_response):
+        headers = {
+            'accept-encoding': environ.get('HTTP_ACCEPT_ENCODING', ''),
+            'if-none-match': environ.get('HTTP_IF_NONE_MATCH'),
+            'if-modified-since': environ.get('HTTP_IF_MODIFIED_SINCE', ''),
+        }
+        response = self.static_files.respond(environ.get('REQUEST_METHOD', ''), environ.get('PATH_INFO', ''), headers)
+        if response is None:
+            return self.application(environ, start_response)
+        status, response_headers, file_path = response
+        start_response(status, response_headers)
+        if file_path is None:
+            return []
+        file = open(file_path, 'rb')
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(file, BLOCK_SIZE)
+        return _read_blocks(file)
+
+
+def _read_blocks(file):
+    with file:
+        for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+            yield block
+
+
+class ASGIStaticFiles:
+    """
+    ASGI-обертка с тем же поведением, что и WSGIStaticFiles.
+    """
+
+    def __init__(self, application, root=None, url=None):
+        self.application = application
+        self.static_files = StaticFiles(root, url)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.application(scope, receive, send)
+        request_headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        response = self.static_files.respond(scope['method'], scope['path'], request_headers)
+        if response is None:
+            return await self.application(scope, receive, send)
+        status, response_headers, file_path = response
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split()[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response_headers],
+        })
+        if file_path is None:
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        # Файлы статики небольшие, поэтому читаются без отдельного потока
+        with open(file_path, 'rb') as file:
+            block = file.read(BLOCK_SIZE)
+            while True:
+                following = file.read(BLOCK_SIZE)
+                await send({'type': 'http.response.body', 'body': block, 'more_body': bool(following)})
+                if not following:
+                    break
+                block = following
@@ -0,0 +1,184 @@
+"""
+Замер рендеринга шаблонов Django по шаблонам и тегам (режим ?_profile=templates, см. my_project/profiler.py).
+
+На время профилированного запроса recording() подменяет три метода движка
+шаблонов Django:
+    - Template._render - время каждого шаблона, включая {% extends %} и {% include %};
+    - Node.render_annotated - время каждого тега и переменной ({{ ... }}) с
+      шаблоном и строкой, а для {% for %} - число итераций;
+    - Variable._resolve_lookup - количество обращений к переменным контекста.
+Время считается полным (вместе с вложенными) и собственным (без вложенных
+шаблонов для шаблонов и без вложенных тегов для тегов). Родительский шаблон
+({% extends %}) рендерится внутри дочернего, поэтому полное время дочернего
+включает base.html, а собственное время base.html - только его разметку вне блоков.
+
+Подмена устанавливается, пока идет хотя бы один такой запрос, и снимается после
+последнего; в это время остальные запросы платят только проверку ContextVar.
+"""
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.template.base import Node, Template, TextNode, Variable
+from django.template.defaulttags import ForNode
+
+_recorder = ContextVar('template_recorder', default=None)
+_lock = threading.Lock()
+_active = 0
+_originals = {}
+
+
+class TemplateRecorder:
+    """
+    Статистика рендеринга шаблонов одного запроса.
+    """
+
+    def __init__(self):
+        self.templates = {}
+        self.nodes = {}
+        self.lookups = Counter()
+        # Стеки открытых шаблонов и тегов: [начало, время вложенных, запись]
+        self.template_stack = []
+        self.node_stack = []
+
+    @staticmethod
+    def _enter(stack, entry):
+        frame = [time.perf_counter(), 0.0, entry]
+        stack.append(frame)
+        return frame
+
+    @staticmethod
+    def _exit(stack, frame):
+        elapsed = time.perf_counter() - frame[0]
+        stack.pop()
+        if stack:
+            stack[-1][1] += elapsed
+        entry = frame[2]
+        entry['renders'] += 1
+        entry['total'] += elapsed
+        entry['self'] += elapsed - frame[1]
+
+    def render_template(self, template, render, context):
+        name = template.origin.template_name or template.name or '<строка>'
+        entry = self.templates.setdefault(name, {'template': name, 'renders': 0, 'total': 0.0, 'self': 0.0})
+        frame = self._enter(self.template_stack, entry)
+        try:
+            return render(template, context)
+        finally:
+            self._exit(self.template_stack, frame)
+
+    def _node_entry(self, node):
+        key = id(node)
+        entry = self.nodes.get(key)
+        if entry is None:
+            origin, token = getattr(node, 'origin', None), getattr(node, 'token', None)
+            entry = self.nodes[key] = {
+                'template': origin.template_name if origin is not None else '',
+                'line': token.lineno if token is not None else 0,
+                'node': type(node).__name__,
+                'contents': token.contents[:80] if token is not None else '',
+                'renders': 0, 'total': 0.0, 'self': 0.0, 'iterations': 0,
+            }
+        return entry
+
+    def render_node(self, node, render, context):
+        if self.node_stack:
+            parent = self.node_stack[-1][2]
+            # Первый тег тела цикла рендерится один раз за итерацию (текст в подсчете не участвует)
+            if parent.get('loop_first') is node:
+                parent['iterations'] += 1
+        entry = self._node_entry(node)
+        if isinstance(node, ForNode) and 'loop_first' not in entry:
+            entry['loop_first'] = next((child for child in node.nodelist_loop if not isinstance(child, TextNode)), None)
+        frame = self._enter(self.node_stack, entry)
+        try:
+            return render(node, context)
+        finally:
+            self._exit(self.node_stack, frame)
+
+    def report(self, limit=50):
+        """
+        Возвращает статистику для сохранения (время - в миллисекундах).
+
+        Returns:
+            dict: templates (все шаблоны по полному времени), nodes (limit самых
+            медленных тегов по собственному времени), lookups (limit самых частых
+            переменных), lookup_count и iterations (всего итераций циклов).
+        """
+        def rounded(entry):
+            return {
+                **{key: value for key, value in entry.items() if key != 'loop_first'},
+                'total': round(entry['total'] * 1000, 3),
+                'self': round(entry['self'] * 1000, 3),
+            }
+
+        nodes = sorted(self.nodes.values(), key=lambda entry: entry['self'], reverse=True)
+        return {
+            'templates': [rounded(entry) for entry in sorted(self.templates.values(), key=lambda entry: entry['total'], reverse=True)],
+            'nodes': [rounded(entry) for entry in nodes[:limit]],
+            'lookups': self.lookups.most_common(limit),
+            'lookup_count': sum(self.lookups.values()),
+            'iterations': sum(entry['iterations'] for entry in self.nodes.values()),
+        }
+
+
+def _install():
+    template_render, node_render, resolve_lookup = Template._render, Node.render_annotated, Variable._resolve_lookup
+    _originals.update({'_render': template_render, 'render_annotated': node_render, '_resolve_lookup': resolve_lookup})
+
+    def _render(self, context):
+        recorder = _recorder.get()
+        if recorder is None:
+            return template_render(self, context)
+        return recorder.render_template(self, template_render, context)
+
+    def render_annotated(self, context):
+        recorder = _recorder.get()
+        if recorder is None:
+            return node_render(self, context)
+        return recorder.render_node(self, node_render, context)
+
+    def _resolve_lookup(self, context):
+        recorder = _recorder.get()
+        if recorder is not None:
+            recorder.lookups[self.var] += 1
+        return resolve_lookup(self, context)
+
+    Template._render = _render
+    Node.render_annotated = render_annotated
+    Variable._resolve_lookup = _resolve_lookup
+
+
+def _uninstall():
+    Template._render = _originals.pop('_render')
+    Node.render_annotated = _originals.pop('render_annotated')
+    Variable._resolve_lookup = _originals.pop('_resolve_lookup')
+
+
+@contextmanager
+def recording():
+    """
+    Записывает рендеринг шаблонов в текущем контексте выполнения.
+
+    Пример:
+        with recording() as recorder:
+            response = get_response(request)
+        stats = recorder.report()
+    """
+    global _active
+    with _lock:
+        if not _active:
+            _install()
+        _active += 1
+    recorder = TemplateRecorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+        with _lock:
+            _active -= 1
+            if not _active:
+                _uninstall()
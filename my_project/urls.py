@@ -4,9 +4,23 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from dogs.views import ResizedImageView
+from my_project.metrics import MetricsView
+from my_project.profiler import ProfileDetailView, ProfileDownloadView, ProfileListView
+from my_project.slow_queries import SlowQueryAdminView
+
 urlpatterns = [
+    # Журнал медленных SQL-запросов (my_project/slow_queries.py), только для персонала
+    path('admin/slow-queries/', admin.site.admin_view(SlowQueryAdminView.as_view()), name='slow_queries'),
+    # Профили запросов (my_project/profiler.py), только для персонала
+    path('admin/profiles/', admin.site.admin_view(ProfileListView.as_view()), name='profiles'),
+    path('admin/profiles/<str:profile_id>/', admin.site.admin_view(ProfileDetailView.as_view()), name='profile_detail'),
+    path('admin/profiles/<str:profile_id>/download/', admin.site.admin_view(ProfileDownloadView.as_view()), name='profile_download'),
     path('admin/', admin.site.urls),
 
+    # Метрики запросов в формате Prometheus (my_project/metrics.py)
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+
     # URL-адреса для приложения 'users'
     path('users/', include('users.urls', namespace='users')),
 
@@ -18,6 +32,11 @@ urlpatterns = [
     
 ]
 
+# Уменьшенные копии медиафайлов (/media/r/<ширина>x<высота>/<путь>, см. dogs/images.py)
+urlpatterns += [
+    path(f'{settings.MEDIA_URL.strip("/")}/r/<int:width>x<int:height>/<path:path>', ResizedImageView.as_view(), name='resized_image'),
+]
+
 # Обслуживание медиафайлов в режиме отладки
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -14,3 +14,15 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_project.settings')
 
 application = get_wsgi_application()
+
+# Статика из STATIC_ROOT (с хэшами в именах и сжатыми копиями) отдается без Django
+from my_project.staticfiles import WSGIStaticFiles  # noqa: E402
+
+application = WSGIStaticFiles(application)
+
+# Индексы автодополнения, фасетов и хэшей фотографий загружаются при старте воркера, а не на первом запросе
+from dogs import autocomplete, duplicates, facets  # noqa: E402
+
+autocomplete.warm()
+facets.shared_index.warm()
+duplicates.shared_index.warm()
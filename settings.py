@@ -43,18 +43,22 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
-    'django.contrib.staticfiles',
+    'my_project.apps.StaticFilesConfig',  # django.contrib.staticfiles без карт исходников и копий Bootstrap
     'dogs',
     'users',
     'widget_tweaks',
 ]
 
 MIDDLEWARE = [
+    'my_project.metrics.PerformanceMiddleware',  # Server-Timing и метрики запросов (первым, чтобы учитывать остальные)
+    'my_project.slow_queries.SlowQueryMiddleware',  # Журнал медленных SQL-запросов с планами
+    'my_project.n_plus_one.NPlusOneMiddleware',  # Предупреждения о повторяющихся запросах (N+1)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'my_project.profiler.ProfilerMiddleware',  # Профилирование запросов персонала по ?_profile= (после аутентификации)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -63,7 +67,7 @@ ROOT_URLCONF = 'my_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'my_project.metrics.DjangoTemplates',  # DjangoTemplates с замером времени рендеринга
         'DIRS': [
             BASE_DIR / 'templates',  # Если есть общие шаблоны
             BASE_DIR / 'dogs' / 'templates' # Добавь этот путь!
@@ -133,6 +137,13 @@ STATICFILES_DIRS = [
 STATIC_ROOT = BASE_DIR / 'staticfiles'  # Папка для сбора статики для продакшена
 
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+# collectstatic добавляет к именам файлов хэш содержимого и создает сжатые копии .gz/.br (my_project/staticfiles.py)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'my_project.staticfiles.CompressedManifestStaticFilesStorage'},
+}
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60  # Cache-Control файлов с хэшем в имени, секунды
+STATIC_MAX_AGE = 60 * 60  # Cache-Control остальных файлов статики, секунды
 
 MEDIA_URL = '/media/'  # URL для доступа к медиафайлам
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Путь к папке для сохранения медиафайлов
@@ -146,7 +157,8 @@ AUTH_USER_MODEL = 'users.User'
 
 # settings.py
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Для разработки и тестов можно указать console или locmem бэкенд через .env
+EMAIL_BACKEND = os.getenv('DJANGO_EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = 'smtp.yandex.ru'  # Хост Yandex.Mail
 EMAIL_PORT = 465  # Порт для SSL (465) или 587 для TLS
 EMAIL_USE_TLS = False #  Используйте False для SSL, True для TLS
@@ -155,11 +167,18 @@ EMAIL_HOST_USER = 'niaz123rezeda123@ya.ru'  # Ваш адрес электрон
 EMAIL_HOST_PASSWORD = 'qmcexvaqscmgaiey'  # Пароль от вашей почты Yandex
 DEFAULT_FROM_EMAIL = 'niaz123rezeda123@ya.ru'  # От кого будут отправляться письма (ваш адрес)
 DEFAULT_CHARSET = 'utf-8'  # или 'utf-8'
+
+# Очередь исходящей почты (users/outbox.py, команда send_queued_mail)
+OUTBOX_EMAIL_BACKEND = None  # None - используется EMAIL_BACKEND
+OUTBOX_MAX_ATTEMPTS = 5  # После стольких неудачных попыток письмо помечается как неотправленное
+OUTBOX_RETRY_BASE_SECONDS = 60  # Задержка перед повтором, удваивается с каждой попыткой
+OUTBOX_LEASE_SECONDS = 300  # Время, на которое обработчик забирает пачку писем
 import logging
 logger = logging.getLogger(__name__)
 CACHES = {
     "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
+        "BACKEND": "my_project.metrics.InstrumentedCache",  # Считает попадания и промахи для метрик запросов
+        "WRAPPED_BACKEND": "django_redis.cache.RedisCache",
         "LOCATION": os.getenv("CACHE_LOCATION", "redis://127.0.0.1:6379/0"),  #  Используйте переменную окружения для LOCATION
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
@@ -187,12 +206,15 @@ LOGGING = {
         },
     },
     'loggers': {
+        # Все SQL-запросы пишутся в лог только при DB_LOG_LEVEL=DEBUG: под нагрузкой это заметно
+        # замедляет ответы. Время и количество запросов показывают метрики (my_project/metrics.py).
         'django.db.backends': {
-            'level': 'DEBUG',
+            'level': os.getenv('DB_LOG_LEVEL', 'INFO'),
             'handlers': ['console', 'file'],
+            'propagate': False,
         },
          '': {  # Root logger
-            'level': 'DEBUG',
+            'level': os.getenv('LOG_LEVEL', 'INFO'),
             'handlers': ['console', 'file'],
         },
     },
@@ -201,4 +223,85 @@ LOGGING = {
 CACHE_ENABLED = os.getenv("CACHE_ENABLED", "True").lower() == "true"  # Читаем из .env
 CACHE_MIDDLEWARE_ALIAS = "default"  # Используем кэш по умолчанию
 CACHE_MIDDLEWARE_SECONDS = 600  # 10 минут (время жизни кэша)
-CACHE_MIDDLEWARE_KEY_PREFIX = ""  # Префикс для ключей кэша
\ No newline at end of file
+CACHE_MIDDLEWARE_KEY_PREFIX = ""  # Префикс для ключей кэша
+# Буферизованный счетчик просмотров (dogs/view_counter.py)
+VIEW_COUNTER_FLUSH_INTERVAL = int(os.getenv("VIEW_COUNTER_FLUSH_INTERVAL", 60))  # Секунды между сбросами просмотров в БД (flush_view_counts --loop)
+VIEW_COUNTER_KEY_TTL = 24 * 60 * 60  # Срок жизни счетчиков в кэше: просмотры, не сброшенные за это время, теряются
+
+# Условные запросы к страницам собак и пород (dogs/conditional.py) и версия закэшированных страниц
+PAGE_VERSION = os.getenv("PAGE_VERSION", "")  # Меняется при выкладке новых шаблонов, чтобы сбросить копии страниц в браузерах
+# Кэш страниц каталога (dogs/page_cache.py): сбрасывается сигналами моделей по меткам,
+# время жизни нужно только для вытеснения неиспользуемых страниц
+PAGE_CACHE_SECONDS = int(os.getenv("PAGE_CACHE_SECONDS", 60 * 60))
+
+# Метрики запросов (my_project/metrics.py)
+METRICS_FLUSH_INTERVAL = 15  # Как часто воркер добавляет свои метрики к общим счетчикам в кэше
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # Токен для /metrics/ (Authorization: Bearer <токен>); без него - только персонал
+
+# Журнал медленных SQL-запросов (my_project/slow_queries.py, страница /admin/slow-queries/)
+SLOW_QUERY_MS = int(os.getenv("SLOW_QUERY_MS", 200))  # Запросы не быстрее этого порога попадают в журнал
+SLOW_QUERY_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_SAMPLE_RATE", 0))  # Доля остальных запросов для журнала (например, 0.001)
+SLOW_QUERY_LOG_SIZE = 200  # Размер кольцевого буфера: новые записи вытесняют самые старые
+SLOW_QUERY_PLAN_SECONDS = 60 * 60  # Сколько хранится план запроса, чтобы не объяснять его заново
+
+# Обнаружение N+1 (my_project/n_plus_one.py): '' - выключено, 'warn' - лог и заголовок X-N-Plus-One, 'raise' - ошибка
+N_PLUS_ONE_DETECTION = os.getenv("N_PLUS_ONE_DETECTION", "")
+N_PLUS_ONE_THRESHOLD = 5  # Сколько одинаковых запросов за HTTP-запрос допустимо
+
+# Профилирование запросов персонала (my_project/profiler.py, страница /admin/profiles/)
+PROFILE_SPOOL_DIR = os.getenv("PROFILE_SPOOL_DIR", BASE_DIR / 'profiles')  # Каталог для сохраненных профилей
+PROFILE_SPOOL_SIZE = 50  # Сколько последних профилей хранить
+PROFILE_SAMPLE_INTERVAL = 0.002  # Интервал выборок сэмплирующего профилировщика, секунды
+PROFILE_TEMPLATE_NODES = 50  # Сколько самых медленных тегов и частых переменных сохранять в режиме templates
+
+# Кэш карточек собак в списке (dogs/cards.py)
+DOG_CARD_CACHE_SECONDS = 24 * 60 * 60  # Время жизни карточки (устаревшие версии просто перестают читаться)
+DOG_CARD_STATS_INTERVAL = 60  # Как часто воркер добавляет свои попадания и промахи к общим счетчикам
+
+# Резервуары случайных собак для карточек пород (dogs/featured.py)
+FEATURED_DOGS_RESERVOIR_SIZE = 12  # Сколько идентификаторов собак хранится для каждой породы
+FEATURED_DOGS_ROTATE_SECONDS = 60 * 60  # Резервуар перестраивается не реже чем раз в час
+FEATURED_DOGS_ROTATE_READS = 200  # ...и в среднем раз в 200 чтений
+
+# Пагинация списков (dogs/pagination.py)
+LIST_PAGINATION = os.getenv("LIST_PAGINATION", "offset")  # 'cursor' - курсорная пагинация по умолчанию
+ESTIMATED_COUNT_LIMIT = 1000  # До скольких строк отфильтрованный список подсчитывается точно
+
+# Поиск (dogs/search.py, команды rebuild_search_index и search_benchmark)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "dogs.search.TrigramBackend")  # или dogs.search.SQLServerFullTextBackend
+SEARCH_TRIGRAM_THRESHOLD = 0.6  # Доля триграмм запроса, которая должна совпасть
+SEARCH_DESCRIPTION_LENGTH = 500  # Сколько символов описания индексируется
+SEARCH_FULLTEXT_LANGUAGE = 1049  # Язык полнотекстового индекса SQL Server (1049 - русский)
+SEARCH_MAX_RESULTS = 1000  # Сколько найденных объектов ранжируется и показывается в результатах
+
+# Автодополнение (dogs/autocomplete.py)
+AUTOCOMPLETE_SYNC_SECONDS = 1  # Как часто процесс проверяет журнал изменений в кэше
+AUTOCOMPLETE_SCAN_LIMIT = 200  # Сколько ключей просматривается на один запрос
+AUTOCOMPLETE_SNAPSHOT_EVERY = 200  # Через сколько изменений снимок индекса в кэше обновляется
+
+# Фасеты каталога собак (dogs/facets.py)
+FACETS_SYNC_SECONDS = 1  # Как часто процесс проверяет журнал изменений в кэше
+FACETS_SNAPSHOT_EVERY = 500  # Через сколько изменений снимок индекса в кэше обновляется
+
+# Уменьшенные копии изображений (dogs/images.py)
+IMAGE_JPEG_QUALITY = 80
+IMAGE_WEBP_QUALITY = 75
+IMAGE_RESIZE_SIZES = ['160x120', '320x240', '480x360', '960x720', '1200x1200']  # Разрешенные размеры /media/r/<ширина>x<высота>/
+IMAGE_RESIZE_MAX_AGE = 24 * 60 * 60  # Cache-Control: max-age уменьшенных копий, секунды
+IMAGE_RESIZE_LOCK_SECONDS = 30  # Через сколько секунд блокировка построения копии считается брошенной
+
+# Загрузка фотографий собак и пород (dogs/uploads.py)
+FILE_UPLOAD_HANDLERS = [
+    'dogs.uploads.ImageUploadHandler',  # Поля image: потоково на диск, проверка заголовка, без EXIF
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+IMAGE_UPLOAD_MAX_BYTES = 20 * 1024 * 1024  # Максимальный размер файла
+IMAGE_UPLOAD_MAX_SIDE = 10000  # Максимальная ширина или высота, точек
+IMAGE_UPLOAD_MAX_PIXELS = 40_000_000  # Максимальное количество точек (40 Мп)
+
+# Поиск одинаковых фотографий собак (dogs/duplicates.py)
+DUPLICATES_MAX_DISTANCE = 6  # Сколько бит pHash из 64 может различаться у похожих фотографий
+DUPLICATES_DHASH_DISTANCE = 10  # ...и сколько бит dHash
+DUPLICATES_SYNC_SECONDS = 1  # Как часто процесс проверяет журнал изменений в кэше
+DUPLICATES_SNAPSHOT_EVERY = 500  # Через сколько изменений снимок индекса в кэше обновляется
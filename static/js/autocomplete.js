@@ -0,0 +1,38 @@
+// Автодополнение в полях поиска (dogs/autocomplete.py).
+// Поле: <input data-autocomplete-url="..." data-autocomplete-kind="breed|dog" list="id-datalist">
+document.addEventListener('DOMContentLoaded', function() {
+  document.querySelectorAll('input[data-autocomplete-url]').forEach(function(input) {
+    const datalist = document.getElementById(input.getAttribute('list'));
+    const kind = input.dataset.autocompleteKind || '';
+    let timer = null;
+    let controller = null;
+
+    input.addEventListener('input', function() {
+      clearTimeout(timer);
+      const query = input.value.trim();
+      if (!query) {
+        datalist.innerHTML = '';
+        return;
+      }
+      // Небольшая задержка, чтобы не отправлять запрос на каждое нажатие при быстром вводе
+      timer = setTimeout(function() {
+        if (controller) {
+          controller.abort();
+        }
+        controller = new AbortController();
+        const params = new URLSearchParams({q: query, kind: kind});
+        fetch(input.dataset.autocompleteUrl + '?' + params, {signal: controller.signal})
+          .then(response => response.json())
+          .then(data => {
+            datalist.innerHTML = '';
+            data.results.forEach(result => {
+              const option = document.createElement('option');
+              option.value = result.label;
+              datalist.appendChild(option);
+            });
+          })
+          .catch(() => {});
+      }, 80);
+    });
+  });
+});
@@ -1,8 +1,23 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
-from .models import Product  #  Импортируем Product
+from .models import Product, OutgoingEmail  #  Импортируем Product
 
 User = get_user_model()
 
-admin.site.register(Product)  # Регистрируем Product в админке
\ No newline at end of file
+admin.site.register(Product)  # Регистрируем Product в админке
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    """
+    Класс администратора для очереди исходящих писем.
+
+    Позволяет увидеть письма, ожидающие отправки, и письма, которые не удалось отправить.
+    Текст писем не показывается: в нем могут быть личные данные получателей.
+    """
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'to')
+    readonly_fields = ('attempts', 'last_error', 'created_at', 'builder', 'builder_arg')
+    exclude = ('body', 'html_body')
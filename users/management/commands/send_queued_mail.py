@@ -0,0 +1,32 @@
+# users/management/commands/send_queued_mail.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.outbox import deliver_pending
+
+
+class Command(BaseCommand):
+    """
+    Команда для отправки писем из очереди OutgoingEmail.
+
+    Пример:
+        python manage.py send_queued_mail
+        python manage.py send_queued_mail --loop --batch-size 100 --interval 5
+    """
+    help = 'Отправляет письма из очереди исходящей почты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Количество писем в одной пачке')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно, проверяя очередь')
+        parser.add_argument('--interval', type=int, default=5, help='Пауза между проверками пустой очереди в секундах')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = deliver_pending(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(self.style.SUCCESS(f'Отправлено: {sent}, ошибок: {failed}'))
+            if not options['loop']:
+                break
+            if not sent and not failed:
+                time.sleep(options['interval'])
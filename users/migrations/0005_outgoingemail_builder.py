@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outgoingemail',
+            name='builder',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Функция сборки письма'),
+        ),
+        migrations.AddField(
+            model_name='outgoingemail',
+            name='builder_arg',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Аргумент функции сборки'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 # users/models.py
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 
 class User(AbstractUser):
@@ -55,4 +56,55 @@ class Product(models.Model):
         """
         Возвращает строковое представление объекта Product (name).
         """
-        return self.name
\ No newline at end of file
+        return self.name
+
+class OutgoingEmail(models.Model):
+    """
+    Модель для хранения исходящих писем (очередь отправки).
+
+    Письма не отправляются внутри запроса: представления кладут их в очередь,
+    а команда send_queued_mail отправляет их пачками через одно SMTP-соединение.
+    Успешно отправленные письма удаляются из очереди.
+
+    Письма с секретами (новый пароль) не хранят текст: в builder записан путь
+    к функции, которая строит текст при отправке по builder_arg (см. users.outbox).
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает отправки'),
+        (STATUS_FAILED, 'Не отправлено'),
+    ]
+
+    subject = models.CharField(max_length=255, verbose_name='Тема')
+    body = models.TextField(blank=True, verbose_name='Текст письма')
+    html_body = models.TextField(blank=True, null=True, verbose_name='HTML-версия письма')
+    from_email = models.CharField(max_length=254, verbose_name='Отправитель')
+    to = models.TextField(verbose_name='Получатели')  # Адреса через перевод строки
+    builder = models.CharField(max_length=255, blank=True, verbose_name='Функция сборки письма')
+    builder_arg = models.CharField(max_length=255, blank=True, verbose_name='Аргумент функции сборки')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='Статус')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Количество попыток')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+
+    class Meta:
+        verbose_name = 'Исходящее письмо'
+        verbose_name_plural = 'Исходящие письма'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outgoing_email_queue_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Возвращает строковое представление письма (тема и получатели).
+        """
+        return f'{self.subject} -> {", ".join(self.recipients)}'
+
+    @property
+    def recipients(self):
+        """
+        Возвращает список адресов получателей.
+        """
+        return [address for address in self.to.splitlines() if address]
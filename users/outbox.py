@@ -0,0 +1,175 @@
+# users/outbox.py
+"""
+Очередь исходящих писем.
+
+Представления вызывают enqueue_mail() вместо send_mail(): письмо сохраняется
+в таблицу OutgoingEmail и не задерживает ответ на медленном SMTP-сервере.
+Команда send_queued_mail вызывает deliver_pending(), которая отправляет
+письма пачками через одно переиспользуемое соединение и повторяет неудачные
+попытки с экспоненциальной задержкой.
+
+Письма с секретами ставятся в очередь через enqueue_built_mail(): в базе
+хранится только ссылка на функцию сборки и ее аргумент, а текст (например,
+новый пароль) создается непосредственно перед отправкой и в базу не попадает.
+"""
+import logging
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue_mail(subject, message, recipient_list, from_email=None, html_message=None):
+    """
+    Ставит письмо в очередь на отправку.
+
+    Аналог django.core.mail.send_mail, но без обращения к почтовому серверу.
+
+    Args:
+        subject (str): Тема письма.
+        message (str): Текст письма.
+        recipient_list (list): Список адресов получателей.
+        from_email (str): Адрес отправителя. По умолчанию DEFAULT_FROM_EMAIL.
+        html_message (str): HTML-версия письма.
+
+    Returns:
+        OutgoingEmail: Созданная запись очереди.
+    """
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        body=message,
+        html_body=html_message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to='\n'.join(recipient_list),
+    )
+
+
+def enqueue_built_mail(subject, builder, builder_arg, recipient_list, from_email=None):
+    """
+    Ставит в очередь письмо, текст которого строится при отправке.
+
+    Args:
+        subject (str): Тема письма (хранится в очереди, поэтому без секретов).
+        builder (str): Путь к функции builder(builder_arg), которая возвращает
+            (текст, HTML-версия или None), например 'users.views.build_password_reset_email'.
+        builder_arg (str): Аргумент функции (например, идентификатор пользователя).
+        recipient_list (list): Список адресов получателей.
+        from_email (str): Адрес отправителя. По умолчанию DEFAULT_FROM_EMAIL.
+
+    Returns:
+        OutgoingEmail: Созданная запись очереди.
+    """
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        builder=builder,
+        builder_arg=str(builder_arg),
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to='\n'.join(recipient_list),
+    )
+
+
+def _claim_batch(batch_size):
+    """
+    Забирает пачку писем, готовых к отправке.
+
+    Выбранным письмам сдвигается next_attempt_at на время аренды, поэтому
+    параллельно запущенные обработчики не отправят их повторно, а письма
+    упавшего обработчика будут отправлены после истечения аренды.
+    """
+    now = timezone.now()
+    lease = timedelta(seconds=_setting('OUTBOX_LEASE_SECONDS', 300))
+    with transaction.atomic():
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutgoingEmail.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        if emails:
+            OutgoingEmail.objects.filter(pk__in=[email.pk for email in emails]).update(next_attempt_at=now + lease)
+    return emails
+
+
+def _build_message(email, connection):
+    body, html_body = email.body, email.html_body
+    if email.builder:
+        body, html_body = import_string(email.builder)(email.builder_arg)
+    message = EmailMultiAlternatives(
+        email.subject, body, email.from_email, email.recipients, connection=connection
+    )
+    if html_body:
+        message.attach_alternative(html_body, 'text/html')
+    return message
+
+
+def _mark_failed(email, error):
+    """
+    Записывает ошибку и назначает следующую попытку с экспоненциальной задержкой.
+
+    После OUTBOX_MAX_ATTEMPTS попыток письмо помечается как неотправленное.
+    """
+    email.attempts += 1
+    email.last_error = f'{type(error).__name__}: {error}'
+    if email.attempts >= _setting('OUTBOX_MAX_ATTEMPTS', 5):
+        email.status = OutgoingEmail.STATUS_FAILED
+    else:
+        delay = _setting('OUTBOX_RETRY_BASE_SECONDS', 60) * 2 ** (email.attempts - 1)
+        email.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def deliver_pending(batch_size=50):
+    """
+    Отправляет одну пачку писем из очереди через одно соединение.
+
+    Args:
+        batch_size (int): Максимальное количество писем в пачке.
+
+    Returns:
+        tuple: (отправлено, не удалось отправить).
+    """
+    emails = _claim_batch(batch_size)
+    if not emails:
+        return 0, 0
+
+    sent, failed = 0, 0
+    connection = get_connection(backend=_setting('OUTBOX_EMAIL_BACKEND', None), fail_silently=False)
+    try:
+        connection.open()
+        for email in emails:
+            try:
+                try:
+                    _build_message(email, connection).send()
+                except smtplib.SMTPServerDisconnected:
+                    # Сервер закрыл соединение посреди пачки: переподключаемся один раз
+                    connection.close()
+                    connection.open()
+                    _build_message(email, connection).send()
+            except Exception as e:
+                logger.warning(f"Не удалось отправить письмо {email.pk}: {e}")
+                _mark_failed(email, e)
+                failed += 1
+            else:
+                email.delete()
+                sent += 1
+    except Exception as e:
+        # Не удалось установить соединение: вся оставшаяся пачка уходит на повтор
+        logger.error(f"Ошибка подключения к почтовому серверу: {e}")
+        for email in emails[sent + failed:]:
+            _mark_failed(email, e)
+            failed += 1
+    finally:
+        connection.close()
+
+    return sent, failed
@@ -1,3 +1,162 @@
-from django.test import TestCase
+import html
+import io
+import smtplib
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .admin import OutgoingEmailAdmin
+from .models import OutgoingEmail, User
+from .outbox import _claim_batch, deliver_pending, enqueue_mail
+
+
+class FlakyEmailBackend(BaseEmailBackend):
+    """
+    Почтовый бэкенд для тестов очереди: считает открытые соединения
+    и выбрасывает заданные ошибки вместо отправки.
+    """
+    opened = 0
+    open_error = None  # Ошибка при открытии соединения
+    errors = []  # Ошибки следующих отправок по порядку (None - письмо отправлено)
+    sent = []
+
+    @classmethod
+    def reset(cls):
+        cls.opened, cls.open_error, cls.errors, cls.sent = 0, None, [], []
+
+    def open(self):
+        if self.open_error is not None:
+            raise self.open_error
+        FlakyEmailBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            error = self.errors.pop(0) if self.errors else None
+            if error is not None:
+                raise error
+            self.sent.append(message)
+        return len(messages)
+
+
+@override_settings(
+    OUTBOX_EMAIL_BACKEND='users.tests.FlakyEmailBackend',
+    OUTBOX_MAX_ATTEMPTS=3, OUTBOX_RETRY_BASE_SECONDS=60, OUTBOX_LEASE_SECONDS=300,
+)
+class OutboxDeliveryTests(TestCase):
+    """
+    Проверяет отправку очереди писем: пачки через одно соединение, повторы и аренду.
+    """
+
+    def setUp(self):
+        FlakyEmailBackend.reset()
+        self.now = timezone.now()
+        patcher = mock.patch('users.outbox.timezone.now', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def enqueue(self, count):
+        for i in range(count):
+            enqueue_mail(f'Письмо {i}', 'Текст', [f'user{i}@example.com'])
+        self.retry_now()  # Время создания задано настоящими часами, а не подмененными
+
+    def retry_now(self):
+        OutgoingEmail.objects.update(next_attempt_at=self.now)
+
+    def test_batch_is_sent_over_one_connection(self):
+        self.enqueue(3)
+        self.assertEqual(deliver_pending(batch_size=2), (2, 0))
+        self.assertEqual((FlakyEmailBackend.opened, len(FlakyEmailBackend.sent)), (1, 2))
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+
+        self.assertEqual(deliver_pending(batch_size=2), (1, 0))
+        self.assertEqual(deliver_pending(batch_size=2), (0, 0))
+        self.assertEqual(FlakyEmailBackend.opened, 2)
+        self.assertFalse(OutgoingEmail.objects.exists())
+
+    def test_reconnects_once_when_server_disconnects(self):
+        self.enqueue(2)
+        FlakyEmailBackend.errors = [smtplib.SMTPServerDisconnected('closed')]
+        self.assertEqual(deliver_pending(), (2, 0))
+        self.assertEqual((FlakyEmailBackend.opened, len(FlakyEmailBackend.sent)), (2, 2))
+
+    def test_retries_back_off_exponentially_until_failed(self):
+        self.enqueue(1)
+        for attempt, delay in ((1, 60), (2, 120)):
+            FlakyEmailBackend.errors = [smtplib.SMTPDataError(451, 'try later')]
+            self.assertEqual(deliver_pending(), (0, 1))
+            email = OutgoingEmail.objects.get()
+            self.assertEqual((email.status, email.attempts), (OutgoingEmail.STATUS_PENDING, attempt))
+            self.assertEqual(email.next_attempt_at, self.now + timedelta(seconds=delay))
+            self.assertIn('SMTPDataError', email.last_error)
+            # До назначенного времени письмо не отправляется
+            self.assertEqual(deliver_pending(), (0, 0))
+            self.retry_now()
+
+        FlakyEmailBackend.open_error = ConnectionRefusedError('refused')
+        self.assertEqual(deliver_pending(), (0, 1))
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutgoingEmail.STATUS_FAILED, 3))
+        self.assertIn('ConnectionRefusedError', email.last_error)
+
+        self.retry_now()
+        FlakyEmailBackend.open_error = None
+        self.assertEqual(deliver_pending(), (0, 0))
+        self.assertEqual(FlakyEmailBackend.sent, [])
+
+    def test_lease_prevents_second_worker_from_sending(self):
+        self.enqueue(2)
+        claimed = _claim_batch(10)
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(_claim_batch(10), [])
+        self.assertEqual(deliver_pending(), (0, 0))
+        self.assertEqual(
+            set(OutgoingEmail.objects.values_list('next_attempt_at', flat=True)), {self.now + timedelta(seconds=300)}
+        )
+
+        # Обработчик упал: после истечения аренды письма отправляет другой
+        self.now += timedelta(seconds=301)
+        self.assertEqual(deliver_pending(), (2, 0))
+
+    def test_command_sends_queue_and_sleeps_when_empty(self):
+        self.enqueue(3)
+        output = io.StringIO()
+        call_command('send_queued_mail', batch_size=2, stdout=output)
+        self.assertIn('Отправлено: 2, ошибок: 0', output.getvalue())
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+
+        with mock.patch('users.management.commands.send_queued_mail.time.sleep', side_effect=KeyboardInterrupt) as sleep:
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('send_queued_mail', '--loop', '--interval', '7', stdout=output)
+        sleep.assert_called_once_with(7)
+        self.assertFalse(OutgoingEmail.objects.exists())
+        self.assertEqual(len(FlakyEmailBackend.sent), 3)
+
+
+class PasswordResetOutboxTests(TestCase):
+    """
+    Проверяет, что новый пароль создается при отправке письма и не хранится в очереди.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('forgetful', 'forgetful@example.com', 'old-password')
+
+    def test_password_is_not_stored_in_outbox(self):
+        self.client.post(reverse('users:password_reset_request'), {'email': self.user.email})
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.body, email.html_body), ('', None))
+        self.assertTrue(self.client.login(username='forgetful', password='old-password'))
+        self.assertIn('body', OutgoingEmailAdmin.exclude)
+
+        self.assertEqual(deliver_pending(), (1, 0))
+        html_message = mail.outbox[0].alternatives[0][0]
+        new_password = html.unescape(html_message.split('<strong>')[1].split('</strong>')[0])
+        self.assertFalse(OutgoingEmail.objects.exists())
+        self.assertTrue(self.client.login(username='forgetful', password=new_password))
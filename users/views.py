@@ -5,11 +5,13 @@ from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout as django_logout
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.forms import PasswordChangeForm
-from django.core.mail import EmailMessage, send_mail
 from django.conf import settings
 from django.template.loader import render_to_string
 from .forms import LoginForm, RegisterForm, EditProfileForm, PasswordResetRequestForm
+from .outbox import enqueue_built_mail, enqueue_mail
 from dogs.models import Dog
+from dogs import search
+from dogs.pagination import CursorPaginationMixin
 import secrets
 import string
 from users.models import User
@@ -59,7 +61,7 @@ class UserDetailView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         user_id = self.kwargs['pk']
         context['viewed_user'] = get_object_or_404(User, pk=user_id)
-        context['dogs'] = Dog.objects.filter(owner=context['viewed_user'])
+        context['dogs'] = Dog.objects.filter(owner=context['viewed_user']).select_related('breed')  # Порода выводится в каждой карточке
         return context
 
 # --- User Authentication Views ---
@@ -131,7 +133,7 @@ class RegisterView(FormView):
 
     Методы:
         form_valid(form):  Обрабатывает успешную отправку формы, создает пользователя,
-                          отправляет письмо подтверждения и выполняет вход в систему.
+                          ставит письмо подтверждения в очередь и выполняет вход в систему.
         form_invalid(form):  Обрабатывает неверные данные формы, отображает сообщение об ошибке.
     """
     form_class = RegisterForm
@@ -156,9 +158,8 @@ class RegisterView(FormView):
             from_email = settings.DEFAULT_FROM_EMAIL
             recipient_list = [user.email]
 
-            email = EmailMessage(subject, message, from_email, recipient_list)
-            email.fail_silently = False
-            email.send()
+            # Письмо уходит в очередь и отправляется командой send_queued_mail
+            enqueue_mail(subject, message, recipient_list, from_email=from_email)
 
             messages.success(self.request, "Вы успешно зарегистрировались и вошли в систему!")
             login(self.request, user)
@@ -307,7 +308,7 @@ class UserProfileView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         context['title'] = 'Профиль пользователя'
         context['user'] = self.request.user
-        context['dogs'] = Dog.objects.filter(owner=self.request.user)
+        context['dogs'] = Dog.objects.filter(owner=self.request.user).select_related('breed')  # Порода выводится в каждой карточке
         context['is_superuser'] = self.request.user.is_superuser
         return context
 
@@ -420,6 +421,29 @@ class ChangePasswordView(LoginRequiredMixin, FormView):
 
 # --- Password Reset Views ---
 
+def build_password_reset_email(user_id):
+    """
+    Строит письмо сброса пароля при его отправке (функция сборки users.outbox).
+
+    Новый пароль создается и устанавливается здесь, непосредственно перед
+    отправкой, поэтому в очереди писем он не хранится. При повторной попытке
+    отправки пароль создается заново - действует пароль из последнего письма.
+
+    Args:
+        user_id (str): Идентификатор пользователя.
+
+    Returns:
+        tuple: (текст письма, HTML-версия письма).
+    """
+    user = User.objects.get(pk=user_id)
+    new_password = generate_random_password()
+    user.set_password(new_password)  # Hash the password
+    user.password_reset_token = None  # Очищаем токен, если он использовался
+    user.save()
+    html_message = render_to_string('users/password_reset_email.html', {'user': user, 'new_password': new_password})
+    return strip_tags(html_message), html_message
+
+
 class PasswordResetRequestView(FormView):
     """
     Представление для запроса сброса пароля.
@@ -433,8 +457,8 @@ class PasswordResetRequestView(FormView):
         success_url:  URL для перенаправления после успешного запроса сброса пароля.
 
     Методы:
-        form_valid(form):  Обрабатывает успешную отправку формы, генерирует новый пароль,
-                          отправляет письмо с новым паролем и перенаправляет пользователя.
+        form_valid(form):  Обрабатывает успешную отправку формы, ставит в очередь письмо,
+                          новый пароль для которого создается при отправке, и перенаправляет пользователя.
         form_invalid(form):  Обрабатывает неверные данные формы, отображает сообщение об ошибке.
     """
     form_class = PasswordResetRequestForm
@@ -459,23 +483,11 @@ class PasswordResetRequestView(FormView):
             messages.error(self.request, "Пользователь с таким email не найден.")
             return self.form_invalid(form)
 
-        # Generate a new random password
-        new_password = generate_random_password()
-        user.set_password(new_password)  # Hash the password
-        user.password_reset_token = None  # Очищаем токен, если он использовался
-        user.save()
-
-        # Send email with the new password
-        subject = 'Ваш новый пароль'
-        html_message = render_to_string(
-            'users/password_reset_email.html',  # Создайте новый шаблон или используйте plain text
-            {'user': user, 'new_password': new_password}
+        # Новый пароль создается при отправке письма (build_password_reset_email) и в очереди не хранится
+        enqueue_built_mail(
+            'Ваш новый пароль', 'users.views.build_password_reset_email', user.pk,
+            [user.email], from_email=settings.DEFAULT_FROM_EMAIL,
         )
-        plain_message = strip_tags(html_message)
-        from_email = settings.DEFAULT_FROM_EMAIL
-        recipient_list = [user.email]
-
-        send_mail(subject, plain_message, from_email, recipient_list, html_message=html_message)
 
         messages.success(self.request, "Новый пароль отправлен на ваш email.")
         return HttpResponseRedirect(self.success_url)  # Redirect to login
@@ -496,12 +508,13 @@ class PasswordResetRequestView(FormView):
 
 # --- User Management Views (Superuser Only) ---
 
-class UserListView(LoginRequiredMixin, ListView):
+class UserListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     """
     Представление для отображения списка пользователей (доступно только суперпользователям).
 
     Наследует:
         LoginRequiredMixin:  Обеспечивает доступ только для авторизованных пользователей.
+        CursorPaginationMixin:  Курсорная пагинация по ?paginate=cursor (без COUNT(*) и OFFSET).
         ListView:  Базовый класс для представлений, отображающих списки объектов.
 
     Атрибуты:
@@ -529,10 +542,9 @@ class UserListView(LoginRequiredMixin, ListView):
         queryset = User.objects.all()  # Get all users, including inactive
         query = self.request.GET.get('q')
         if query:
-            queryset = queryset.filter(
-                Q(username__icontains=query) | Q(email__icontains=query)
-            )
-        return queryset
+            # Поиск по индексу (dogs/search.py), найденные пользователи - по релевантности
+            return search.search('user', queryset, query).order_by('-search_rank', 'pk')
+        return queryset.order_by('pk')
 
     def get_context_data(self, **kwargs):
         """
@@ -578,7 +590,7 @@ def user_delete(request, pk):
         dogs = Dog.objects.filter(owner=user_to_delete)
         for dog in dogs:
             dog.owner = None
-            dog.save()
+            dog.save(update_fields=['owner', 'updated_at'])
 
         # Physically delete the user:
         user_to_delete.delete()
@@ -669,5 +681,5 @@ class UserDetailView(LoginRequiredMixin, TemplateView):
         user_id = self.kwargs['pk']
         user = get_object_or_404(User, pk=user_id)
         context['viewed_user'] = user
-        context['dogs'] = Dog.objects.filter(owner=user)
+        context['dogs'] = Dog.objects.filter(owner=user).select_related('breed')  # Порода выводится в каждой карточке
         return context
\ No newline at end of file
@@ -2,12 +2,11 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
 from django.conf import settings
 from .forms import PasswordResetRequestForm
+from .outbox import enqueue_built_mail
 import secrets
 import string
-from django.utils.html import format_html
 
 User = get_user_model()
 
@@ -29,8 +28,9 @@ def password_reset_request(request):
     """
     Представление для запроса сброса пароля.
 
-    Обрабатывает отправку формы PasswordResetRequestForm, генерирует новый пароль,
-    отправляет его пользователю по электронной почте и перенаправляет на страницу входа.
+    Обрабатывает отправку формы PasswordResetRequestForm, ставит в очередь письмо,
+    новый пароль для которого создается при отправке (users.views.build_password_reset_email),
+    и перенаправляет на страницу входа.
 
     Args:
         request: Объект запроса.
@@ -49,21 +49,11 @@ def password_reset_request(request):
                 messages.error(request, "Пользователь с таким email не найден.")
                 return render(request, 'users/password_reset_request.html', {'form': form})
 
-            new_password = generate_random_password()
-            user.set_password(new_password)
-            user.save()
-
-            subject = "Ваш новый пароль"
-            message = format_html(
-                "<p>Здравствуйте, {}!</p>"
-                "<p>Ваш пароль был сброшен. Ваш новый пароль: <strong>{}</strong></p>"
-                "<p>Пожалуйста, смените пароль после входа в систему.</p>",
-                user.username,
-                new_password
+            # Пароль в очереди не хранится: он создается при отправке письма
+            enqueue_built_mail(
+                "Ваш новый пароль", 'users.views.build_password_reset_email', user.pk,
+                [user.email], from_email=settings.DEFAULT_FROM_EMAIL,
             )
-            from_email = settings.DEFAULT_FROM_EMAIL
-            recipient_list = [user.email]
-            send_mail(subject, message, from_email, recipient_list, fail_silently=False) # Добавил fail_silently
 
             messages.success(request, "Новый пароль отправлен на ваш email.")
             return redirect('users:user_login')  # Перенаправляем на страницу входа